@@ -0,0 +1,175 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Catalog-wide sales analytics for the Reports window. Each report reads its date range (and the
+# equal-length period before it) in two queries: product-days from the ProductDailySales rollup
+# and sale timestamps from Sales. The rows become NumPy columns, and every figure below is a
+# vectorised group-by over them (np.unique + np.bincount), so a year of a 20k-product catalog
+# takes milliseconds rather than a Python loop per row.
+#
+# Finished reports are cached per period in a small LRU; a period that includes today is only
+# reused for `live_ttl` seconds so new sales show up.
+
+ABC_THRESHOLDS = (0.80, 0.95)  # cumulative revenue share closing the A and B classes
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+class SalesAnalytics:
+    def __init__(self, get_connection, cache_size=8, live_ttl=300):
+        self._get_connection = get_connection
+        self.cache_size = cache_size
+        self.live_ttl = live_ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (days, end) -> (computed at, report)
+
+    def report(self, days, stock=None, today=None, top=20):
+        """
+        Everything the report tabs show for the last `days` days up to today. `stock` maps
+        product_id -> units on hand (e.g. from the catalog) and enables the slow-mover list.
+        """
+        today = today or datetime.date.today()
+        end = today + datetime.timedelta(days=1)
+        key = (days, end)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and (end <= datetime.date.today() or time.monotonic() - cached[0] < self.live_ttl):
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        start = end - datetime.timedelta(days=days)
+        previous_start = start - datetime.timedelta(days=days)
+        daily = self._product_days(previous_start, end)
+        stamps, amounts = self._sale_times(start, end)
+
+        current = daily['day'] >= np.datetime64(start)
+        now, before = _by_product(daily, current), _by_product(daily, ~current)
+        result = {
+            'start': start, 'end': end, 'days': days,
+            'totals': {'units': int(now['units'].sum()), 'revenue': float(now['revenue'].sum()),
+                       'sales': int(len(stamps)), 'products_sold': int((now['units'] > 0).sum())},
+            'top': top_sellers(now, top),
+            'abc': abc_classes(now),
+            'slow': slow_movers(now, stock, top) if stock is not None else [],
+            'heatmap': heatmap(stamps, amounts),
+            'comparison': compare(now, before, top),
+        }
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _product_days(self, start, end):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT product_id, sale_day, units, revenue FROM ProductDailySales "
+                           "WHERE sale_day >= %s AND sale_day < %s", (start.isoformat(), end.isoformat()))
+            rows = cursor.fetchall()
+            cursor.close()
+        ids, days, units, revenue = zip(*rows) if rows else ((), (), (), ())
+        return {'product_id': np.array(ids, dtype=np.int64),
+                'day': np.array(days, dtype='datetime64[D]'),
+                'units': np.array(units, dtype=np.int64),
+                'revenue': np.array(revenue, dtype=np.float64)}
+
+    def _sale_times(self, start, end):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT sale_date, total_amount FROM Sales WHERE sale_date >= %s AND sale_date < %s",
+                           (start.isoformat(), end.isoformat()))
+            rows = cursor.fetchall()
+            cursor.close()
+        stamps, amounts = zip(*rows) if rows else ((), ())
+        return np.array(stamps, dtype='datetime64[s]'), np.array(amounts, dtype=np.float64)
+
+
+# --- Computations on the columns ---
+def _by_product(daily, mask):
+    """Units and revenue per product for the rows selected by `mask`."""
+    ids, index = np.unique(daily['product_id'][mask], return_inverse=True)
+    return {'product_id': ids,
+            'units': np.bincount(index, weights=daily['units'][mask], minlength=len(ids)).astype(np.int64),
+            'revenue': np.bincount(index, weights=daily['revenue'][mask], minlength=len(ids))}
+
+
+def top_sellers(totals, n=20):
+    """The n products with the most revenue: [(product_id, units, revenue, share of revenue)]."""
+    order = np.argsort(-totals['revenue'], kind='stable')[:n]
+    overall = totals['revenue'].sum() or 1.0
+    return [(int(totals['product_id'][i]), int(totals['units'][i]), float(totals['revenue'][i]),
+             float(totals['revenue'][i] / overall)) for i in order]
+
+
+def abc_classes(totals, thresholds=ABC_THRESHOLDS):
+    """
+    Pareto classes by revenue: A products make up the first 80% of revenue, B the next 15%, C the
+    rest. Returns {'summary': [(class, products, revenue share)],
+    'rows': [(product_id, class, revenue, cumulative share)] best seller first}.
+    """
+    order = np.argsort(-totals['revenue'], kind='stable')
+    revenue = totals['revenue'][order]
+    overall = revenue.sum()
+    if not overall:
+        return {'summary': [], 'rows': []}
+    # A product is in the class where its revenue starts, so the one crossing 80% is still an A
+    cumulative = np.cumsum(revenue) / overall
+    starts = cumulative - revenue / overall
+    labels = np.where(starts < thresholds[0], 'A', np.where(starts < thresholds[1], 'B', 'C'))
+    summary = [(label, int((labels == label).sum()), float(revenue[labels == label].sum() / overall))
+               for label in "ABC"]
+    rows = list(zip(totals['product_id'][order].tolist(), labels.tolist(), revenue.tolist(), cumulative.tolist()))
+    return {'summary': summary, 'rows': rows}
+
+
+def slow_movers(totals, stock, n=20):
+    """In-stock products that sold least in the period: [(product_id, units sold, stock on hand)]."""
+    ids = np.fromiter(stock.keys(), dtype=np.int64, count=len(stock))
+    on_hand = np.fromiter(stock.values(), dtype=np.int64, count=len(stock))
+    in_stock = on_hand > 0
+    ids, on_hand = ids[in_stock], on_hand[in_stock]
+    # Units sold for every stocked product (totals are sorted by id), zero where it did not sell at all
+    sold = np.zeros(len(ids), dtype=np.int64)
+    if len(totals['product_id']):
+        position = np.minimum(np.searchsorted(totals['product_id'], ids), len(totals['product_id']) - 1)
+        hit = totals['product_id'][position] == ids
+        sold[hit] = totals['units'][position[hit]]
+    order = np.lexsort((-on_hand, sold))[:n]  # fewest sold first, most stock tied up first
+    return [(int(ids[i]), int(sold[i]), int(on_hand[i])) for i in order]
+
+
+def heatmap(stamps, amounts):
+    """Sales count and revenue by weekday (rows, Monday first) and hour of day (columns), as nested lists."""
+    days = stamps.astype('datetime64[D]')
+    hours = ((stamps - days) // np.timedelta64(1, 'h')).astype(np.int64)
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    cells = weekdays * 24 + hours
+    return {'counts': np.bincount(cells, minlength=7 * 24).reshape(7, 24).tolist(),
+            'revenue': np.bincount(cells, weights=amounts, minlength=7 * 24).reshape(7, 24).tolist()}
+
+
+def compare(now, before, n=20):
+    """
+    This period against the previous one of the same length: overall change plus the products whose
+    revenue rose and fell most, as [(product_id, revenue now, revenue before, change)].
+    """
+    ids = np.union1d(now['product_id'], before['product_id'])
+    current = np.zeros(len(ids))
+    previous = np.zeros(len(ids))
+    current[np.searchsorted(ids, now['product_id'])] = now['revenue']
+    previous[np.searchsorted(ids, before['product_id'])] = before['revenue']
+    change = current - previous
+    rows = lambda order: [(int(ids[i]), float(current[i]), float(previous[i]), float(change[i])) for i in order]
+    total_now, total_before = float(current.sum()), float(previous.sum())
+    return {'revenue': total_now, 'previous_revenue': total_before,
+            'change_pct': (total_now - total_before) / total_before * 100 if total_before else None,
+            'risers': rows([i for i in np.argsort(-change, kind='stable')[:n] if change[i] > 0]),
+            'fallers': rows([i for i in np.argsort(change, kind='stable')[:n] if change[i] < 0])}
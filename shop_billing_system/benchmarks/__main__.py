@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from db_pool import ConnectionPool
+from storage import create_backend, SQLiteBackend
+from benchmarks import datagen, harness, scenarios
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Generate a synthetic store and time the app's real operations without the UI.")
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--db", help="SQLite file (default: a fresh temporary file)")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="")
+    parser.add_argument("--mysql-database", default="society_store_bench",
+                        help="never point this at the live database: the benchmark writes sales")
+    parser.add_argument("--skip-generate", action="store_true", help="reuse an already generated database")
+
+    data = parser.add_argument_group("synthetic data")
+    data.add_argument("--products", type=int, default=2000)
+    data.add_argument("--flats", type=int, default=200)
+    data.add_argument("--years", type=float, default=1.0)
+    data.add_argument("--sales-per-day", type=int, default=200)
+    data.add_argument("--seed", type=int, default=42)
+
+    run = parser.add_argument_group("run")
+    run.add_argument("--scale", type=float, default=1.0, help="multiplies every scenario's iteration count")
+    run.add_argument("--only", nargs="+", metavar="SCENARIO", help="run only these scenarios")
+    run.add_argument("--pool-size", type=int, default=5)
+    run.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    run.add_argument("--compare", metavar="RESULTS.json", help="show changes against an earlier run")
+    return parser.parse_args(argv)
+
+
+def make_backend(args):
+    if args.backend == "mysql":
+        return create_backend("mysql", mysql_config={
+            'host': args.mysql_host, 'user': args.mysql_user,
+            'password': args.mysql_password, 'database': args.mysql_database,
+        })
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-store-"), "store.db")
+    return SQLiteBackend(path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend = make_backend(args)
+    print(f"Benchmark database: {backend.describe()}")
+    backend.setup()
+
+    pool = ConnectionPool(backend.connect, size=args.pool_size, is_alive=backend.is_alive, reset=backend.reset)
+    try:
+        dataset = None
+        if not args.skip_generate:
+            print("Generating synthetic store...")
+            with pool.acquire() as conn:
+                dataset = datagen.generate(conn, products=args.products, flats=args.flats,
+                                           days=int(args.years * 365), sales_per_day=args.sales_per_day,
+                                           seed=args.seed)
+
+        print("Running scenarios...")
+        results = scenarios.run_all(pool, iterations=args.scale, only=args.only)
+        pool_stats = pool.stats()
+    finally:
+        pool.close()
+
+    meta = harness.environment()
+    meta.update({'backend': backend.name, 'dataset': dataset or "existing", 'scale': args.scale,
+                 'pool_wait_avg_ms': round(pool_stats['wait_time_avg'] * 1000, 3)})
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    harness.save(output, meta, results)
+
+    baseline = harness.load(args.compare)['results'] if args.compare else None
+    print()
+    print(harness.format_table(results, baseline))
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from db_pool import ConnectionPool, PoolTimeoutError
+from sales import InsufficientStockError, commit_sale_with_retry
+from storage import create_backend, SQLiteBackend
+from benchmarks.harness import summarize
+
+# Several checkout lanes selling from a small set of scarce products at once, each through the same
+# guarded commit the counters use. Afterwards every product must satisfy
+#   starting stock - units sold == stock left >= 0
+# and the daily rollup must agree with SaleItems; any difference is an oversell and fails the run.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.contention",
+                                     description="Prove that concurrent checkout lanes never oversell.")
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--db", help="SQLite file (default: a fresh temporary file)")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="")
+    parser.add_argument("--mysql-database", default="society_store_bench",
+                        help="never point this at the live database: the run writes sales")
+    parser.add_argument("--lanes", type=int, default=6, help="concurrent checkout lanes (threads)")
+    parser.add_argument("--products", type=int, default=10, help="size of the contended product set")
+    parser.add_argument("--stock", type=int, default=40, help="starting stock of each contended product")
+    parser.add_argument("--max-lines", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=500, help="sales attempted per lane")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def make_backend(args):
+    if args.backend == "mysql":
+        return create_backend("mysql", mysql_config={
+            'host': args.mysql_host, 'user': args.mysql_user,
+            'password': args.mysql_password, 'database': args.mysql_database,
+        })
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-contention-"), "store.db")
+    return SQLiteBackend(path)
+
+
+def seed_products(pool, count, stock):
+    """Inserts the contended products and returns {product_id: (price, starting stock)}."""
+    tag = uuid.uuid4().hex[:8]
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO Products (barcode, name, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                           [(f"C{tag}{i:04d}", f"Contended item {tag}-{i}", Decimal('10.00'), stock)
+                            for i in range(count)])
+        cursor.execute("SELECT product_id, price FROM Products WHERE barcode LIKE %s", (f"C{tag}%",))
+        products = {pid: (Decimal(str(price)), stock) for pid, price in cursor.fetchall()}
+        conn.commit()
+        cursor.close()
+    return products
+
+
+def run_lane(pool, backend, products, attempts, max_lines, rng, tally, lock):
+    ids = list(products)
+    local = {'sold': 0, 'short': 0, 'failed': 0, 'latencies': []}
+    for _ in range(attempts):
+        basket = [(pid, rng.randint(1, 3), products[pid][0])
+                  for pid in rng.sample(ids, rng.randint(1, min(max_lines, len(ids))))]
+        total = sum(qty * price for _, qty, price in basket)
+        started = time.perf_counter()
+        try:
+            commit_sale_with_retry(pool.acquire, lambda err: isinstance(err, PoolTimeoutError) or backend.is_transient(err),
+                                   basket, total, Decimal('0.00'), 'Cash', client_ref=uuid.uuid4().hex)
+            local['sold'] += 1
+        except InsufficientStockError:
+            local['short'] += 1
+        except Exception as err:
+            local['failed'] += 1
+            local.setdefault('errors', []).append(repr(err))
+        local['latencies'].append(time.perf_counter() - started)
+    with lock:
+        for key in ('sold', 'short', 'failed'):
+            tally[key] += local[key]
+        tally['latencies'].extend(local['latencies'])
+        tally['errors'].extend(local.get('errors', [])[:3])
+
+
+def verify(pool, products):
+    """Returns a list of problems; empty means stock, SaleItems and the rollup all agree."""
+    ids = list(products)
+    marks = ", ".join(["%s"] * len(ids))
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT product_id, stock_quantity FROM Products WHERE product_id IN ({marks})", ids)
+        stock = dict(cursor.fetchall())
+        cursor.execute(f"SELECT product_id, SUM(quantity_sold) FROM SaleItems WHERE product_id IN ({marks}) "
+                       f"GROUP BY product_id", ids)
+        sold = {pid: int(units) for pid, units in cursor.fetchall()}
+        cursor.execute(f"SELECT product_id, SUM(units) FROM ProductDailySales WHERE product_id IN ({marks}) "
+                       f"GROUP BY product_id", ids)
+        rolled = {pid: int(units) for pid, units in cursor.fetchall()}
+        conn.rollback()
+        cursor.close()
+
+    problems = []
+    for pid, (_, start) in products.items():
+        left, units = stock[pid], sold.get(pid, 0)
+        if left < 0:
+            problems.append(f"product {pid}: stock went negative ({left})")
+        if start - units != left:
+            problems.append(f"product {pid}: started {start}, sold {units}, but {left} left")
+        if rolled.get(pid, 0) != units:
+            problems.append(f"product {pid}: rollup has {rolled.get(pid, 0)} units, SaleItems {units}")
+    return problems, sum(sold.values()), sum(stock.values())
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend = make_backend(args)
+    print(f"Contention database: {backend.describe()}")
+    backend.setup()
+
+    # One connection per lane, so lanes contend for rows rather than for the pool
+    pool = ConnectionPool(backend.connect, size=args.lanes, timeout=30, is_alive=backend.is_alive,
+                          reset=backend.reset)
+    try:
+        products = seed_products(pool, args.products, args.stock)
+        tally = {'sold': 0, 'short': 0, 'failed': 0, 'latencies': [], 'errors': []}
+        lock = threading.Lock()
+        lanes = [threading.Thread(target=run_lane, name=f"lane-{i}",
+                                  args=(pool, backend, products, args.attempts, args.max_lines,
+                                        random.Random(args.seed + i), tally, lock))
+                 for i in range(args.lanes)]
+        started = time.perf_counter()
+        for lane in lanes:
+            lane.start()
+        for lane in lanes:
+            lane.join()
+        elapsed = time.perf_counter() - started
+        problems, units_sold, units_left = verify(pool, products)
+    finally:
+        pool.close()
+
+    latency = summarize(tally['latencies'], elapsed)
+    print(f"{args.lanes} lanes, {args.products} products x {args.stock} units, {elapsed:.1f} s")
+    print(f"  sales committed: {tally['sold']}, refused for stock: {tally['short']}, failed: {tally['failed']}")
+    print(f"  units sold: {units_sold}, units left: {units_left} (of {args.products * args.stock})")
+    print(f"  checkout p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms, {tally['sold'] / elapsed:.0f} sales/s")
+    for error in tally['errors']:
+        print(f"  error: {error}")
+    if problems:
+        print("OVERSOLD:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    if tally['failed'] or not tally['sold']:
+        # Sales that errored never reached the stock check, so the run proves nothing about oversell
+        print(f"INCONCLUSIVE: {tally['failed']} sales failed, {tally['sold']} committed.")
+        return 1
+    print("No oversell: stock, sale items and rollup agree.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+import ledger
+import rollup
+from storage import dialect_of
+
+# Synthetic store: a catalog of branded grocery items, a housing society's flats and a history
+# of daily sales whose product mix follows a long-tail (Zipf-like) popularity curve.
+
+BRANDS = ["Amul", "Tata", "Parle", "Britannia", "Nestle", "Haldiram", "Dabur", "Patanjali", "Aashirvaad",
+          "Fortune", "MDH", "Everest", "Cadbury", "Kissan", "Maggi", "Lays", "Bingo", "Surf", "Vim", "Colgate",
+          "Dettol", "Lifebuoy", "Horlicks", "Bournvita", "Saffola", "Catch", "Mother Dairy", "Sunfeast"]
+ITEMS = ["Milk", "Butter", "Cheese Slices", "Paneer", "Curd", "Ghee", "Tea", "Coffee", "Salt", "Sugar",
+         "Atta", "Basmati Rice", "Toor Dal", "Moong Dal", "Chana", "Besan", "Poha", "Biscuits", "Cookies",
+         "Rusk", "Bread", "Namkeen", "Bhujia", "Chips", "Noodles", "Ketchup", "Jam", "Honey", "Chyawanprash",
+         "Sunflower Oil", "Mustard Oil", "Garam Masala", "Turmeric", "Chilli Powder", "Detergent",
+         "Dishwash Bar", "Toothpaste", "Soap", "Handwash", "Shampoo", "Chocolate", "Corn Flakes", "Oats"]
+SIZES = ["50g", "100g", "200g", "250g", "500g", "1kg", "2kg", "5kg", "200ml", "500ml", "1L", "Pack of 4"]
+FIRST_NAMES = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Sneha", "Arjun", "Kavya", "Rahul", "Meera",
+               "Sanjay", "Pooja", "Amit", "Neha", "Karan", "Divya", "Suresh", "Lakshmi", "Nikhil", "Isha"]
+LAST_NAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Nair", "Gupta", "Patel", "Mehta", "Kulkarni", "Das",
+              "Singh", "Joshi", "Rao", "Menon", "Chopra", "Bose", "Pillai", "Shah", "Kapoor", "Agarwal"]
+
+GST_RATE = Decimal('0.18')
+CHUNK = 2000  # sales per executemany batch
+
+
+def generate(conn, products=2000, flats=200, days=365, sales_per_day=200, max_lines=8, seed=42, log=print):
+    """
+    Fills an empty, migrated database with a synthetic store. Returns a dict of row counts.
+
+    Sales are spread over the last `days` days between 8:00 and 22:00; each has 1..max_lines lines
+    drawn with a long-tail popularity, a fifth of them on flat credit. The daily rollup and the
+    flat ledger (a charge per credit sale, most months settled in the following one, and the
+    month-start balance snapshots) are derived from the generated sales at the end.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM Sales")
+        if cursor.fetchone()[0]:
+            raise RuntimeError("The benchmark database already has sales; use a fresh database.")
+
+        catalog = _insert_products(cursor, rng, products)
+        flat_ids = _insert_flats(cursor, rng, flats)
+        conn.commit()
+        log(f"  {len(catalog)} products, {len(flat_ids)} flats")
+
+        sale_count, item_count = _insert_sales(conn, cursor, rng, catalog, flat_ids, days, sales_per_day,
+                                               max_lines, log)
+
+        log("  building the daily rollup and flat ledger...")
+        cursor.execute("DELETE FROM ProductDailySales")
+        rollup.fill(cursor)
+        payment_count = _insert_ledger(cursor, rng, dialect_of(conn))
+        conn.commit()
+    finally:
+        cursor.close()
+
+    log(f"  done in {time.perf_counter() - started:.1f} s")
+    return {'products': len(catalog), 'flats': len(flat_ids), 'sales': sale_count, 'sale_items': item_count,
+            'payments': payment_count}
+
+
+def _insert_ledger(cursor, rng, dialect):
+    """Charges from the credit sales, monthly payments for most of them and a snapshot per month."""
+    cursor.execute("DELETE FROM FlatBalanceSnapshots")
+    cursor.execute("DELETE FROM FlatLedger")
+    ledger.charge_credit_sales(cursor)
+
+    cursor.execute("SELECT flat_id, sale_date, total_amount FROM Sales WHERE payment_method = 'Credit'")
+    monthly = {}  # (flat_id, month start) -> charges
+    for flat_id, sale_date, total in cursor.fetchall():
+        month = ledger.month_start(datetime.date.fromisoformat(str(sale_date)[:10]))
+        monthly[(flat_id, month)] = monthly.get((flat_id, month), Decimal('0.00')) + Decimal(str(total))
+
+    # Most flats settle a month's purchases between the 3rd and the 15th of the next one
+    now = datetime.datetime.now()
+    payments = []
+    for (flat_id, month), total in monthly.items():
+        paid_on = datetime.datetime.combine(ledger.month_start(month + datetime.timedelta(days=32)),
+                                            datetime.time(10)) + datetime.timedelta(days=rng.randint(2, 14))
+        if paid_on < now and rng.random() < 0.85:
+            payments.append((flat_id, paid_on.strftime("%Y-%m-%d %H:%M:%S"), ledger.PAYMENT, -total))
+    cursor.executemany("INSERT INTO FlatLedger (flat_id, entry_date, kind, amount) VALUES (%s, %s, %s, %s)",
+                       payments)
+
+    months = sorted({month for _, month in monthly})
+    if months:
+        month = months[0]
+        while month <= ledger.due_snapshot():
+            ledger.take_snapshot(cursor, dialect, month)
+            month = ledger.month_start(month + datetime.timedelta(days=32))
+    return len(payments)
+
+
+def _insert_products(cursor, rng, count):
+    names = set()
+    while len(names) < count:
+        name = f"{rng.choice(BRANDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)}"
+        if name in names:
+            name = f"{name} ({len(names)})"
+        names.add(name)
+
+    rows = []
+    for i, name in enumerate(sorted(names)):
+        barcode = f"890{1000000000 + i}"
+        price = Decimal(rng.randint(500, 50000)) / 100
+        rows.append((barcode, name, price, rng.randint(200, 2000)))
+    cursor.executemany("INSERT INTO Products (barcode, name, price, stock_quantity) VALUES (%s, %s, %s, %s)", rows)
+
+    cursor.execute("SELECT product_id, price FROM Products")
+    return [(pid, Decimal(str(price))) for pid, price in cursor.fetchall()]
+
+
+def _insert_flats(cursor, rng, count):
+    cursor.execute("SELECT flat_number FROM Flats")
+    existing = {row[0] for row in cursor.fetchall()}
+    rows = []
+    blocks = "ABCDEFGHJK"
+    i = 0
+    while len(existing) < count:
+        number = f"{blocks[i // 400 % len(blocks)]}-{(i // 4) % 100 + 1:02d}{i % 4 + 1}"
+        i += 1
+        if number in existing:
+            continue
+        existing.add(number)
+        rows.append((number, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"))
+    cursor.executemany("INSERT INTO Flats (flat_number, resident_name) VALUES (%s, %s)", rows)
+
+    cursor.execute("SELECT flat_id FROM Flats")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _insert_sales(conn, cursor, rng, catalog, flat_ids, days, sales_per_day, max_lines, log):
+    # Zipf-like weights: the product at popularity rank r sells about 1/r as often as the top one
+    ranked = catalog[:]
+    rng.shuffle(ranked)
+    weights = [1.0 / (rank + 1) for rank in range(len(ranked))]
+
+    cursor.execute("SELECT COALESCE(MAX(sale_id), 0) FROM Sales")
+    sale_id = first_id = cursor.fetchone()[0]
+    sales, items = [], []
+    sale_count = item_count = 0
+    today = datetime.date.today()
+
+    for day_offset in range(days, 0, -1):
+        day = today - datetime.timedelta(days=day_offset)
+        for _ in range(max(1, int(sales_per_day * rng.uniform(0.7, 1.3)))):
+            sale_id += 1
+            picked = {}
+            for pid, price in rng.choices(ranked, weights, k=rng.randint(1, max_lines)):
+                picked[pid] = (picked.get(pid, (0, price))[0] + rng.randint(1, 3), price)
+            subtotal = sum(price * qty for qty, price in picked.values())
+            gst = (subtotal * GST_RATE).quantize(Decimal('0.01'))
+            credit = rng.random() < 0.2
+            stamp = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(seconds=rng.randint(0, 14 * 3600))
+            sales.append((sale_id, stamp.strftime("%Y-%m-%d %H:%M:%S"), subtotal + gst, gst,
+                          'Credit' if credit else rng.choice(['Cash', 'UPI']),
+                          rng.choice(flat_ids) if credit else None))
+            items.extend((sale_id, pid, qty, price) for pid, (qty, price) in picked.items())
+
+            if len(sales) >= CHUNK:
+                sale_count, item_count = _flush(conn, cursor, sales, items, sale_count, item_count)
+        if day_offset % 30 == 0:
+            log(f"  {day.isoformat()}: {sale_id - first_id} sales so far")
+
+    return _flush(conn, cursor, sales, items, sale_count, item_count)
+
+
+def _flush(conn, cursor, sales, items, sale_count, item_count):
+    if sales:
+        cursor.executemany("INSERT INTO Sales (sale_id, sale_date, total_amount, gst_amount, payment_method, flat_id) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)", sales)
+        cursor.executemany("INSERT INTO SaleItems (sale_id, product_id, quantity_sold, price_at_sale) "
+                           "VALUES (%s, %s, %s, %s)", items)
+        conn.commit()
+    sale_count += len(sales)
+    item_count += len(items)
+    sales.clear()
+    items.clear()
+    return sale_count, item_count
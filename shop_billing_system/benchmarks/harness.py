@@ -0,0 +1,92 @@
+import json
+import platform
+import subprocess
+import time
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms) and throughput for a list of per-operation durations (seconds)."""
+    ordered = sorted(samples)
+    ms = lambda secs: round(secs * 1000, 3)
+    return {
+        'n': len(ordered),
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else 0.0,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        'ops_per_sec': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def measure(operation, iterations, setup=None, warmup=3):
+    """
+    Runs operation(state) `iterations` times and returns summarize() of the timings.
+    `setup()`, if given, runs untimed before every call and its result is passed as `state`.
+    """
+    for _ in range(min(warmup, iterations)):
+        operation(setup() if setup else None)
+
+    samples = []
+    elapsed = 0.0
+    for _ in range(iterations):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        operation(state)
+        duration = time.perf_counter() - start
+        samples.append(duration)
+        elapsed += duration
+    return summarize(samples, elapsed)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def save(path, meta, results):
+    with open(path, "w") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, default=str)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_table(results, baseline=None):
+    """Text table of the results; with a baseline, p50/p95 changes are shown as percentages."""
+    header = f"{'operation':<24}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>11}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        line = f"{name:<24}{r['n']:>7}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['ops_per_sec']:>11.1f}"
+        before = baseline.get(name) if baseline else None
+        if before:
+            line += f"{_change(before['p50_ms'], r['p50_ms']):>9}{_change(before['p95_ms'], r['p95_ms']):>9}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.0f}%"
@@ -0,0 +1,139 @@
+import os
+import random
+import re
+import tempfile
+from decimal import Decimal
+
+import sales
+from cart import Cart, to_paise, to_rupees
+from catalog import ProductCatalog, FlatDirectory
+from journal import SaleJournal
+from repositories import FlatRepository, SaleRepository
+from benchmarks.harness import measure
+
+# Each scenario times one real code path of the app against the benchmark database, through the
+# same classes the windows use (catalog, cart, journal, sales, repositories) but without Tk.
+
+
+def run_all(pool, iterations=1.0, only=None, seed=7, log=print):
+    """
+    Runs every scenario (or those named in `only`) and returns {name: summary}.
+    `iterations` scales the default iteration counts, e.g. 0.1 for a quick smoke run.
+    """
+    rng = random.Random(seed)
+    catalog = ProductCatalog(pool.acquire)
+    catalog.load()
+    products = catalog.all_products()
+    flats = FlatDirectory(pool.acquire)
+    flats.load()
+    context = {'pool': pool, 'rng': rng, 'catalog': catalog, 'products': products, 'flats': flats.all()}
+
+    results = {}
+    for name, fn, count in SCENARIOS:
+        if only and name not in only:
+            continue
+        n = max(1, int(count * iterations))
+        log(f"  {name} x{n}...")
+        results[name] = fn(context, n)
+    return results
+
+
+def catalog_load(ctx, n):
+    catalog = ProductCatalog(ctx['pool'].acquire)
+    return measure(lambda _: catalog.load(), n, warmup=1)
+
+
+def catalog_refresh(ctx, n):
+    # The common case: nothing changed since the last check
+    return measure(lambda _: ctx['catalog'].refresh(), n)
+
+
+def name_search(ctx, n):
+    rng, products = ctx['rng'], ctx['products']
+
+    def query():
+        words = re.findall(r"\w+", rng.choice(products)['name'])
+        word = rng.choice(words)
+        return word[:rng.randint(3, max(3, len(word)))]
+
+    return measure(lambda q: ctx['catalog'].search(q, limit=8, in_stock_only=True), n, setup=query)
+
+
+def barcode_lookup(ctx, n):
+    rng, products = ctx['rng'], ctx['products']
+    codes = [p['barcode'] for p in products if p['barcode']]
+    return measure(lambda code: ctx['catalog'].find_by_barcode(code, fallback=False), n,
+                   setup=lambda: rng.choice(codes))
+
+
+def cart_add(ctx, n):
+    rng, products = ctx['rng'], ctx['products']
+    cart = Cart()
+
+    def add(product):
+        if len(cart) >= 30:
+            cart.clear()
+        cart.add(product['product_id'], product['name'], to_paise(product['price']))
+
+    return measure(add, n, setup=lambda: rng.choice(products))
+
+
+def _random_basket(ctx):
+    rng = ctx['rng']
+    cart = Cart()
+    for product in rng.sample(ctx['products'], rng.randint(1, 8)):
+        cart.add(product['product_id'], product['name'], to_paise(product['price']), rng.randint(1, 2))
+    lines = [(line.product_id, line.quantity, to_rupees(line.unit_price)) for line in cart]
+    return lines, to_rupees(cart.total), to_rupees(cart.gst)
+
+
+def journal_append(ctx, n):
+    # What the cashier waits for at checkout: the fsync'd local journal write
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-journal-"), "journal.db")
+    journal = SaleJournal(path)
+    try:
+        return measure(lambda basket: journal.append(*basket, 'Cash'), n, setup=lambda: _random_basket(ctx))
+    finally:
+        journal.close()
+
+
+def sale_commit(ctx, n):
+    # The database side of a sale: stock guard, items, rollup and commit
+    pool = ctx['pool']
+
+    def commit(basket):
+        lines, total, gst = basket
+        with pool.acquire() as conn:
+            sales.commit_sale(conn, lines, total, gst, 'Cash', enforce_stock=False)
+
+    return measure(commit, n, setup=lambda: _random_basket(ctx))
+
+
+def flat_payment(ctx, n):
+    rng, flats = ctx['rng'], ctx['flats']
+    repo = FlatRepository(ctx['pool'].acquire)
+    return measure(lambda flat: repo.record_payment(flat['flat_id'], Decimal('1.00')), n,
+                   setup=lambda: rng.choice(flats))
+
+
+def product_report(days):
+    def scenario(ctx, n):
+        rng, products = ctx['rng'], ctx['products']
+        repo = SaleRepository(ctx['pool'].acquire)
+        return measure(lambda product: repo.product_daily_sales(product['product_id'], days), n,
+                       setup=lambda: rng.choice(products))
+    return scenario
+
+
+SCENARIOS = [
+    ("catalog_load", catalog_load, 10),
+    ("catalog_refresh", catalog_refresh, 500),
+    ("name_search", name_search, 2000),
+    ("barcode_lookup", barcode_lookup, 5000),
+    ("cart_add", cart_add, 20000),
+    ("journal_append", journal_append, 200),
+    ("sale_commit", sale_commit, 300),
+    ("flat_payment", flat_payment, 300),
+    ("report_30d", product_report(30), 300),
+    ("report_365d", product_report(365), 100),
+]
@@ -0,0 +1,208 @@
+import csv
+import datetime
+import html
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import ledger
+
+# Month-end credit billing: one statement per flat for a closed calendar month, plus a summary
+# of every flat's opening balance, charges, payments and closing balance. The figures come from
+# a handful of set-based queries over the flat ledger (opening balances from the latest snapshot,
+# one GROUP BY for the month's totals, one ordered read of the month's entries), not a query per
+# flat. The statements are rendered to HTML (print to PDF from the browser) by a process pool,
+# a batch of flats per task.
+#
+# A run is resumable: each statement is written to a temporary file and renamed into place, and
+# flats whose statement already exists are skipped, so an interrupted run picks up where it
+# stopped. Entries are never back-dated (see ledger.py), so a closed month's figures do not change
+# between runs.
+
+SUMMARY_COLUMNS = ['flat_id', 'flat_number', 'resident_name', 'opening', 'charges', 'payments',
+                   'adjustments', 'closing', 'statement']
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+_CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(_CENT)
+
+
+class BillingReport:
+    __slots__ = ('flats', 'billed', 'written', 'skipped', 'summary_path', 'directory')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.flats = 0         # flats in the society
+        self.billed = 0        # flats with a balance or activity, i.e. a statement
+        self.written = 0       # statements written by this run
+        self.skipped = 0       # statements already written by an earlier run
+        self.summary_path = None
+
+    def describe(self):
+        return (f"{self.billed} of {self.flats} flats billed: {self.written} statements written, "
+                f"{self.skipped} already done")
+
+
+def previous_month(today=None):
+    """(first day, first day of the next month) of the last complete calendar month."""
+    end = ledger.month_start(today)
+    return ledger.month_start(end - datetime.timedelta(days=1)), end
+
+
+def month_bounds(first_day):
+    return first_day, (first_day + datetime.timedelta(days=32)).replace(day=1)
+
+
+def month_totals(cursor, start, end):
+    """
+    One row per flat: {'flat_id', 'flat_number', 'resident_name', 'opening', 'charges', 'payments',
+    'adjustments', 'closing'} for entries dated in [start, end). Payments are positive here.
+    """
+    opening = ledger.balances(cursor, as_of=start)
+    cursor.execute("""
+        SELECT flat_id,
+               SUM(CASE WHEN kind = %s THEN amount ELSE 0 END),
+               SUM(CASE WHEN kind = %s THEN amount ELSE 0 END),
+               SUM(CASE WHEN kind NOT IN (%s, %s) THEN amount ELSE 0 END)
+        FROM FlatLedger
+        WHERE entry_date >= %s AND entry_date < %s
+        GROUP BY flat_id
+    """, (ledger.CHARGE, ledger.PAYMENT, ledger.CHARGE, ledger.PAYMENT, start.isoformat(), end.isoformat()))
+    period = {flat_id: (_money(charges), -_money(payments), _money(other))
+              for flat_id, charges, payments, other in cursor.fetchall()}
+
+    zero = Decimal('0.00')
+    cursor.execute("SELECT flat_id, flat_number, resident_name FROM Flats ORDER BY flat_id")
+    rows = []
+    for flat_id, flat_number, resident_name in cursor.fetchall():
+        charges, payments, adjustments = period.get(flat_id, (zero, zero, zero))
+        start_balance = opening.get(flat_id, zero)
+        rows.append({'flat_id': flat_id, 'flat_number': flat_number, 'resident_name': resident_name,
+                     'opening': start_balance, 'charges': charges, 'payments': payments,
+                     'adjustments': adjustments, 'closing': start_balance + charges - payments + adjustments})
+    return rows
+
+
+def month_entries(cursor, start, end, flat_ids):
+    """{flat_id: [entry, ...]} for entries dated in [start, end), oldest first, limited to `flat_ids`."""
+    cursor.execute("""
+        SELECT flat_id, entry_date, kind, amount, sale_id, note FROM FlatLedger
+        WHERE entry_date >= %s AND entry_date < %s
+        ORDER BY flat_id, entry_date, entry_id
+    """, (start.isoformat(), end.isoformat()))
+    entries = {}
+    for flat_id, entry_date, kind, amount, sale_id, note in cursor.fetchall():
+        if flat_id in flat_ids:
+            entries.setdefault(flat_id, []).append(
+                {'entry_date': str(entry_date)[:16], 'kind': kind, 'amount': _money(amount),
+                 'sale_id': sale_id, 'note': note})
+    return entries
+
+
+def statement_name(flat):
+    return f"{flat['flat_id']:05d}_{_UNSAFE.sub('-', str(flat['flat_number'])).strip('-') or 'flat'}.html"
+
+
+def render_statement(shop, label, flat, entries):
+    """One flat's statement as a standalone HTML page."""
+    e = lambda value: html.escape(str(value if value is not None else ""))
+    lines = []
+    for entry in entries:
+        detail = f"Sale #{entry['sale_id']}" if entry['sale_id'] else (entry['note'] or entry['kind'].title())
+        lines.append(f"<tr><td>{e(entry['entry_date'])}</td><td>{e(detail)}</td>"
+                     f"<td class=num>{entry['amount']:.2f}</td></tr>")
+    if not lines:
+        lines.append("<tr><td colspan=3>No charges or payments this month.</td></tr>")
+    adjustments = (f"<tr><td colspan=2>Adjustments</td><td class=num>{flat['adjustments']:.2f}</td></tr>\n"
+                   if flat['adjustments'] else "")
+    resident = f" &middot; {e(flat['resident_name'])}" if flat['resident_name'] else ""
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Statement {e(flat['flat_number'])} {e(label)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }} table {{ border-collapse: collapse; width: 100%; }}
+td, th {{ padding: 4px 8px; border-bottom: 1px solid #ddd; text-align: left; }} .num {{ text-align: right; }}
+.total td {{ font-weight: bold; }}
+</style></head><body>
+<h2>{e(shop.get('shop_name'))}</h2>
+<p>{e(shop.get('address'))}<br>Phone {e(shop.get('phone'))} &middot; GSTIN {e(shop.get('gst_number'))}</p>
+<h3>Credit statement for {e(label)}: flat {e(flat['flat_number'])}{resident}</h3>
+<table>
+<tr class=total><td colspan=2>Opening balance</td><td class=num>{flat['opening']:.2f}</td></tr>
+<tr><th>Date</th><th>Details</th><th class=num>Amount</th></tr>
+{chr(10).join(lines)}
+<tr><td colspan=2>Charges</td><td class=num>{flat['charges']:.2f}</td></tr>
+<tr><td colspan=2>Payments received</td><td class=num>{flat['payments']:.2f}</td></tr>
+{adjustments}<tr class=total><td colspan=2>Closing balance (amount due)</td><td class=num>{flat['closing']:.2f}</td></tr>
+</table></body></html>
+"""
+
+
+def write_statements(directory, shop, label, batch):
+    """Renders and writes one batch of (flat, entries); runs in a pool process. Returns the count."""
+    for flat, entries in batch:
+        path = os.path.join(directory, statement_name(flat))
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(render_statement(shop, label, flat, entries))
+        os.replace(temporary, path)  # a statement on disk is always complete
+    return len(batch)
+
+
+def run(get_connection, directory, start, workers=None, batch_size=50, on_progress=None, today=None):
+    """
+    Bills every flat for the calendar month starting at `start` into `directory`/<YYYY-MM>/:
+    one statement per flat with a balance or activity and billing_<YYYY-MM>.csv summarising all
+    flats. on_progress(done, total) is called as statement batches finish. Returns a BillingReport.
+    """
+    start, end = month_bounds(ledger.month_start(start))
+    if end > (today or datetime.date.today()):
+        raise ValueError(f"{start:%B %Y} has not ended yet; bill it from {end:%d %b %Y} on.")
+    label = f"{start:%B %Y}"
+    folder = os.path.join(directory, f"{start:%Y-%m}")
+    os.makedirs(folder, exist_ok=True)
+    report = BillingReport(folder)
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            flats = month_totals(cursor, start, end)
+            billed = [flat for flat in flats
+                      if any(flat[field] for field in ('opening', 'charges', 'payments', 'adjustments'))]
+            done = set(os.listdir(folder))
+            todo = [flat for flat in billed if statement_name(flat) not in done]
+            entries = month_entries(cursor, start, end, {flat['flat_id'] for flat in todo}) if todo else {}
+            cursor.execute("SELECT shop_name, address, phone, gst_number FROM ShopInfo WHERE id = 1")
+            shop = dict(zip(('shop_name', 'address', 'phone', 'gst_number'), cursor.fetchone() or ()))
+        finally:
+            conn.rollback()
+            cursor.close()
+
+    report.flats, report.billed, report.skipped = len(flats), len(billed), len(billed) - len(todo)
+    batches = [[(flat, entries.get(flat['flat_id'], [])) for flat in todo[i:i + batch_size]]
+               for i in range(0, len(todo), batch_size)]
+    if len(batches) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = [pool.submit(write_statements, folder, shop, label, batch) for batch in batches]
+            for future in pending:
+                report.written += future.result()
+                if on_progress:
+                    on_progress(report.written, len(todo))
+    else:
+        for batch in batches:
+            report.written += write_statements(folder, shop, label, batch)
+            if on_progress:
+                on_progress(report.written, len(todo))
+
+    billed_ids = {flat['flat_id'] for flat in billed}
+    report.summary_path = os.path.join(directory, f"billing_{start:%Y-%m}.csv")
+    with open(report.summary_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(SUMMARY_COLUMNS)
+        for flat in flats:
+            writer.writerow([flat[column] for column in SUMMARY_COLUMNS[:-1]] +
+                            [os.path.join(f"{start:%Y-%m}", statement_name(flat)) if flat['flat_id'] in billed_ids else ""])
+    return report
@@ -0,0 +1,129 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Money is held as integer paise (1 rupee = 100 paise) so totals never pick up float error.
+
+
+def to_paise(amount):
+    """Converts a rupee amount (Decimal, float, int or str) to integer paise."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paise):
+    """Converts integer paise back to a two-place Decimal for the database and display."""
+    return (Decimal(paise) / 100).quantize(Decimal('0.01'))
+
+
+class CartLine:
+    __slots__ = ('product_id', 'name', 'unit_price', 'quantity')
+
+    def __init__(self, product_id, name, unit_price, quantity):
+        self.product_id = product_id
+        self.name = name
+        self.unit_price = unit_price  # paise
+        self.quantity = quantity
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+    def __repr__(self):
+        return f"CartLine({self.product_id}, {self.name!r}, {self.unit_price}, {self.quantity})"
+
+
+class Cart:
+    """
+    Lines keyed by product_id with a running subtotal.
+
+    Every change updates the subtotal by the delta instead of re-summing the cart, and listeners
+    are told exactly what happened: callback(event, line) with event one of 'added', 'updated',
+    'removed' or 'cleared' (line is None for 'cleared').
+    """
+
+    __slots__ = ('lines', 'subtotal', 'gst_rate', '_listeners')
+
+    def __init__(self, gst_rate=18.0):
+        self.lines = {}
+        self.subtotal = 0  # paise
+        self.gst_rate = Decimal(str(gst_rate))
+        self._listeners = []
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, event, line):
+        for callback in self._listeners:
+            callback(event, line)
+
+    # --- Totals ---
+    @property
+    def gst(self):
+        return int((self.subtotal * self.gst_rate / 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+    @property
+    def total(self):
+        return self.subtotal + self.gst
+
+    def set_gst_rate(self, gst_rate):
+        self.gst_rate = Decimal(str(gst_rate))
+
+    # --- Lines ---
+    def quantity(self, product_id):
+        line = self.lines.get(product_id)
+        return line.quantity if line else 0
+
+    def add(self, product_id, name, unit_price, quantity=1):
+        """Adds units of a product; unit_price is in paise."""
+        line = self.lines.get(product_id)
+        if line:
+            line.quantity += quantity
+            event = 'updated'
+        else:
+            line = self.lines[product_id] = CartLine(product_id, name, unit_price, quantity)
+            event = 'added'
+        self.subtotal += line.unit_price * quantity
+        self._notify(event, line)
+        return line
+
+    def remove_one(self, product_id):
+        line = self.lines.get(product_id)
+        if not line:
+            return
+        line.quantity -= 1
+        self.subtotal -= line.unit_price
+        if line.quantity == 0:
+            del self.lines[product_id]
+            self._notify('removed', line)
+        else:
+            self._notify('updated', line)
+
+    def set_quantity(self, product_id, quantity):
+        """Sets a line's quantity, removing it at zero (e.g. trimming to the stock that is left)."""
+        line = self.lines.get(product_id)
+        if not line:
+            return
+        if quantity <= 0:
+            self.remove(product_id)
+            return
+        self.subtotal += line.unit_price * (quantity - line.quantity)
+        line.quantity = quantity
+        self._notify('updated', line)
+
+    def remove(self, product_id):
+        line = self.lines.pop(product_id, None)
+        if line:
+            self.subtotal -= line.total
+            self._notify('removed', line)
+
+    def clear(self):
+        self.lines.clear()
+        self.subtotal = 0
+        self._notify('cleared', None)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.values())
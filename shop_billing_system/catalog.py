@@ -0,0 +1,406 @@
+import threading
+from decimal import Decimal
+
+import ledger
+from repositories import days_ago
+from search_index import SearchIndex
+
+
+class ProductCatalog:
+    """
+    Process-wide in-memory copy of the Products table.
+
+    Rows are dicts keyed by product_id, with secondary maps by (lower-cased) name and barcode.
+    The app's own write paths update the cache directly (write-through); refresh() picks up
+    changes made elsewhere by comparing the table's row count and MAX(last_updated) and then
+    fetching only the rows touched since the previous check.
+
+    Listeners registered with add_listener() are called with the set of changed product_ids
+    after every load, refresh or write-through update, on the thread that made the change.
+    """
+
+    COLUMNS = "product_id, barcode, name, price, stock_quantity, last_updated"
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection  # returns a connection or None
+        self._lock = threading.RLock()
+        self._products = {}
+        self._by_name = {}
+        self._by_barcode = {}
+        self._search = SearchIndex()
+        self._row_count = None
+        self._last_updated = None
+        self.loaded = False
+        self._listeners = []
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, changed):
+        if changed:
+            for callback in list(self._listeners):
+                callback(changed)
+
+    # --- Loading ---
+    def load(self):
+        """Reads the whole Products table. Returns the set of product_ids that changed."""
+        conn = self._get_connection()
+        if not conn: return set()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT {self.COLUMNS} FROM Products")
+            rows = cursor.fetchall()
+            cursor.execute("SELECT COUNT(*) AS row_count, MAX(last_updated) AS last_updated FROM Products")
+            marker = cursor.fetchone()
+            # Units sold over the last 90 days rank popular products first in search results
+            cursor.execute("""
+                SELECT product_id, SUM(units) AS units
+                FROM ProductDailySales
+                WHERE sale_day >= %s
+                GROUP BY product_id
+            """, (days_ago(90),))
+            popularity = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            changed = set(self._products)
+            self._products.clear()
+            self._by_name.clear()
+            self._by_barcode.clear()
+            self._search.clear()
+            for row in rows:
+                self._put(row)
+            for row in popularity:
+                self._search.set_popularity(row['product_id'], int(row['units']))
+            changed.update(self._products)
+            self._row_count = marker['row_count']
+            self._last_updated = marker['last_updated']
+            self.loaded = True
+        self._notify(changed)
+        return changed
+
+    def refresh(self):
+        """
+        Brings the cache up to date with one cheap "changed since" query.
+        Returns the set of product_ids that were added, updated or removed.
+        """
+        if not self.loaded:
+            return self.load()
+
+        conn = self._get_connection()
+        if not conn: return set()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT COUNT(*) AS row_count, MAX(last_updated) AS last_updated FROM Products")
+            marker = cursor.fetchone()
+            with self._lock:
+                since = self._last_updated
+                if marker['row_count'] == self._row_count and marker['last_updated'] == since:
+                    return set()
+
+            # TIMESTAMP has one-second resolution, so re-read the boundary second as well
+            if since is None:
+                cursor.execute(f"SELECT {self.COLUMNS} FROM Products")
+            else:
+                cursor.execute(f"SELECT {self.COLUMNS} FROM Products WHERE last_updated >= %s", (since,))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            changed = set()
+            for row in rows:
+                self._put(row)
+                changed.add(row['product_id'])
+            self._row_count = marker['row_count']
+            self._last_updated = marker['last_updated']
+            deleted_elsewhere = len(self._products) != marker['row_count']
+
+        if deleted_elsewhere:
+            # Rows were deleted by another terminal; the delta can't show that, so reload.
+            return changed | self.load()
+        self._notify(changed)
+        return changed
+
+    def apply_changes(self, product_ids):
+        """
+        Re-reads just these products (e.g. reported by the ChangeFeed); ids no longer in the table
+        are dropped. None reloads everything. Returns the set of product_ids that changed.
+        """
+        if product_ids is None:
+            return self.load()
+        ids = list(product_ids)
+        if not ids:
+            return set()
+        conn = self._get_connection()
+        if not conn: return set()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT {self.COLUMNS} FROM Products WHERE product_id IN ({', '.join(['%s'] * len(ids))})",
+                           ids)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            for row in rows:
+                self._put(row)
+            for product_id in set(ids) - {row['product_id'] for row in rows}:
+                row = self._products.pop(product_id, None)
+                if row:
+                    self._unindex(row)
+        changed = set(ids)
+        self._notify(changed)
+        return changed
+
+    # --- Lookups ---
+    def get(self, product_id):
+        with self._lock:
+            return self._products.get(product_id)
+
+    def all_products(self):
+        """All products sorted by name."""
+        with self._lock:
+            return sorted(self._products.values(), key=lambda p: p['name'].lower())
+
+    def in_stock(self):
+        """Products with stock left, sorted by name."""
+        with self._lock:
+            return sorted((p for p in self._products.values() if p['stock_quantity'] > 0),
+                          key=lambda p: p['name'].lower())
+
+    def popularity(self):
+        """{product_id: units} used to rank search results."""
+        with self._lock:
+            return self._search.popularity()
+
+    def search(self, query, limit=10, in_stock_only=False):
+        """Ranked, typo-tolerant name search served from the in-memory index."""
+        with self._lock:
+            accept = (lambda pid: self._products[pid]['stock_quantity'] > 0) if in_stock_only else None
+            return [self._products[pid] for pid in self._search.search(query, limit, accept)]
+
+    def find_by_name(self, name):
+        """Exact (case-insensitive) name match first, otherwise the best-ranked in-stock match."""
+        needle = name.strip().lower()
+        if not needle: return None
+        with self._lock:
+            product_id = self._by_name.get(needle)
+            if product_id is not None and self._products[product_id]['stock_quantity'] > 0:
+                return self._products[product_id]
+        matches = self.search(needle, limit=1, in_stock_only=True)
+        return matches[0] if matches else None
+
+    def find_by_barcode(self, barcode, fallback=True):
+        """O(1) lookup in the barcode index; falls back to the unique barcode index in the database."""
+        with self._lock:
+            product_id = self._by_barcode.get(barcode)
+            if product_id is not None:
+                return self._products[product_id]
+        return self._fetch_by_barcode(barcode) if fallback else None
+
+    def _fetch_by_barcode(self, barcode):
+        # Covers products added by another terminal since the last refresh()
+        conn = self._get_connection()
+        if not conn: return None
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT {self.COLUMNS} FROM Products WHERE barcode = %s", (barcode,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if row:
+            with self._lock:
+                row = self._put(row)
+            self._notify({row['product_id']})
+        return row
+
+    # --- Write-through updates ---
+    def upsert(self, row):
+        """Adds or replaces a product after the app has written it to the database."""
+        with self._lock:
+            self._put(dict(row))
+        self._notify({row['product_id']})
+
+    def remove(self, product_id):
+        with self._lock:
+            row = self._products.pop(product_id, None)
+            if row:
+                self._unindex(row)
+        self._notify({product_id})
+
+    def adjust_stock(self, product_id, delta):
+        with self._lock:
+            row = self._products.get(product_id)
+            if row:
+                row['stock_quantity'] += delta
+        self._notify({product_id})
+
+    def set_stock(self, product_id, quantity):
+        """Replaces the cached stock with a value just read from the database (e.g. after a stock conflict)."""
+        with self._lock:
+            row = self._products.get(product_id)
+            if row:
+                row['stock_quantity'] = quantity
+        self._notify({product_id})
+
+    def record_sale(self, product_id, quantity, stock=None):
+        """
+        Counts a sale towards the product's search ranking and updates its stock: to `stock`, the
+        level the commit left, when known. Without it (a sale still in the journal) the quantity is
+        subtracted; the change feed's re-read of the row replaces that once the sale is written.
+        """
+        with self._lock:
+            self._search.bump_popularity(product_id, quantity)
+        if stock is None:
+            self.adjust_stock(product_id, -quantity)
+        else:
+            self.set_stock(product_id, stock)
+
+    def _put(self, row):
+        old = self._products.get(row['product_id'])
+        if old:
+            # Update in place so rows already handed out to the UI stay current
+            self._unindex(old)
+            old.update(row)
+            row = old
+        self._products[row['product_id']] = row
+        self._by_name[row['name'].lower()] = row['product_id']
+        if row.get('barcode'):
+            self._by_barcode[row['barcode']] = row['product_id']
+        self._search.add(row['product_id'], row['name'])
+        return row
+
+    def _unindex(self, row):
+        self._search.remove(row['product_id'])
+        if self._by_name.get(row['name'].lower()) == row['product_id']:
+            del self._by_name[row['name'].lower()]
+        if row.get('barcode') and self._by_barcode.get(row['barcode']) == row['product_id']:
+            del self._by_barcode[row['barcode']]
+
+
+class FlatDirectory:
+    """
+    In-memory copy of the Flats table with a search index over flat numbers and resident names.
+    The table is small (hundreds of rows), so load() simply re-reads it; payments and credit sales
+    update balances here directly after they are written to the database.
+    """
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+        self._lock = threading.RLock()
+        self._flats = {}
+        self._search = SearchIndex()
+        self.loaded = False
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(changed_flat_ids) after load(), apply_changes() or adjust_balance(); None means all."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, changed):
+        for callback in list(self._listeners):
+            callback(changed)
+
+    def load(self):
+        conn = self._get_connection()
+        if not conn: return False
+        try:
+            rows = self._read(conn)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._flats = {row['flat_id']: row for row in rows}
+            self._search.clear()
+            for row in rows:
+                self._search.add(row['flat_id'], row['flat_number'], row['resident_name'])
+            self.loaded = True
+        self._notify(None)
+        return True
+
+    @staticmethod
+    def _read(conn, ids=None):
+        """Flat rows (all, or just `ids`) with credit_balance taken from the ledger."""
+        where = "" if ids is None else f" WHERE flat_id IN ({', '.join(['%s'] * len(ids))})"
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT flat_id, flat_number, resident_name FROM Flats" + where, ids or ())
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        cursor = conn.cursor()
+        try:
+            balances = ledger.balances(cursor, ids)
+            conn.rollback()
+        finally:
+            cursor.close()
+        for row in rows:
+            row['credit_balance'] = balances.get(row['flat_id'], Decimal('0.00'))
+        return rows
+
+    def _fetch(self, ids):
+        """Current rows for `ids` (missing ones are gone), or None without a connection."""
+        conn = self._get_connection()
+        if not conn: return None
+        try:
+            return self._read(conn, ids)
+        finally:
+            conn.close()
+
+    def apply_changes(self, flat_ids):
+        """
+        Re-reads just these flats (see ProductCatalog.apply_changes). Returns the set of ids re-read,
+        or None when the whole table was reloaded instead (flat_ids None, or nothing loaded yet).
+        """
+        if flat_ids is None or not self.loaded:
+            self.load()
+            return None
+        ids = list(flat_ids)
+        if not ids:
+            return set()
+        rows = self._fetch(ids)
+        if rows is None:
+            return set()
+
+        with self._lock:
+            for flat_id in ids:
+                if self._flats.pop(flat_id, None):
+                    self._search.remove(flat_id)
+            for row in rows:
+                self._flats[row['flat_id']] = row
+                self._search.add(row['flat_id'], row['flat_number'], row['resident_name'])
+        self._notify(set(ids))
+        return set(ids)
+
+    def get(self, flat_id):
+        with self._lock:
+            return self._flats.get(flat_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._flats.values())
+
+    def search(self, term, limit=50):
+        with self._lock:
+            return [self._flats[flat_id] for flat_id in self._search.search(term, limit)]
+
+    def adjust_balance(self, flat_id, delta):
+        with self._lock:
+            row = self._flats.get(flat_id)
+            if row:
+                row['credit_balance'] = Decimal(str(row['credit_balance'])) + Decimal(str(delta))
+        self._notify({flat_id})
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import defaultdict
+
+# Entities recorded in ChangeLog by the triggers of schema migration 5
+PRODUCT, FLAT, SHOP = 'product', 'flat', 'shop'
+
+
+class ChangeFeed:
+    """
+    Polls the ChangeLog table by sequence number and tells subscribers which rows changed.
+
+    `changes` is a ChangeLogRepository (or a service proxy for one). Each poll reads the records
+    after the last sequence seen and calls callback(ids) once per subscribed entity with the set of
+    changed ids, on the feed's thread. callback(None) means the feed lost track (the log was pruned
+    past its position, e.g. after the terminal was offline for days) and everything must be reloaded.
+
+    Sequence numbers are assigned when a row is inserted, not when its transaction commits, so a
+    slow transaction (a large import chunk) can commit lower numbers after higher ones have been
+    read. Numbers skipped below the newest one seen are kept as gaps, and each poll reads from the
+    lowest gap, skipping the numbers it has already delivered. A gap still open after `gap_timeout`
+    seconds is usually a rolled-back insert, but could be a transaction the feed can no longer
+    place, so it is given up with callback(None).
+    """
+
+    def __init__(self, changes, interval=2.0, batch_size=500, gap_timeout=120.0, on_error=None, on_recovered=None):
+        self.changes = changes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.on_error = on_error  # called on the feed's thread for each failed poll or subscriber
+        self.on_recovered = on_recovered  # called after the first clean poll pass following an error
+        self._failing = False
+        self._delivery_failed = False
+        self.last_seq = None
+        self._floor = 0  # the log's end when the feed started; older records are already in the caches
+        self._gaps = {}  # seq below last_seq not seen yet -> monotonic time it was noticed
+        self._seen = set()  # seqs above the lowest gap already delivered
+        self._page_after = None  # where the next page starts while a poll pass is paging through
+        self._subscribers = defaultdict(list)  # entity -> [callback]
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+
+    def subscribe(self, entity, callback):
+        self._subscribers[entity].append(callback)
+
+    def start(self):
+        """Marks the current end of the log and starts polling; load the caches after calling this."""
+        try:
+            self.last_seq = self._floor = self.changes.bounds()[1] or 0
+        except Exception as err:
+            self._report(err)  # offline: the thread keeps trying
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.last_seq is None:
+                    self.last_seq = self._floor = self.changes.bounds()[1] or 0
+                while self.poll() and not self._stopping.is_set():
+                    pass
+            except Exception as err:
+                self._report(err)
+            else:
+                if self._failing and not self._delivery_failed:
+                    self._failing = False
+                    if self.on_recovered:
+                        self.on_recovered()
+            self._delivery_failed = False
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """Delivers one batch of changes. Returns True if the batch was full and more may be waiting."""
+        if self._gaps and time.monotonic() - min(self._gaps.values()) > self.gap_timeout:
+            self._reload_all()
+        after = self._page_after
+        if after is None:
+            after = min(self._gaps) - 1 if self._gaps else self.last_seq
+        batch = self.changes.since(max(0, after), self.batch_size)
+        more = len(batch) >= self.batch_size
+        self._page_after = batch[-1][0] if more else None
+        records = [record for record in batch if record[0] > self._floor and record[0] not in self._seen]
+        if not records:
+            return more
+
+        if not self._gaps and self.last_seq and records[0][0] > self.last_seq + 1:
+            first, _ = self.changes.bounds()
+            if first is not None and first > self.last_seq + 1:
+                # Pruned past our position: the missing records are gone, not late
+                self._advance(records, track_gaps=False)
+                self._reload_all()
+                return more
+        changed = defaultdict(set)
+        for _, entity, entity_id in records:
+            changed[entity].add(entity_id)
+        self._deliver(changed)
+        self._advance(records)
+        return more
+
+    def _advance(self, records, track_gaps=True):
+        now = time.monotonic()
+        previous = self.last_seq
+        for seq, _, _ in records:
+            self._gaps.pop(seq, None)
+            if track_gaps and seq > previous + 1:
+                for missing in range(previous + 1, seq):
+                    self._gaps.setdefault(missing, now)
+            previous = max(previous, seq)
+        self.last_seq = previous
+        self._seen.update(seq for seq, _, _ in records)
+        if self._page_after is None:  # not mid-pass, where later pages still re-read what we've seen
+            low = min(self._gaps) if self._gaps else self.last_seq
+            self._seen = {seq for seq in self._seen if seq > low}
+
+    def _reload_all(self):
+        self._gaps.clear()
+        self._seen.clear()
+        self._page_after = None
+        self._deliver({entity: None for entity in self._subscribers})
+
+    def _deliver(self, changed):
+        for entity, ids in changed.items():
+            for callback in self._subscribers.get(entity, ()):
+                try:
+                    callback(ids)
+                except Exception as err:
+                    self._delivery_failed = True
+                    self._report(err)
+
+    def _report(self, err):
+        self._failing = True
+        if self.on_error:
+            self.on_error(err)
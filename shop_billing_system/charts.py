@@ -0,0 +1,198 @@
+import base64
+import datetime
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+
+from analytics import WEEKDAYS
+
+# Report charts are rendered to PNG on worker threads and shown in the window as plain images, so
+# the Tk thread never lays out or rasterises a figure. Each chart keeps one figure and its artists
+# and only updates their data between renders (bar heights, title, limits) instead of clearing the
+# axes. Rendered images are cached with the series they came from, so flipping back to a product
+# shown a moment ago, or scrubbing through products with the arrow keys, costs an image swap.
+#
+# Importing this module loads matplotlib, which takes longer than the rest of the application's
+# imports together; shop_billing.py imports it when the Reports window first needs a chart.
+
+
+class LRUCache:
+    """Thread-safe mapping of the `maxsize` most recently used entries, each kept for `ttl` seconds."""
+
+    def __init__(self, maxsize=64, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored at, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DailySeries:
+    """One product's units and revenue per day, with a zero for every day without sales."""
+    __slots__ = ('first_day', 'units', 'revenue', 'image')
+
+    def __init__(self, first_day, units, revenue):
+        self.first_day = first_day
+        self.units = units
+        self.revenue = revenue
+        self.image = None  # ((width, height), image data) of the last render
+
+    @classmethod
+    def from_rows(cls, rows, days, today=None):
+        """From SaleRepository.product_daily_sales() rows covering the last `days` days."""
+        first_day = (today or datetime.date.today()) - datetime.timedelta(days=days)
+        units = np.zeros(days + 1, dtype=np.int64)
+        revenue = np.zeros(days + 1)
+        for row in rows:
+            index = (row['sale_day'] - first_day).days
+            if 0 <= index <= days:
+                units[index] = row['total_quantity']
+                revenue[index] = float(row['daily_revenue'])
+        return cls(first_day, units, revenue)
+
+    @property
+    def total_units(self):
+        return int(self.units.sum())
+
+    @property
+    def total_revenue(self):
+        return float(self.revenue.sum())
+
+
+class _Chart:
+    """A figure drawn off-screen; render() calls are serialised because they share its artists."""
+
+    def __init__(self, dpi=100):
+        self._lock = threading.Lock()
+        self.dpi = dpi
+        self.fig = Figure(dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        # Fixed margins rather than tight_layout(), which measures every label on every render
+        self.fig.subplots_adjust(left=0.08, right=0.98, bottom=0.16, top=0.92)
+        self.ax = self.fig.add_subplot(111)
+
+    def _png(self, size):
+        """The figure at `size` pixels as base64 PNG, which tkinter's PhotoImage(data=...) reads."""
+        width, height = size
+        self.fig.set_size_inches(max(width, 100) / self.dpi, max(height, 100) / self.dpi)
+        buffer = io.BytesIO()
+        self.fig.canvas.print_png(buffer)
+        return base64.b64encode(buffer.getvalue())
+
+
+class DailySalesChart(_Chart):
+    """
+    Bar chart of a product's daily units. All bars are one PolyCollection laid out once per period;
+    a render only rewrites their heights, which is far cheaper to draw than a Rectangle per day.
+    """
+
+    def __init__(self, dpi=100):
+        super().__init__(dpi)
+        self._bars = PolyCollection([], facecolors='#3498db', edgecolors='none')
+        self.ax.add_collection(self._bars)
+        self._corners = np.zeros((0, 4, 2))  # per bar: bottom-left, top-left, top-right, bottom-right
+        self._slots = None  # (first day, number of days) the bars were laid out for
+        self._title = self.ax.set_title("")
+        self.ax.set_ylabel("Quantity Sold")
+        self.ax.tick_params(axis='x', rotation=45)
+        self.ax.xaxis_date()
+
+    def render(self, title, series, size):
+        with self._lock:
+            days = len(series.units)
+            if self._slots != (series.first_day, days):
+                self._layout(series.first_day, days)
+            self._corners[:, 1:3, 1] = series.units[:, None]
+            self._bars.set_verts(self._corners)
+            self.ax.set_ylim(0, max(1, int(series.units.max(initial=0))) * 1.1)
+            self._title.set_text(title)
+            return self._png(size)
+
+    def _layout(self, first_day, days):
+        start = mdates.date2num(first_day)
+        middles = np.arange(days) + start
+        self._corners = np.zeros((days, 4, 2))
+        self._corners[:, :2, 0] = (middles - 0.4)[:, None]
+        self._corners[:, 2:, 0] = (middles + 0.4)[:, None]
+        self.ax.set_xlim(start - 1, start + days)
+        # A date axis keeps the labels readable whether there are 5 bars or 300
+        self.ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d' if days <= 91 else '%b %Y'))  # up to 90 days back
+        self._slots = (first_day, days)
+
+
+class HeatmapChart(_Chart):
+    """Weekday x hour grid of sales counts; the image artist is created once and gets new data."""
+
+    def __init__(self, dpi=100):
+        super().__init__(dpi)
+        self._image = self.ax.imshow(np.zeros((7, 24)), aspect="auto", cmap="YlOrRd")
+        self._title = self.ax.set_title("")
+        self.ax.set_xticks(range(0, 24, 2))
+        self.ax.set_xlabel("Hour of day")
+
+        self.ax.set_yticks(range(len(WEEKDAYS)), WEEKDAYS)
+
+    def render(self, title, counts, size):
+        """`counts` is analytics.heatmap()'s 7 x 24 grid, Monday first."""
+        with self._lock:
+            counts = np.asarray(counts)
+            self._image.set_data(counts)
+            self._image.set_clim(0, max(1, int(counts.max(initial=0))))
+            self._title.set_text(title)
+            return self._png(size)
+
+
+class ReportCharts:
+    """The figures and chart cache shared by every Reports window of the process."""
+
+    def __init__(self, daily_sales, cache_size=64, ttl=60):
+        self._daily_sales = daily_sales  # (product_id, days) -> SaleRepository.product_daily_sales() rows
+        self.cache = LRUCache(cache_size, ttl)
+        self.daily = DailySalesChart()
+        self.heatmap = HeatmapChart()
+
+    def cached_product(self, product_id, days, size):
+        """(DailySeries, image data) if this chart was rendered at `size` recently, else None. Never blocks."""
+        series = self.cache.get((product_id, days))
+        if series is not None and series.image is not None and series.image[0] == size:
+            return series, series.image[1]
+        return None
+
+    def product(self, product_id, name, days, size):
+        """(DailySeries, image data) for one product's sales graph, from the cache where possible."""
+        series = self.cache.get((product_id, days))
+        if series is None:
+            series = DailySeries.from_rows(self._daily_sales(product_id, days), days)
+            self.cache.put((product_id, days), series)
+        if series.image is None or series.image[0] != size:
+            series.image = (size, self.daily.render(f"Daily Sales for {name}", series, size))
+        return series, series.image[1]
@@ -0,0 +1,240 @@
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("shop_billing.pool")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class PooledConnection:
+    """Wraps a raw connection so that close() hands it back to the pool instead of disconnecting."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw)
+
+    def discard(self):
+        """Drops the underlying connection instead of returning it (e.g. after a fatal error)."""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, broken=True)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"Connection already returned to the pool (accessing '{name}')")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    A small thread-safe connection pool.
+
+    connect:       callable returning a new raw DB-API connection.
+    size:          maximum number of open connections.
+    timeout:       seconds acquire() waits for a free connection before giving up.
+    is_alive:      callable(conn) -> bool used to health-check idle connections on checkout.
+    reset:         callable(conn) run when a connection is returned (e.g. roll back an open transaction).
+    ping_interval: connections used within this many seconds skip the liveness check.
+    on_checkout:   callable(conn, wait_seconds) run after every successful checkout (e.g. for metrics);
+                   its errors are logged, not raised.
+    """
+
+    def __init__(self, connect, size=5, timeout=10.0, is_alive=None, reset=None,
+                 ping_interval=5.0, connect_retries=2, retry_delay=0.5, on_checkout=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self._connect = connect
+        self._is_alive = is_alive
+        self._reset = reset
+        self._on_checkout = on_checkout
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connect_retries = connect_retries
+        self.retry_delay = retry_delay
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw_connection, last_used_monotonic)
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._destroyed = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._failed_checks = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # --- Checkout / return ---
+    def acquire(self, timeout=None):
+        """Returns a PooledConnection, blocking until one is free or the timeout expires."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        raw = None
+        with self._cond:
+            while not self._closed and not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection became free within {timeout:.1f}s "
+                                           f"({self._in_use} of {self.size} in use).")
+                waited = True
+                self._cond.wait(remaining)
+            if self._closed:
+                # Also ends the wait above at once: close() notifies every waiter
+                raise PoolTimeoutError("Connection pool is closed.")
+
+            if self._idle:
+                raw, last_used = self._idle.pop()
+            else:
+                # Reserve the slot before connecting outside the lock
+                self._open += 1
+            self._in_use += 1
+
+        if raw is not None and self._needs_check(last_used) and not self._check(raw):
+            # Stale (e.g. the server restarted): replace it, keeping its slot
+            with self._cond:
+                self._failed_checks += 1
+            self._destroy(raw)
+            raw = None
+
+        if raw is None:
+            try:
+                raw = self._create()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+        wait = time.monotonic() - started
+        self._record_checkout(wait, waited)
+        if self._on_checkout:
+            try:
+                self._on_checkout(raw, wait)
+            except Exception:
+                # Instrumentation; the slot is already taken, so raising here would leak it
+                log.exception("Connection pool on_checkout hook failed")
+        return PooledConnection(self, raw)
+
+    def connection(self, timeout=None):
+        """Context-manager form: `with pool.connection() as conn: ...`."""
+        return self.acquire(timeout)
+
+    def _release(self, raw, broken=False):
+        if not broken and self._reset:
+            try:
+                self._reset(raw)
+            except Exception:
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken or self._closed:
+                self._open -= 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+        if broken or self._closed:
+            self._destroy(raw)
+
+    # --- Connection lifecycle ---
+    def _create(self):
+        last_err = None
+        for attempt in range(self.connect_retries + 1):
+            try:
+                raw = self._connect()
+                with self._cond:
+                    self._created += 1
+                return raw
+            except Exception as err:
+                last_err = err
+                if attempt < self.connect_retries:
+                    time.sleep(self.retry_delay * (2 ** attempt))
+        raise last_err
+
+    def _needs_check(self, last_used):
+        return self._is_alive is not None and time.monotonic() - last_used >= self.ping_interval
+
+    def _check(self, raw):
+        try:
+            return bool(self._is_alive(raw))
+        except Exception:
+            return False
+
+    def _destroy(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._destroyed += 1
+
+    def _record_checkout(self, wait, waited):
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+            if waited:
+                self._waits += 1
+
+    def close(self):
+        """Closes every idle connection; connections still checked out are closed when returned."""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._destroy(raw)
+
+    # --- Statistics ---
+    def stats(self):
+        """Returns a snapshot of the pool counters."""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._created,
+                'destroyed': self._destroyed,
+                'checkouts': checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'failed_checks': self._failed_checks,
+                'wait_time_total': self._wait_total,
+                'wait_time_avg': self._wait_total / checkouts if checkouts else 0.0,
+                'wait_time_max': self._wait_max,
+            }
@@ -0,0 +1,182 @@
+import csv
+import datetime
+import os
+from decimal import Decimal
+
+# Sales export for the accountant: every sale and sale line in a date range plus GST totals per
+# day. Rows are streamed from an unbuffered cursor with fetchmany() and written chunk by chunk, so
+# memory stays flat whether the range holds a day or several years of sales. Only the per-day
+# totals are kept in memory (one entry per day).
+#
+# Output is CSV, or Parquet (one row group per chunk) when pyarrow is installed.
+
+SALES_COLUMNS = [
+    ('sale_id', 'int'), ('sale_date', 'datetime'), ('payment_method', 'text'), ('flat_number', 'text'),
+    ('taxable_value', 'money'), ('gst_amount', 'money'), ('total_amount', 'money'),
+]
+ITEM_COLUMNS = [
+    ('sale_id', 'int'), ('sale_date', 'datetime'), ('product_id', 'int'), ('barcode', 'text'),
+    ('product_name', 'text'), ('quantity', 'int'), ('unit_price', 'money'), ('line_value', 'money'),
+]
+GST_COLUMNS = [
+    ('day', 'date'), ('sales', 'int'), ('taxable_value', 'money'), ('gst_amount', 'money'), ('total_amount', 'money'),
+]
+FORMATS = ('csv', 'parquet')
+
+_CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(_CENT)
+
+
+def quarters(count=4, today=None):
+    """The current and previous calendar quarters, newest first: [(label, first day, day after last)]."""
+    today = today or datetime.date.today()
+    start = datetime.date(today.year, (today.month - 1) // 3 * 3 + 1, 1)
+    result = []
+    for _ in range(count):
+        end = (start + datetime.timedelta(days=92)).replace(day=1)
+        last = end - datetime.timedelta(days=1)
+        result.append((f"{start:%b}-{last:%b %Y}", start, end))
+        previous = start - datetime.timedelta(days=1)
+        start = datetime.date(previous.year, (previous.month - 1) // 3 * 3 + 1, 1)
+    return result
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columns):
+        import pyarrow  # only needed for Parquet output
+        import pyarrow.parquet
+        self._pa = pyarrow
+        types = {'int': pyarrow.int64(), 'text': pyarrow.string(), 'money': pyarrow.decimal128(12, 2),
+                 'datetime': pyarrow.timestamp('s'), 'date': pyarrow.date32()}
+        self._kinds = [kind for _, kind in columns]
+        self._schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        arrays = [self._pa.array([_to_python(row[i], kind) for row in rows], type=field.type)
+                  for i, (field, kind) in enumerate(zip(self._schema, self._kinds))]
+        self._writer.write_batch(self._pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _to_python(value, kind):
+    # SQLite hands back timestamps and dates as text
+    if value is None:
+        return None
+    if kind == 'datetime' and isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    if kind == 'date' and isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def _open_writer(fmt, path, columns):
+    if fmt == 'parquet':
+        try:
+            return _ParquetWriter(path, columns)
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow); use CSV instead.") from None
+    return _CsvWriter(path, columns)
+
+
+def export_sales(get_connection, directory, start, end, fmt='csv', chunk_size=5000, on_progress=None):
+    """
+    Writes sales_*, sale_items_* and gst_by_day_* files for sales dated in [start, end) into
+    `directory`. on_progress(rows written) is called after every chunk. Returns the file paths.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    os.makedirs(directory, exist_ok=True)
+    suffix = f"{start:%Y%m%d}_{(end - datetime.timedelta(days=1)):%Y%m%d}.{fmt}"
+    paths = {name: os.path.join(directory, f"{name}_{suffix}") for name in ('sales', 'sale_items', 'gst_by_day')}
+    params = (start.isoformat(), end.isoformat())
+    written = 0
+
+    def progress(rows):
+        nonlocal written
+        written += rows
+        if on_progress:
+            on_progress(written)
+
+    daily = {}  # day -> [sales, taxable, gst, total]
+
+    def sales_rows(chunk):
+        rows = []
+        for sale_id, sale_date, payment_method, flat_number, total, gst in chunk:
+            total, gst = _money(total), _money(gst)
+            rows.append((sale_id, sale_date, payment_method, flat_number, total - gst, gst, total))
+            day = str(sale_date)[:10]
+            totals = daily.setdefault(day, [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')])
+            totals[0] += 1
+            totals[1] += total - gst
+            totals[2] += gst
+            totals[3] += total
+        return rows
+
+    def item_rows(chunk):
+        return [(sale_id, sale_date, product_id, barcode, name, quantity, _money(price), _money(price) * quantity)
+                for sale_id, sale_date, product_id, barcode, name, quantity, price in chunk]
+
+    _stream(get_connection, """
+        SELECT s.sale_id, s.sale_date, s.payment_method, f.flat_number, s.total_amount, s.gst_amount
+        FROM Sales s LEFT JOIN Flats f ON f.flat_id = s.flat_id
+        WHERE s.sale_date >= %s AND s.sale_date < %s
+        ORDER BY s.sale_id
+    """, params, _open_writer(fmt, paths['sales'], SALES_COLUMNS), sales_rows, chunk_size, progress)
+
+    _stream(get_connection, """
+        SELECT s.sale_id, s.sale_date, si.product_id, p.barcode, p.name, si.quantity_sold, si.price_at_sale
+        FROM Sales s
+        JOIN SaleItems si ON si.sale_id = s.sale_id
+        LEFT JOIN Products p ON p.product_id = si.product_id
+        WHERE s.sale_date >= %s AND s.sale_date < %s
+        ORDER BY s.sale_id, si.sale_item_id
+    """, params, _open_writer(fmt, paths['sale_items'], ITEM_COLUMNS), item_rows, chunk_size, progress)
+
+    writer = _open_writer(fmt, paths['gst_by_day'], GST_COLUMNS)
+    try:
+        writer.write([(day, *totals) for day, totals in sorted(daily.items())])
+    finally:
+        writer.close()
+    return list(paths.values())
+
+
+def _stream(get_connection, sql, params, writer, convert, chunk_size, progress):
+    """Runs one query on an unbuffered cursor and hands its rows to `writer` chunk_size at a time."""
+    try:
+        with get_connection() as conn:
+            # Unbuffered: MySQL sends rows as they are fetched instead of the whole result up front
+            cursor = conn.cursor(buffered=False)
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    writer.write(convert(chunk))
+                    progress(len(chunk))
+                conn.rollback()
+            finally:
+                cursor.close()
+    finally:
+        writer.close()
@@ -0,0 +1,155 @@
+import csv
+import io
+import os
+from decimal import Decimal, InvalidOperation
+
+# Bulk product import from a CSV price list (a wholesaler's catalogue, a stock count). The file is
+# read as a stream and validated row by row; valid rows are sent to ProductRepository.upsert_many
+# (or the POS service's) in chunks, each one transaction of a few batched upserts keyed on the
+# barcode. A bad row is reported with its line number and skipped; the rest of the file goes in.
+
+COLUMNS = {  # accepted header -> field
+    'barcode': 'barcode', 'ean': 'barcode',
+    'name': 'name', 'product': 'name', 'product name': 'name',
+    'price': 'price', 'mrp': 'price',
+    'stock': 'stock', 'stock_quantity': 'stock', 'quantity': 'stock', 'qty': 'stock',
+}
+REQUIRED = ('barcode', 'name', 'price')
+MAX_TEXT = 255      # Products.barcode and Products.name are VARCHAR(255) on MySQL
+MAX_ERRORS = 1000   # errors kept for display; the count covers all of them
+
+_CENT = Decimal('0.01')
+
+
+class ImportStoppedError(Exception):
+    """
+    Raised when writing a chunk failed and the import stopped there. `report` covers the chunks
+    written before it; lines first_line..last_line may or may not have gone in (a service request
+    that timed out can still have been applied), so they should be checked before importing again.
+    """
+
+    def __init__(self, report, first_line, last_line, error):
+        super().__init__(f"stopped at lines {first_line}-{last_line}, which may not have been written "
+                         f"({error}); {report.inserted} added and {report.updated} updated before them")
+        self.report = report
+        self.first_line = first_line
+        self.last_line = last_line
+
+
+class ImportReport:
+    __slots__ = ('rows', 'inserted', 'updated', 'error_count', 'errors', 'fraction')
+
+    def __init__(self):
+        self.rows = 0          # data rows read so far
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []       # (line number, message), the first MAX_ERRORS
+        self.fraction = 0.0    # share of the file read
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def describe(self):
+        return (f"{self.rows} rows: {self.inserted} added, {self.updated} updated, "
+                f"{self.error_count} skipped")
+
+
+def parse_row(row):
+    """(barcode, name, price, stock) from one CSV record keyed by field; raises ValueError if invalid."""
+    barcode = (row.get('barcode') or '').strip()
+    name = (row.get('name') or '').strip()
+    if not barcode:
+        raise ValueError("missing barcode")
+    if not name:
+        raise ValueError("missing name")
+    if len(barcode) > MAX_TEXT or len(name) > MAX_TEXT:
+        raise ValueError(f"barcode or name longer than {MAX_TEXT} characters")
+
+    price_text = (row.get('price') or '').strip().lstrip('₹').replace(',', '').strip()
+    try:
+        price = Decimal(price_text).quantize(_CENT)
+    except InvalidOperation:
+        raise ValueError(f"price {row.get('price')!r} is not a number") from None
+    if not price.is_finite() or price < 0:
+        raise ValueError(f"price {row.get('price')!r} is not a valid amount")
+
+    stock_text = (row.get('stock') or '0').strip().replace(',', '')
+    try:
+        stock = int(stock_text)
+    except ValueError:
+        raise ValueError(f"stock {row.get('stock')!r} is not a whole number") from None
+    if stock < 0:
+        raise ValueError(f"stock {stock} is negative")
+    return barcode, name, price, stock
+
+
+def import_products(repo, source, add_stock=False, chunk_size=2000, on_progress=None, encoding="utf-8-sig"):
+    """
+    Streams `source` (a path or a binary file object) into `repo.upsert_many()` in chunks of
+    `chunk_size` valid rows. on_progress(report) is called after every chunk, from this thread.
+    Raises ValueError if the header lacks a required column and ImportStoppedError if a chunk
+    could not be written; otherwise returns the ImportReport.
+    """
+    raw = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        size = _size_of(raw)
+        text = io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline="")
+        reader = csv.reader(text)
+        header = next(reader, None)
+        fields = [COLUMNS.get((name or '').strip().lower()) for name in header or ()]
+        missing = [name for name in REQUIRED if name not in fields]
+        if missing:
+            raise ValueError(f"The file has no {', '.join(missing)} column (found: {', '.join(header or [])}).")
+
+        report = ImportReport()
+        chunk = {}  # barcode -> (line, row); a barcode repeated in a chunk keeps its last line
+        for record in reader:
+            if not any(value.strip() for value in record):
+                continue
+            report.rows += 1
+            line = reader.line_num
+            try:
+                row = parse_row({field: value for field, value in zip(fields, record) if field})
+            except ValueError as err:
+                report.add_error(line, str(err))
+                continue
+            if row[0] in chunk:
+                report.add_error(chunk[row[0]][0], f"barcode {row[0]} appears again on line {line}, which was used")
+                del chunk[row[0]]
+            chunk[row[0]] = (line, row)
+            if len(chunk) >= chunk_size:
+                _flush(repo, chunk, add_stock, report, raw, size, on_progress)
+        _flush(repo, chunk, add_stock, report, raw, size, on_progress)
+        report.fraction = 1.0
+        return report
+    finally:
+        if raw is not source:
+            raw.close()
+
+
+def _flush(repo, chunk, add_stock, report, raw, size, on_progress):
+    if chunk:
+        lines = [line for line, _ in chunk.values()]
+        try:
+            result = repo.upsert_many([row for _, row in chunk.values()], add_stock)
+        except Exception as err:
+            raise ImportStoppedError(report, min(lines), max(lines), err) from err
+        report.inserted += result['inserted']
+        report.updated += result['updated']
+        for index, message in result['errors']:
+            report.add_error(lines[index], message)
+        chunk.clear()
+    if size:
+        report.fraction = min(1.0, raw.tell() / size)
+    if on_progress:
+        on_progress(report)
+
+
+def _size_of(raw):
+    try:
+        return os.fstat(raw.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return 0
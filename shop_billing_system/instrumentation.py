@@ -0,0 +1,272 @@
+import functools
+import logging
+import logging.handlers
+import re
+import threading
+import time
+import weakref
+from collections import deque
+
+# Latency of every database statement, connection checkout and UI handler is recorded here.
+# Each (kind, name) pair keeps a count, total and max plus a window of recent samples from which
+# percentiles are computed on demand, so recording costs two clock reads and a deque append.
+# Operations slower than the threshold are also written to the slow-operation log.
+
+slow_log = logging.getLogger("shop_billing.slow")
+slow_log.propagate = False
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+
+class Metrics:
+    """Process-wide latency registry; see the module comment."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.slow_ms = {'db': 200.0, 'pool': 200.0, 'ui': 100.0}
+        self._lock = threading.Lock()
+        self._histograms = {}  # (kind, name) -> Histogram
+        self._slow = deque(maxlen=200)  # most recent slow operations, newest last
+
+    def configure(self, slow_db_ms=None, slow_ui_ms=None, log_path=None):
+        if slow_db_ms is not None:
+            self.slow_ms['db'] = self.slow_ms['pool'] = slow_db_ms
+        if slow_ui_ms is not None:
+            self.slow_ms['ui'] = slow_ui_ms
+        if log_path and not slow_log.handlers:
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=1_000_000, backupCount=3,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            slow_log.addHandler(handler)
+            slow_log.setLevel(logging.INFO)
+
+    def record(self, kind, name, seconds, detail=""):
+        with self._lock:
+            histogram = self._histograms.get((kind, name))
+            if histogram is None:
+                histogram = self._histograms[(kind, name)] = Histogram(self.window)
+            histogram.add(seconds)
+        ms = seconds * 1000
+        if ms >= self.slow_ms.get(kind, float("inf")):
+            entry = (time.strftime("%H:%M:%S"), kind, name, ms, detail)
+            with self._lock:
+                self._slow.append(entry)
+            slow_log.info("%-4s %8.1f ms  %s%s", kind, ms, name, f"  [{detail}]" if detail else "")
+
+    def snapshot(self):
+        """One dict per (kind, name): count, p50/p95/max/mean and total time, all in ms."""
+        with self._lock:
+            items = [(key, h.count, h.total, h.max, list(h.recent)) for key, h in self._histograms.items()]
+        rows = []
+        for (kind, name), count, total, peak, recent in items:
+            recent.sort()
+            pick = lambda fraction: recent[min(len(recent) - 1, int(fraction * len(recent)))] if recent else 0.0
+            rows.append({'kind': kind, 'name': name, 'count': count,
+                         'p50_ms': pick(0.50) * 1000, 'p95_ms': pick(0.95) * 1000,
+                         'max_ms': peak * 1000, 'mean_ms': total / count * 1000, 'total_ms': total * 1000})
+        return rows
+
+    def top(self, n=20, by='total_ms', kind=None):
+        rows = [r for r in self.snapshot() if kind is None or r['kind'] == kind]
+        return sorted(rows, key=lambda r: r[by], reverse=True)[:n]
+
+    def slow_operations(self):
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slow.clear()
+
+    def report(self, n=20):
+        """Plain-text summary of the top offenders, for the console or a bug report."""
+        lines = [f"{'kind':<5}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'total ms':>12}  operation"]
+        for r in self.top(n):
+            lines.append(f"{r['kind']:<5}{r['count']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                         f"{r['max_ms']:>10.1f}{r['total_ms']:>12.1f}  {r['name']}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+# --- UI handlers ---
+def timed(name=None):
+    """Decorator recording a UI handler's run time under `name` (default: its qualified name)."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.record('ui', label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# --- Startup ---
+class StartupProfile:
+    """Time at which each startup phase finished, for `--profile-startup`. Marks come from the Tk thread."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.marks = []  # (phase, seconds since start)
+
+    def mark(self, phase):
+        elapsed = time.perf_counter() - self.started
+        self.marks.append((phase, elapsed))
+
+    def report(self):
+        lines = [f"{'phase':<28}{'done at ms':>12}{'took ms':>10}"]
+        previous = 0.0
+        for phase, elapsed in self.marks:
+            lines.append(f"{phase:<28}{elapsed * 1000:>12.1f}{(elapsed - previous) * 1000:>10.1f}")
+            previous = elapsed
+        return "\n".join(lines)
+
+
+# --- Database statements ---
+_WHITESPACE = re.compile(r"\s+")
+_PARAM_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_ROW_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_CASE_ARMS = re.compile(r"(WHEN %s THEN %s)(?:\s+\1)+")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_shape(sql):
+    """Statement text with whitespace, repeated parameter lists and literals collapsed, for grouping."""
+    shape = _WHITESPACE.sub(" ", sql).strip()
+    shape = _CASE_ARMS.sub(r"\1 ...", shape)
+    shape = _ROW_LIST.sub(r"\1, ...", shape)
+    shape = _PARAM_LIST.sub("%s, ...", shape)
+    shape = _NUMBER.sub("N", shape)
+    return shape[:160] + ("..." if len(shape) > 160 else "")
+
+
+class InstrumentedCursor:
+    """Times execute() plus the fetches that follow it as one statement, with its row count."""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._current = None  # [shape, seconds, rows]
+
+    def execute(self, sql, params=()):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            self._current = [sql_shape(sql), time.perf_counter() - start, self._cursor.rowcount]
+
+    def executemany(self, sql, seq_of_params):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_of_params)
+        finally:
+            self._current = [sql_shape(sql), time.perf_counter() - start, self._cursor.rowcount]
+
+    def fetchone(self):
+        return self._timed_fetch(self._cursor.fetchone, lambda row: 1 if row is not None else 0)
+
+    def fetchall(self):
+        return self._timed_fetch(self._cursor.fetchall, len)
+
+    def fetchmany(self, size=None):
+        fetch = self._cursor.fetchmany if size is None else lambda: self._cursor.fetchmany(size)
+        return self._timed_fetch(fetch, len)
+
+    def _timed_fetch(self, fetch, count):
+        start = time.perf_counter()
+        result = fetch()
+        if self._current is not None:
+            self._current[1] += time.perf_counter() - start
+            fetched = count(result)
+            self._current[2] = fetched if self._current[2] in (None, -1) else max(self._current[2], fetched)
+        return result
+
+    def finish(self):
+        """Records the statement in flight; called by the next execute(), close(), commit() or rollback()."""
+        if self._current is not None:
+            shape, seconds, rows = self._current
+            self._current = None
+            detail = f"rows={rows}"
+            wait = self._connection.checkout_wait
+            if wait >= 0.001:
+                detail += f" wait={wait * 1000:.1f}ms"
+            metrics.record('db', shape, seconds, detail)
+
+    def close(self):
+        self.finish()
+        return self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class InstrumentedConnection:
+    """Wraps a raw connection so every cursor it opens is an InstrumentedCursor; also times commits."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursors = weakref.WeakSet()
+        self.checkout_wait = 0.0  # how long the current borrower waited for this connection
+
+    def cursor(self, *args, **kwargs):
+        cursor = InstrumentedCursor(self._conn.cursor(*args, **kwargs), self)
+        self._cursors.add(cursor)
+        return cursor
+
+    def commit(self):
+        self._timed("COMMIT", self._conn.commit)
+
+    def rollback(self):
+        self._timed("ROLLBACK", self._conn.rollback)
+
+    def _timed(self, name, operation):
+        for cursor in list(self._cursors):
+            cursor.finish()
+        start = time.perf_counter()
+        try:
+            operation()
+        finally:
+            metrics.record('db', name, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument_connect(connect):
+    """Wraps a connection factory (e.g. StorageBackend.connect) for use with the ConnectionPool."""
+    return lambda: InstrumentedConnection(connect())
+
+
+def record_checkout(conn, wait):
+    """ConnectionPool on_checkout hook: records the wait and remembers it for the statements that follow."""
+    if isinstance(conn, InstrumentedConnection):
+        conn.checkout_wait = wait
+    metrics.record('pool', "connection checkout", wait)
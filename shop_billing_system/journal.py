@@ -0,0 +1,268 @@
+import datetime
+import json
+import sqlite3
+import threading
+import uuid
+from decimal import Decimal
+
+import sales
+from sales import InsufficientStockError
+
+
+class JournalEntry:
+    __slots__ = ('seq', 'client_ref', 'created_at', 'lines', 'total_amount', 'gst_amount',
+                 'payment_method', 'flat_id', 'attempts', 'approved', 'note')
+
+    def __init__(self, seq, client_ref, created_at, payload, attempts=0, approved=False, note=None):
+        self.seq = seq
+        self.client_ref = client_ref
+        self.created_at = created_at
+        self.lines = [(pid, qty, Decimal(price)) for pid, qty, price in payload['lines']]
+        self.total_amount = Decimal(payload['total_amount'])
+        self.gst_amount = Decimal(payload['gst_amount'])
+        self.payment_method = payload['payment_method']
+        self.flat_id = payload['flat_id']
+        self.attempts = attempts
+        self.approved = approved  # reviewed after a stock shortage and cleared to be written anyway
+        self.note = note
+
+
+class SaleJournal:
+    """
+    Local append-only record of every sale, written before anything is sent to MySQL.
+
+    The journal is a SQLite file in WAL mode with synchronous=FULL, so append() returns only once
+    the sale is safely on disk. Each entry carries a client_ref (a UUID) that is stored with the
+    Sales row, which makes replaying an entry idempotent. Entries move from 'pending' to
+    'synced' (with the MySQL sale_id) or to 'rejected' once the database refuses them for good.
+
+    A 'held' entry is one the counter is confirming against the database itself (see
+    App.process_sale); the replicator leaves it alone until it is released to 'pending', or it
+    ends as 'synced' or, when the stock was not there and the sale was not completed, 'voided'.
+
+    A sale the database refuses for stock when it is replayed is moved to 'short' and waits for
+    someone at the counter to review it: approve() sends it back as 'approved', which the replicator
+    writes past the stock check, and void() drops it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_ref TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sale_id INTEGER,
+                note TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, seq)")
+
+    def append(self, lines, total_amount, gst_amount, payment_method, flat_id=None, held=False):
+        """Durably records a sale; `lines` is a list of (product_id, quantity, unit_price)."""
+        client_ref = uuid.uuid4().hex
+        created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        payload = {
+            'lines': [(pid, qty, str(price)) for pid, qty, price in lines],
+            'total_amount': str(total_amount),
+            'gst_amount': str(gst_amount),
+            'payment_method': payment_method,
+            'flat_id': flat_id,
+        }
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (client_ref, created_at, payload, status) VALUES (?, ?, ?, ?)",
+                (client_ref, created_at, json.dumps(payload), 'held' if held else 'pending')
+            )
+            return JournalEntry(cursor.lastrowid, client_ref, created_at, payload)
+
+    def pending(self, limit=25):
+        """The oldest unsynced entries (pending or approved), in the order they were taken."""
+        return self._entries("status IN ('pending', 'approved')", limit)
+
+    def shortages(self, limit=100):
+        """Entries waiting for review after the database found too little stock for them."""
+        return self._entries("status = 'short'", limit)
+
+    def _entries(self, where, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, client_ref, created_at, payload, attempts, status, note FROM journal "
+                f"WHERE {where} ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [JournalEntry(seq, ref, created, json.loads(payload), attempts, status == 'approved', note)
+                for seq, ref, created, payload, attempts, status, note in rows]
+
+    def mark_synced(self, seq, sale_id, note=None):
+        self._set(seq, "status = 'synced', sale_id = ?, note = ?", (sale_id, note))
+
+    def mark_failed(self, seq, error):
+        self._set(seq, "attempts = attempts + 1, note = ?", (str(error),))
+
+    def mark_rejected(self, seq, error):
+        self._set(seq, "status = 'rejected', attempts = attempts + 1, note = ?", (str(error),))
+
+    def mark_short(self, seq, shortage):
+        self._set(seq, "status = 'short', note = ?", (str(shortage),))
+
+    def approve(self, seq, note=None):
+        """Clears a short entry to be written without the stock check. False if it was no longer short."""
+        return self._move(seq, 'short', 'approved', note)
+
+    def release(self, seq, note=None):
+        """Hands a held entry to the replicator. False if it was no longer held."""
+        return self._move(seq, 'held', 'pending', note)
+
+    def void(self, seq, note=None, status='held'):
+        """Cancels a held (or short) entry whose sale did not go ahead. False if it had moved on."""
+        return self._move(seq, status, 'voided', note)
+
+    def release_held(self):
+        """Releases entries left held by a crash mid-checkout; their outcome is unknown, so they are synced."""
+        with self._lock:
+            return self._conn.execute("UPDATE journal SET status = 'pending' WHERE status = 'held'").rowcount
+
+    def _set(self, seq, assignments, params):
+        with self._lock:
+            self._conn.execute(f"UPDATE journal SET {assignments} WHERE seq = ?", (*params, seq))
+
+    def _move(self, seq, from_status, to_status, note):
+        # Conditional, so the counter and a timed-out confirmation cannot both decide an entry's fate
+        with self._lock:
+            cursor = self._conn.execute("UPDATE journal SET status = ?, note = COALESCE(?, note) "
+                                        "WHERE seq = ? AND status = ?", (to_status, note, seq, from_status))
+            return cursor.rowcount == 1
+
+    def status(self, seq):
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM journal WHERE seq = ?", (seq,)).fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        """Returns {'pending': n, 'synced': n, 'rejected': n, 'held': n, 'voided': n, 'short': n, 'approved': n}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall()
+        counts = {'pending': 0, 'synced': 0, 'rejected': 0, 'held': 0, 'voided': 0, 'short': 0, 'approved': 0}
+        counts.update(rows)
+        return counts
+
+    def backlog(self):
+        counts = self.counts()
+        return counts['pending'] + counts['approved']
+
+    def prune(self, keep_days=90):
+        """Forgets synced and voided entries older than `keep_days`; unsynced ones are always kept."""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=keep_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute("DELETE FROM journal WHERE status IN ('synced', 'voided') AND created_at < ?",
+                               (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JournalReplicator:
+    """
+    Background thread that drains a SaleJournal into the database in batches.
+
+    `connect()` must return a connection usable as a context manager (a pooled connection), which
+    is passed to `commit` (sales.commit_sale, or ServiceClient.commit_sale for a thin-client terminal).
+    Errors for which `is_transient(err)` is true (server down, pool exhausted, deadlock) stop the
+    batch and retry with exponential backoff; any other error counts as an attempt against that
+    entry, which is rejected after `max_attempts`. A sale the guarded commit finds a shortage for
+    is never forced past the stock check here: it is marked 'short' for review at the counter, and
+    only an approved entry is written without the guard.
+
+    `on_change(counts)` and `on_rejected(entry, err)` are called on the replicator thread.
+    """
+
+    def __init__(self, journal, connect, is_transient, batch_size=25, interval=5.0,
+                 min_backoff=1.0, max_backoff=60.0, max_attempts=5, on_change=None, on_rejected=None,
+                 commit=sales.commit_sale):
+        self.journal = journal
+        self.connect = connect
+        self.commit = commit
+        self.is_transient = is_transient
+        self.batch_size = batch_size
+        self.interval = interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.on_change = on_change
+        self.on_rejected = on_rejected
+
+        self.last_error = None
+        self._backoff = 0.0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="journal-replicator", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        """Asks for a sync now instead of at the next interval (e.g. right after a sale)."""
+        self._wake.set()
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping:
+            more = self._sync_batch()
+            if self.on_change:
+                self.on_change(self.journal.counts())
+            if more and not self._backoff:
+                continue
+            self._wake.wait(self._backoff or self.interval)
+            self._wake.clear()
+
+    def _sync_batch(self):
+        """Pushes one batch. Returns True if a full batch went through and more may be waiting."""
+        entries = self.journal.pending(self.batch_size)
+        if not entries:
+            return False
+        try:
+            with self.connect() as conn:
+                for entry in entries:
+                    if self._stopping:
+                        return False
+                    self._sync_entry(conn, entry)
+        except Exception as err:
+            # Transient errors from _sync_entry, or no connection at all: keep everything pending
+            self.last_error = err
+            self._backoff = min(max(self._backoff * 2, self.min_backoff), self.max_backoff)
+            return False
+        self.last_error = None
+        self._backoff = 0.0
+        return len(entries) == self.batch_size
+
+    def _sync_entry(self, conn, entry):
+        args = (conn, entry.lines, entry.total_amount, entry.gst_amount, entry.payment_method, entry.flat_id)
+        try:
+            result = self.commit(*args, client_ref=entry.client_ref, sale_date=entry.created_at,
+                                 enforce_stock=not entry.approved)
+        except InsufficientStockError as shortage:
+            self.journal.mark_short(entry.seq, shortage)
+            return
+        except Exception as err:
+            if self.is_transient(err):
+                raise
+            if entry.attempts + 1 >= self.max_attempts:
+                self.journal.mark_rejected(entry.seq, err)
+                if self.on_rejected:
+                    self.on_rejected(entry, err)
+            else:
+                self.journal.mark_failed(entry.seq, err)
+            return
+        self.journal.mark_synced(entry.seq, result.sale_id, entry.note if entry.approved else None)
@@ -0,0 +1,213 @@
+import datetime
+from decimal import Decimal
+
+# FlatLedger is the append-only history of each flat's credit account: a 'charge' row per credit
+# sale, a 'payment' row (negative amount) per payment received and 'opening' rows for balances
+# carried over from before the ledger existed. Rows are only ever inserted, so two lanes selling
+# on credit to the same flat no longer queue on its Flats row.
+#
+# FlatBalanceSnapshots holds every flat's balance at the start of each month (the sum of its
+# entries dated before `as_of`). A balance is the newest snapshot plus the entries since, so
+# balances, statements and aging read about a month of entries through an index instead of the
+# whole history. Entries are dated when they are posted, never back-dated (a journaled sale
+# replayed after midnight is charged on the day it reached the database), so a snapshot, once
+# taken, stays true.
+
+CHARGE, PAYMENT, OPENING = 'charge', 'payment', 'opening'
+AGING_BUCKETS = (30, 60, 90)  # days; anything older is reported in a final "over 90" bucket
+
+_INSERT_SNAPSHOT = {
+    "mysql": "INSERT IGNORE INTO FlatBalanceSnapshots (flat_id, as_of, balance) VALUES (%s, %s, %s)",
+    "sqlite": "INSERT OR IGNORE INTO FlatBalanceSnapshots (flat_id, as_of, balance) VALUES (%s, %s, %s)",
+}
+
+_CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(_CENT)
+
+
+def _day(value):
+    """'YYYY-MM-DD' for a date, a datetime or a timestamp string."""
+    if isinstance(value, str):
+        return value[:10]
+    return value.strftime("%Y-%m-%d")
+
+
+def _in(column, ids):
+    return f"{column} IN ({', '.join(['%s'] * len(ids))})"
+
+
+def month_start(day=None):
+    return (day or datetime.date.today()).replace(day=1)
+
+
+def labels():
+    """Column titles for the aging buckets, e.g. ['0-30', '31-60', '61-90', '90+']."""
+    bounds = (0,) + AGING_BUCKETS
+    return [f"{low + 1 if low else 0}-{high}" for low, high in zip(bounds, AGING_BUCKETS)] + [f"{AGING_BUCKETS[-1]}+"]
+
+
+def add_entry(cursor, flat_id, kind, amount, sale_id=None, note=None):
+    """Appends one entry dated now; charges are positive, payments negative. The caller commits."""
+    cursor.execute(
+        "INSERT INTO FlatLedger (flat_id, entry_date, kind, amount, sale_id, note) VALUES (%s, %s, %s, %s, %s, %s)",
+        (flat_id, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), kind, amount, sale_id, note)
+    )
+
+
+def latest_snapshot(cursor, on_or_before=None):
+    """The as_of day ('YYYY-MM-DD') of the newest snapshot, optionally no later than a date; None if none."""
+    if on_or_before is None:
+        cursor.execute("SELECT MAX(as_of) FROM FlatBalanceSnapshots")
+    else:
+        cursor.execute("SELECT MAX(as_of) FROM FlatBalanceSnapshots WHERE as_of <= %s", (_day(on_or_before),))
+    as_of = cursor.fetchone()[0]
+    return _day(as_of) if as_of else None
+
+
+def balances(cursor, flat_ids=None, as_of=None):
+    """
+    {flat_id: balance} at the start of day `as_of` (a date), or now. Limited to `flat_ids` if given;
+    flats that never had an entry are left out.
+    """
+    ids = None if flat_ids is None else list(flat_ids)
+    if ids == []:
+        return {}
+    snapshot = latest_snapshot(cursor, as_of)
+    result = {}
+
+    if snapshot:
+        where, params = ["as_of = %s"], [snapshot]
+        if ids:
+            where.append(_in("flat_id", ids))
+            params += ids
+        cursor.execute(f"SELECT flat_id, balance FROM FlatBalanceSnapshots WHERE {' AND '.join(where)}", params)
+        for flat_id, balance in cursor.fetchall():
+            result[flat_id] = _money(balance)
+
+    where, params = [], []
+    if snapshot:
+        where.append("entry_date >= %s")
+        params.append(snapshot)
+    if as_of is not None:
+        where.append("entry_date < %s")
+        params.append(_day(as_of))
+    if ids:
+        where.append(_in("flat_id", ids))
+        params += ids
+    cursor.execute(f"SELECT flat_id, SUM(amount) FROM FlatLedger "
+                   f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY flat_id", params)
+    for flat_id, total in cursor.fetchall():
+        result[flat_id] = result.get(flat_id, Decimal('0.00')) + _money(total)
+    return result
+
+
+def balances_query(cursor):
+    """
+    (sql, params) of a derived table (flat_id, balance) holding every flat's current balance: the
+    set-based form of balances(), for queries that join, filter or sort on the balance.
+    """
+    snapshot = latest_snapshot(cursor)
+    if snapshot is None:
+        return "SELECT flat_id, SUM(amount) AS balance FROM FlatLedger GROUP BY flat_id", []
+    return ("""
+        SELECT flat_id, SUM(amount) AS balance FROM (
+            SELECT flat_id, balance AS amount FROM FlatBalanceSnapshots WHERE as_of = %s
+            UNION ALL
+            SELECT flat_id, amount FROM FlatLedger WHERE entry_date >= %s
+        ) parts GROUP BY flat_id
+    """, [snapshot, snapshot])
+
+
+def statement(cursor, flat_id, start, end):
+    """Opening balance, the entries dated in [start, end) and the closing balance of one flat."""
+    opening = balances(cursor, [flat_id], as_of=start).get(flat_id, Decimal('0.00'))
+    cursor.execute("""
+        SELECT entry_date, kind, amount, sale_id, note FROM FlatLedger
+        WHERE flat_id = %s AND entry_date >= %s AND entry_date < %s
+        ORDER BY entry_date, entry_id
+    """, (flat_id, _day(start), _day(end)))
+    entries = [{'entry_date': entry_date, 'kind': kind, 'amount': _money(amount), 'sale_id': sale_id, 'note': note}
+               for entry_date, kind, amount, sale_id, note in cursor.fetchall()]
+    closing = opening + sum((entry['amount'] for entry in entries), Decimal('0.00'))
+    return {'flat_id': flat_id, 'start': start, 'end': end, 'opening': opening, 'entries': entries,
+            'closing': closing}
+
+
+def aging(cursor, today=None):
+    """
+    Outstanding balances split by the age of the charges behind them, newest charges first (payments
+    settle the oldest debt). One row per flat that owes money:
+    {'flat_id', 'balance', 'buckets': [amount per labels() column]}.
+    """
+    today = today or datetime.date.today()
+    owed = {flat_id: balance for flat_id, balance in balances(cursor).items() if balance > 0}
+    if not owed:
+        return []
+    cursor.execute("""
+        SELECT flat_id, entry_date, amount FROM FlatLedger
+        WHERE entry_date >= %s AND kind = %s
+        ORDER BY entry_date DESC
+    """, ((today - datetime.timedelta(days=AGING_BUCKETS[-1])).isoformat(), CHARGE))
+    recent = {}
+    for flat_id, entry_date, amount in cursor.fetchall():
+        if flat_id in owed:
+            recent.setdefault(flat_id, []).append((entry_date, _money(amount)))
+
+    rows = []
+    for flat_id, balance in owed.items():
+        buckets = [Decimal('0.00')] * (len(AGING_BUCKETS) + 1)
+        left = balance
+        for entry_date, amount in recent.get(flat_id, ()):
+            if left <= 0:
+                break
+            age = (today - datetime.date.fromisoformat(_day(entry_date))).days
+            slot = next((i for i, limit in enumerate(AGING_BUCKETS) if age <= limit), len(AGING_BUCKETS))
+            buckets[slot] += min(amount, left)
+            left -= min(amount, left)
+        buckets[-1] += left  # owed from before the window, or brought forward
+        rows.append({'flat_id': flat_id, 'balance': balance, 'buckets': buckets})
+    return rows
+
+
+def take_snapshot(cursor, dialect, as_of):
+    """Records every flat's balance at the start of `as_of`. Returns the rows written (0 if already taken)."""
+    cursor.execute("SELECT COUNT(*) FROM FlatBalanceSnapshots WHERE as_of = %s", (_day(as_of),))
+    if cursor.fetchone()[0]:
+        return 0
+    opening = balances(cursor, as_of=as_of)
+    cursor.execute("SELECT flat_id FROM Flats")
+    rows = [(flat_id, _day(as_of), opening.get(flat_id, Decimal('0.00'))) for flat_id, in cursor.fetchall()]
+    # Two terminals may take the same snapshot at once; they compute the same balances
+    cursor.executemany(_INSERT_SNAPSHOT[dialect], rows)
+    return len(rows)
+
+
+def due_snapshot(today=None):
+    """The month start to snapshot next: the current one once it is a day old, so late entries have landed."""
+    return month_start((today or datetime.date.today()) - datetime.timedelta(days=1))
+
+
+def backfill(cursor):
+    """
+    Charges for every credit sale, at its sale date, plus an 'opening' entry per flat for whatever
+    Flats.credit_balance adds to them (payments made before the ledger). The caller commits.
+    """
+    charge_credit_sales(cursor)
+    charged = balances(cursor)
+    cursor.execute("SELECT flat_id, credit_balance FROM Flats")
+    for flat_id, credit_balance in cursor.fetchall():
+        difference = _money(credit_balance) - charged.get(flat_id, Decimal('0.00'))
+        if difference:
+            add_entry(cursor, flat_id, OPENING, difference, note="Balance brought forward")
+
+
+def charge_credit_sales(cursor):
+    """Inserts a charge for every credit sale, dated at the sale."""
+    cursor.execute("""
+        INSERT INTO FlatLedger (flat_id, entry_date, kind, amount, sale_id, note)
+        SELECT flat_id, sale_date, %s, total_amount, sale_id, NULL
+        FROM Sales WHERE payment_method = 'Credit' AND flat_id IS NOT NULL
+    """, (CHARGE,))
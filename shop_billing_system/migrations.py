@@ -0,0 +1,476 @@
+import datetime
+
+import ledger
+import rollup
+
+# Schema changes are numbered migrations recorded in SchemaVersion. migrate() compares the
+# recorded version with the newest one here and runs only what is missing, so a terminal starting
+# against an up-to-date database issues no DDL at all. Each migration receives a cursor and the
+# dialect ('mysql' or 'sqlite') and must be safe to re-run: a database created by a version of
+# the app that predates SchemaVersion starts at version 0 and runs them all against its tables.
+#
+# To change the schema, append a new migration; never edit one that has shipped.
+
+MIGRATIONS = []  # (version, description, function), in order
+
+
+def migration(version, description):
+    def register(fn):
+        assert not MIGRATIONS or MIGRATIONS[-1][0] < version, "migrations must be added in order"
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+# --- Helpers for migrations ---
+def table_exists(cursor, dialect, table):
+    if dialect == "sqlite":
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+    else:
+        cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() "
+                       "AND TABLE_NAME = %s", (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, dialect, table, column):
+    if dialect == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute("SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                   "AND TABLE_NAME = %s AND COLUMN_NAME = %s", (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, dialect, table, index):
+    if dialect == "sqlite":
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", (index,))
+    else:
+        cursor.execute("SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() "
+                       "AND TABLE_NAME = %s AND INDEX_NAME = %s", (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def alter_online(cursor, dialect, table, clause):
+    """
+    ALTER TABLE that keeps the table readable and writable on MySQL (online DDL) so a migration
+    can run while other terminals are selling. Falls back to a plain ALTER when the change cannot
+    be made in place (MySQL then copies the table).
+    """
+    if dialect == "sqlite":
+        cursor.execute(f"ALTER TABLE {table} {clause}")
+        return
+    try:
+        cursor.execute(f"ALTER TABLE {table} {clause}, ALGORITHM=INPLACE, LOCK=NONE")
+    except Exception as err:
+        if getattr(err, 'errno', None) not in (1845, 1846):  # operation not supported in place / with LOCK=NONE
+            raise
+        cursor.execute(f"ALTER TABLE {table} {clause}")
+
+
+def add_column(cursor, dialect, table, column, definition):
+    """Adds a column unless it is already there. Returns True if it was added."""
+    if column_exists(cursor, dialect, table, column):
+        return False
+    alter_online(cursor, dialect, table, f"ADD COLUMN {column} {definition}")
+    return True
+
+
+def add_index(cursor, dialect, table, index, columns):
+    """Adds a secondary index unless it is already there."""
+    if index_exists(cursor, dialect, table, index):
+        return
+    if dialect == "sqlite":
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    else:
+        alter_online(cursor, dialect, table, f"ADD INDEX {index} ({columns})")
+
+
+# --- Migrations ---
+@migration(1, "base tables")
+def _base_tables(cursor, dialect):
+    if dialect == "sqlite":
+        # Timestamps are stored as local 'YYYY-MM-DD HH:MM:SS' text, like MySQL's TIMESTAMP in the
+        # server's time zone, so date filters and DATE() grouping behave the same on both engines.
+        # Products.last_updated keeps milliseconds so the catalog's "changed since" check sees every write.
+        statements = [
+            """
+            CREATE TABLE IF NOT EXISTS ShopInfo (
+                id INTEGER PRIMARY KEY,
+                shop_name TEXT DEFAULT 'Your Shop Name',
+                address TEXT DEFAULT 'Your Address',
+                phone TEXT DEFAULT 'Your Phone Number',
+                gst_number TEXT DEFAULT 'Your GSTIN',
+                current_gst_rate NUMERIC DEFAULT 18.00
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Flats (
+                flat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                flat_number TEXT NOT NULL UNIQUE,
+                resident_name TEXT,
+                credit_balance NUMERIC NOT NULL DEFAULT 0.00
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Products (
+                product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT UNIQUE,
+                name TEXT NOT NULL,
+                price NUMERIC NOT NULL,
+                stock_quantity INTEGER NOT NULL DEFAULT 0,
+                last_updated TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_products_last_updated ON Products (last_updated)",
+            # Stand-in for MySQL's ON UPDATE CURRENT_TIMESTAMP
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_last_updated AFTER UPDATE ON Products
+            FOR EACH ROW WHEN NEW.last_updated = OLD.last_updated
+            BEGIN
+                UPDATE Products SET last_updated = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+                WHERE product_id = NEW.product_id;
+            END
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Sales (
+                sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_date TEXT DEFAULT (datetime('now', 'localtime')),
+                total_amount NUMERIC NOT NULL,
+                gst_amount NUMERIC NOT NULL,
+                payment_method TEXT NOT NULL,
+                flat_id INTEGER REFERENCES Flats (flat_id),
+                client_ref TEXT UNIQUE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS SaleItems (
+                sale_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_id INTEGER NOT NULL REFERENCES Sales (sale_id),
+                product_id INTEGER NOT NULL REFERENCES Products (product_id),
+                quantity_sold INTEGER NOT NULL,
+                price_at_sale NUMERIC NOT NULL
+            )
+            """,
+        ]
+    else:
+        statements = [
+            """
+            CREATE TABLE IF NOT EXISTS ShopInfo (
+                id INT PRIMARY KEY,
+                shop_name VARCHAR(255) DEFAULT 'Your Shop Name',
+                address VARCHAR(255) DEFAULT 'Your Address',
+                phone VARCHAR(50) DEFAULT 'Your Phone Number',
+                gst_number VARCHAR(50) DEFAULT 'Your GSTIN',
+                current_gst_rate DECIMAL(5, 2) DEFAULT 18.00
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Flats (
+                flat_id INT AUTO_INCREMENT PRIMARY KEY,
+                flat_number VARCHAR(50) NOT NULL UNIQUE,
+                resident_name VARCHAR(255),
+                credit_balance DECIMAL(10, 2) NOT NULL DEFAULT 0.00
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Products (
+                product_id INT AUTO_INCREMENT PRIMARY KEY,
+                barcode VARCHAR(255) UNIQUE,
+                name VARCHAR(255) NOT NULL,
+                price DECIMAL(10, 2) NOT NULL,
+                stock_quantity INT NOT NULL DEFAULT 0,
+                last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_products_last_updated (last_updated)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS Sales (
+                sale_id INT AUTO_INCREMENT PRIMARY KEY,
+                sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                total_amount DECIMAL(10, 2) NOT NULL,
+                gst_amount DECIMAL(10, 2) NOT NULL,
+                payment_method VARCHAR(50) NOT NULL,
+                flat_id INT,
+                client_ref VARCHAR(32) UNIQUE,
+                FOREIGN KEY (flat_id) REFERENCES Flats (flat_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS SaleItems (
+                sale_item_id INT AUTO_INCREMENT PRIMARY KEY,
+                sale_id INT NOT NULL,
+                product_id INT NOT NULL,
+                quantity_sold INT NOT NULL,
+                price_at_sale DECIMAL(10, 2) NOT NULL,
+                FOREIGN KEY (sale_id) REFERENCES Sales(sale_id),
+                FOREIGN KEY (product_id) REFERENCES Products(product_id)
+            );
+            """,
+        ]
+    for statement in statements:
+        cursor.execute(statement)
+
+    # Databases created before the catalog cache need the change-tracking column
+    if add_column(cursor, dialect, "Products", "last_updated",
+                  "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"):
+        add_index(cursor, dialect, "Products", "idx_products_last_updated", "last_updated")
+    # ...and the journal's idempotency key, so a replayed sale is never written twice
+    add_column(cursor, dialect, "Sales", "client_ref", "VARCHAR(32) NULL UNIQUE")
+
+    # Add default ShopInfo if it doesn't exist
+    cursor.execute("SELECT COUNT(*) FROM ShopInfo")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("INSERT INTO ShopInfo (id) VALUES (1)")
+
+    # Add sample flats for testing if none exist
+    cursor.execute("SELECT COUNT(*) FROM Flats")
+    if cursor.fetchone()[0] == 0:
+        sample_flats = [(f"A-{101+i}", f"Resident {i+1}") for i in range(10)]
+        cursor.executemany("INSERT INTO Flats (flat_number, resident_name) VALUES (%s, %s)", sample_flats)
+
+
+@migration(2, "daily sales rollup")
+def _daily_sales_rollup(cursor, dialect):
+    if dialect == "sqlite":
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ProductDailySales (
+                product_id INTEGER NOT NULL,
+                sale_day TEXT NOT NULL,
+                units INTEGER NOT NULL DEFAULT 0,
+                revenue NUMERIC NOT NULL DEFAULT 0.00,
+                gst NUMERIC NOT NULL DEFAULT 0.00,
+                sale_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (product_id, sale_day)
+            ) WITHOUT ROWID
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ProductDailySales (
+                product_id INT NOT NULL,
+                sale_day DATE NOT NULL,
+                units INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+                gst DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+                sale_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (product_id, sale_day)
+            );
+        """)
+    # Covers the catalog's "units per product over the last N days" popularity query
+    add_index(cursor, dialect, "ProductDailySales", "idx_daily_sales_day", "sale_day, product_id, units")
+    # Existing sales are summarised once; from here on commit_sale keeps the rollup current
+    cursor.execute("SELECT COUNT(*) FROM ProductDailySales")
+    if cursor.fetchone()[0] == 0:
+        rollup.fill(cursor)
+
+
+@migration(3, "indexes for report, delete and lookup queries")
+def _hot_query_indexes(cursor, dialect):
+    # Date-range filters on sales (exports, rollup rebuilds, statements)
+    add_index(cursor, dialect, "Sales", "idx_sales_date", "sale_date")
+    # "Has this product ever been sold?" before a delete, and per-product joins to Sales
+    add_index(cursor, dialect, "SaleItems", "idx_sale_items_product_sale", "product_id, sale_id")
+    # In-stock product listings ordered by name
+    add_index(cursor, dialect, "Products", "idx_products_stock_name", "stock_quantity, name")
+    # Flat search by resident
+    add_index(cursor, dialect, "Flats", "idx_flats_resident_name", "resident_name")
+
+
+@migration(4, "millisecond Products.last_updated")
+def _products_last_updated_ms(cursor, dialect):
+    # Second resolution let two edits in the same second look like one to the catalog's refresh().
+    # SQLite already stores milliseconds.
+    if dialect == "mysql":
+        alter_online(cursor, dialect, "Products",
+                     "MODIFY last_updated TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) "
+                     "ON UPDATE CURRENT_TIMESTAMP(3)")
+
+
+@migration(5, "change log for terminal notifications")
+def _change_log(cursor, dialect):
+    # Triggers record every product, flat and shop-settings change, whoever makes it, so each
+    # terminal can poll for just the rows changed since the last sequence number it saw.
+    if dialect == "sqlite":
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ChangeLog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'))
+            )
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ChangeLog (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                entity VARCHAR(16) NOT NULL,
+                entity_id INT NOT NULL,
+                changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    add_index(cursor, dialect, "ChangeLog", "idx_change_log_changed_at", "changed_at")
+
+    triggers = [
+        ("trg_products_log_insert", "INSERT", "Products", "product", "NEW.product_id", None),
+        # On SQLite every change ends with trg_products_last_updated stamping the row; log that one only
+        ("trg_products_log_update", "UPDATE", "Products", "product", "NEW.product_id",
+         "NEW.last_updated IS NOT OLD.last_updated"),
+        ("trg_products_log_delete", "DELETE", "Products", "product", "OLD.product_id", None),
+        ("trg_flats_log_insert", "INSERT", "Flats", "flat", "NEW.flat_id", None),
+        ("trg_flats_log_update", "UPDATE", "Flats", "flat", "NEW.flat_id", None),
+        ("trg_flats_log_delete", "DELETE", "Flats", "flat", "OLD.flat_id", None),
+        ("trg_shop_info_log_update", "UPDATE", "ShopInfo", "shop", "NEW.id", None),
+    ]
+    for name, event, table, entity, key, sqlite_when in triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        insert = f"INSERT INTO ChangeLog (entity, entity_id) VALUES ('{entity}', {key})"
+        if dialect == "sqlite":
+            when = f" WHEN {sqlite_when}" if sqlite_when else ""
+            cursor.execute(f"CREATE TRIGGER {name} AFTER {event} ON {table} FOR EACH ROW{when} BEGIN {insert}; END")
+        else:
+            cursor.execute(f"CREATE TRIGGER {name} AFTER {event} ON {table} FOR EACH ROW {insert}")
+
+
+@migration(6, "flat credit ledger and monthly balance snapshots")
+def _flat_ledger(cursor, dialect):
+    # Flats.credit_balance is no longer written; balances come from the ledger (see ledger.py)
+    if dialect == "sqlite":
+        statements = [
+            """
+            CREATE TABLE IF NOT EXISTS FlatLedger (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                flat_id INTEGER NOT NULL,
+                entry_date TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                amount NUMERIC NOT NULL,
+                sale_id INTEGER,
+                note TEXT,
+                FOREIGN KEY (flat_id) REFERENCES Flats (flat_id),
+                FOREIGN KEY (sale_id) REFERENCES Sales (sale_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS FlatBalanceSnapshots (
+                flat_id INTEGER NOT NULL,
+                as_of TEXT NOT NULL,
+                balance NUMERIC NOT NULL,
+                PRIMARY KEY (as_of, flat_id)
+            ) WITHOUT ROWID
+            """,
+        ]
+    else:
+        statements = [
+            """
+            CREATE TABLE IF NOT EXISTS FlatLedger (
+                entry_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                flat_id INT NOT NULL,
+                entry_date DATETIME NOT NULL,
+                kind VARCHAR(16) NOT NULL,
+                amount DECIMAL(10, 2) NOT NULL,
+                sale_id INT NULL,
+                note VARCHAR(255) NULL,
+                FOREIGN KEY (flat_id) REFERENCES Flats (flat_id),
+                FOREIGN KEY (sale_id) REFERENCES Sales (sale_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS FlatBalanceSnapshots (
+                flat_id INT NOT NULL,
+                as_of DATE NOT NULL,
+                balance DECIMAL(12, 2) NOT NULL,
+                PRIMARY KEY (as_of, flat_id)
+            )
+            """,
+        ]
+    for statement in statements:
+        cursor.execute(statement)
+    # One flat's entries over a period (statements), and per-flat sums since a snapshot
+    add_index(cursor, dialect, "FlatLedger", "idx_flat_ledger_flat_date", "flat_id, entry_date, amount")
+    # Every flat's entries since a snapshot or within the aging window, without touching the table
+    add_index(cursor, dialect, "FlatLedger", "idx_flat_ledger_date", "entry_date, kind, flat_id, amount")
+
+    # A ledger entry changes the flat's balance, so terminals must hear about it like a Flats update
+    cursor.execute("DROP TRIGGER IF EXISTS trg_flat_ledger_log_insert")
+    insert = "INSERT INTO ChangeLog (entity, entity_id) VALUES ('flat', NEW.flat_id)"
+    if dialect == "sqlite":
+        cursor.execute(f"CREATE TRIGGER trg_flat_ledger_log_insert AFTER INSERT ON FlatLedger FOR EACH ROW "
+                       f"BEGIN {insert}; END")
+    else:
+        cursor.execute(f"CREATE TRIGGER trg_flat_ledger_log_insert AFTER INSERT ON FlatLedger FOR EACH ROW {insert}")
+
+    cursor.execute("SELECT COUNT(*) FROM FlatLedger")
+    if cursor.fetchone()[0] == 0:
+        ledger.backfill(cursor)
+        ledger.take_snapshot(cursor, dialect, ledger.due_snapshot())
+
+
+@migration(7, "indexes for sorted inventory pages")
+def _inventory_sort_indexes(cursor, dialect):
+    # The Inventory window reads one keyset page at a time in the order of the clicked column;
+    # each index (plus the primary key it carries) lets a page seek instead of sorting the table
+    add_index(cursor, dialect, "Products", "idx_products_name", "name")
+    add_index(cursor, dialect, "Products", "idx_products_price", "price")
+    add_index(cursor, dialect, "Products", "idx_products_stock", "stock_quantity")
+
+
+# --- Running migrations ---
+def current_version(cursor, dialect):
+    if not table_exists(cursor, dialect, "SchemaVersion"):
+        return 0
+    cursor.execute("SELECT MAX(version) FROM SchemaVersion")
+    return cursor.fetchone()[0] or 0
+
+
+def migrate(conn, dialect, log=print):
+    """
+    Brings the schema up to latest_version(). Returns the list of versions applied (empty when the
+    database was already current, in which case only the version check ran).
+
+    Several terminals may start at once: MySQL serialises them with a named lock, SQLite with an
+    immediate transaction per migration, and each re-reads the version once it holds the lock.
+    """
+    cursor = conn.cursor()
+    try:
+        if current_version(cursor, dialect) >= latest_version():
+            conn.rollback()
+            return []
+
+        if dialect == "mysql":
+            cursor.execute("SELECT GET_LOCK('society_store_migrations', 60)")
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Another terminal is upgrading the database; try again shortly.")
+        conn.rollback()  # re-read the version outside the snapshot taken before the lock was held
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS SchemaVersion (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at VARCHAR(19) NOT NULL
+                )
+            """)
+            applied = []
+            for version, description, fn in MIGRATIONS:
+                if dialect == "sqlite":
+                    cursor.execute("BEGIN IMMEDIATE")
+                if version <= current_version(cursor, dialect):
+                    conn.rollback()
+                    continue
+                log(f"Applying schema migration {version}: {description}...")
+                fn(cursor, dialect)
+                cursor.execute("INSERT INTO SchemaVersion (version, description, applied_at) VALUES (%s, %s, %s)",
+                               (version, description, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+                applied.append(version)
+            return applied
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if dialect == "mysql":
+                cursor.execute("SELECT RELEASE_LOCK('society_store_migrations')")
+                cursor.fetchone()
+    finally:
+        cursor.close()
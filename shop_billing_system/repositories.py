@@ -0,0 +1,352 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+import ledger
+import rollup
+from storage import dialect_of
+
+
+def days_ago(days):
+    """Start of the day `days` days back, as a parameter both MySQL and SQLite compare correctly."""
+    return (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+
+
+# Bulk product upsert keyed on the unique barcode: [dialect][add_stock]
+_PRODUCT_UPSERT = {
+    "mysql": {
+        False: """
+            INSERT INTO Products (barcode, name, price, stock_quantity) VALUES {values}
+            ON DUPLICATE KEY UPDATE name = VALUES(name), price = VALUES(price),
+                stock_quantity = VALUES(stock_quantity)
+        """,
+        True: """
+            INSERT INTO Products (barcode, name, price, stock_quantity) VALUES {values}
+            ON DUPLICATE KEY UPDATE name = VALUES(name), price = VALUES(price),
+                stock_quantity = stock_quantity + VALUES(stock_quantity)
+        """,
+    },
+    "sqlite": {
+        False: """
+            INSERT INTO Products (barcode, name, price, stock_quantity) VALUES {values}
+            ON CONFLICT (barcode) DO UPDATE SET name = excluded.name, price = excluded.price,
+                stock_quantity = excluded.stock_quantity
+        """,
+        True: """
+            INSERT INTO Products (barcode, name, price, stock_quantity) VALUES {values}
+            ON CONFLICT (barcode) DO UPDATE SET name = excluded.name, price = excluded.price,
+                stock_quantity = stock_quantity + excluded.stock_quantity
+        """,
+    },
+}
+
+
+# Columns the Inventory and Flats tables can be sorted by -> ORDER BY expression. Nullable text is
+# sorted as '' so that keyset comparisons never meet a NULL.
+_PRODUCT_SORTS = {
+    'product_id': "product_id", 'barcode': "COALESCE(barcode, '')", 'name': "name",
+    'price': "price", 'stock_quantity': "stock_quantity",
+}
+_FLAT_SORTS = {
+    'flat_id': "flat_id", 'flat_number': "flat_number", 'resident_name': "COALESCE(resident_name, '')",
+    'credit_balance': "credit_balance",
+}
+
+
+def _keyset_page(select, params, sorts, key, sort, descending, after, limit):
+    """
+    (sql, params) for one page of `select` (a query without WHERE or ORDER BY) in (sort, key) order.
+    `after` is (sort value, key) of the previous page's last row, so the database seeks straight to
+    the page through the sort index instead of counting past an OFFSET.
+    """
+    if sort not in sorts:
+        raise ValueError(f"Cannot sort by {sort!r}.")
+    expression = sorts[sort]
+    direction, beyond = ("DESC", "<") if descending else ("ASC", ">")
+    params = list(params)
+    where = ""
+    if after is not None:
+        value, last_key = after
+        value = "" if value is None else value
+        # The leading range condition is what lets both engines seek on the index
+        where = f" WHERE {expression} {beyond}= %s AND ({expression} {beyond} %s OR {key} {beyond} %s)"
+        params += [value, value, last_key]
+    return (f"{select}{where} ORDER BY {expression} {direction}, {key} {direction} LIMIT %s",
+            params + [limit])
+
+
+def _as_date(value):
+    # MySQL returns DATE() as datetime.date, SQLite as 'YYYY-MM-DD' text
+    return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+
+
+class _Repository:
+    """Base for the table gateways below; `get_connection()` returns a pooled connection."""
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+
+
+class ShopInfoRepository(_Repository):
+    def gst_rate(self):
+        with self._get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT current_gst_rate FROM ShopInfo WHERE id = 1")
+            result = cursor.fetchone()
+            cursor.close()
+        return result['current_gst_rate'] if result else None
+
+
+class ProductRepository(_Repository):
+    def __init__(self, get_connection, is_transient=None):
+        super().__init__(get_connection)
+        # Which upsert errors are the database's (unreachable, deadlock) rather than a bad row's
+        self._is_transient = is_transient or (lambda err: False)
+
+    def all_rows(self):
+        with self._get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT product_id, barcode, name, price, stock_quantity FROM Products")
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def page(self, sort='name', descending=False, after=None, limit=200):
+        """One keyset page of products ordered by `sort` (see _keyset_page)."""
+        sql, params = _keyset_page("SELECT product_id, barcode, name, price, stock_quantity FROM Products", [],
+                                   _PRODUCT_SORTS, "product_id", sort, descending, after, limit)
+        with self._get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def insert(self, res):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO Products (barcode, name, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                           (res['barcode'], res['name'], res['price'], res['stock']))
+            conn.commit()
+            product_id = cursor.lastrowid
+            cursor.close()
+        return {'product_id': product_id, 'barcode': res['barcode'], 'name': res['name'],
+                'price': res['price'], 'stock_quantity': res['stock']}
+
+    def update(self, res):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE Products SET barcode=%s, name=%s, price=%s, stock_quantity=%s WHERE product_id=%s",
+                           (res['barcode'], res['name'], res['price'], res['stock'], res['id']))
+            conn.commit()
+            cursor.close()
+        return {'product_id': int(res['id']), 'barcode': res['barcode'], 'name': res['name'],
+                'price': res['price'], 'stock_quantity': res['stock']}
+
+    def upsert_many(self, rows, add_stock=False, batch_size=200, attempts=3, backoff=0.05):
+        """
+        Inserts or updates (barcode, name, price, stock) rows by barcode in one transaction, with one
+        multi-row statement per `batch_size` rows. add_stock=True adds the stock to what is on hand
+        instead of replacing it. A transient failure (lock timeout, deadlock) retries the whole
+        transaction up to `attempts` times; a bad row is isolated by splitting the rows in halves, each
+        its own transaction, so the good rows still go in. Returns {'inserted', 'updated', 'errors':
+        [(row index, message)]}; raises if the database kept failing before any row went in.
+        """
+        rows = [tuple(row) for row in rows]
+        counts = {'inserted': 0, 'updated': 0, 'errors': []}
+        if not rows:
+            return counts
+        with self._get_connection() as conn:
+            dialect = dialect_of(conn)
+            cursor = conn.cursor()
+            try:
+                error = self._upsert_span(conn, cursor, dialect, rows, 0, add_stock, batch_size, attempts,
+                                          backoff, counts, whole=True)
+            finally:
+                cursor.close()
+        if error is not None:
+            raise error  # nothing went in because the database failed, not the rows
+        return counts
+
+    def _upsert_span(self, conn, cursor, dialect, rows, offset, add_stock, batch_size, attempts, backoff, counts,
+                     whole=False):
+        # Returns the transient error that sank the span when it is the whole input (nothing went in), else None
+        for attempt in range(attempts):
+            span = {'inserted': 0, 'updated': 0}
+            try:
+                for start in range(0, len(rows), batch_size):
+                    self._upsert_batch(cursor, dialect, rows[start:start + batch_size], add_stock, span)
+                conn.commit()
+            except Exception as err:
+                # After some errors (deadlocks) MySQL has already rolled back the whole transaction
+                conn.rollback()
+                error = err
+                if not self._is_transient(err):
+                    break
+                if attempt + 1 < attempts:
+                    time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            else:
+                counts['inserted'] += span['inserted']
+                counts['updated'] += span['updated']
+                return None
+
+        if self._is_transient(error):
+            if whole:
+                return error
+            counts['errors'].extend((offset + index, str(error)) for index in range(len(rows)))
+            return None
+        if len(rows) == 1:
+            counts['errors'].append((offset, str(error)))
+            return None
+        middle = len(rows) // 2
+        for part, part_offset in ((rows[:middle], offset), (rows[middle:], offset + middle)):
+            self._upsert_span(conn, cursor, dialect, part, part_offset, add_stock, batch_size, attempts,
+                              backoff, counts)
+        return None
+
+    @staticmethod
+    def _upsert_batch(cursor, dialect, batch, add_stock, counts):
+        barcodes = sorted({row[0] for row in batch})
+        cursor.execute(f"SELECT barcode FROM Products WHERE barcode IN ({', '.join(['%s'] * len(barcodes))})",
+                       barcodes)
+        existing = {barcode for barcode, in cursor.fetchall()}
+        values = ", ".join(["(%s, %s, %s, %s)"] * len(batch))
+        cursor.execute(_PRODUCT_UPSERT[dialect][add_stock].format(values=values),
+                       [value for row in batch for value in row])
+        # A barcode repeated in the batch is inserted once, then updated by its later rows
+        inserted = len(barcodes) - len(existing)
+        counts['inserted'] += inserted
+        counts['updated'] += len(batch) - inserted
+
+    def delete_unsold(self, product_id):
+        """Deletes a product unless it appears in a past sale. Returns False if it was kept."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT COUNT(*) FROM SaleItems WHERE product_id = %s", (product_id,))
+                if cursor.fetchone()[0] > 0:
+                    return False
+                cursor.execute("DELETE FROM Products WHERE product_id = %s", (product_id,))
+                conn.commit()
+                return True
+            finally:
+                cursor.close()
+
+
+class FlatRepository(_Repository):
+    def record_payment(self, flat_id, amount):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            ledger.add_entry(cursor, flat_id, ledger.PAYMENT, -Decimal(str(amount)))
+            conn.commit()
+            cursor.close()
+
+    def page(self, sort='credit_balance', descending=True, after=None, limit=200):
+        """One keyset page of flats with their ledger balance, ordered by `sort` (see _keyset_page)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                balances_sql, params = ledger.balances_query(cursor)
+                # ROUND keeps SQLite's float sums equal to the two-decimal values handed back as `after`
+                sql, params = _keyset_page(f"""
+                    SELECT * FROM (
+                        SELECT f.flat_id, f.flat_number, f.resident_name,
+                               CAST(ROUND(COALESCE(b.balance, 0), 2) AS DECIMAL(12, 2)) AS credit_balance
+                        FROM Flats f LEFT JOIN ({balances_sql}) b ON b.flat_id = f.flat_id
+                    ) flats""", params, _FLAT_SORTS, "flat_id", sort, descending, after, limit)
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            finally:
+                conn.rollback()
+                cursor.close()
+        return [{'flat_id': flat_id, 'flat_number': flat_number, 'resident_name': resident_name,
+                 'credit_balance': Decimal(str(balance)).quantize(Decimal('0.01'))}
+                for flat_id, flat_number, resident_name, balance in rows]
+
+    def statement(self, flat_id, start, end):
+        """Opening balance, entries dated in [start, end) and closing balance of one flat (see ledger.py)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                return ledger.statement(cursor, flat_id, start, end)
+            finally:
+                conn.rollback()
+                cursor.close()
+
+    def aging(self):
+        """Every flat that owes money, with its balance split into the ledger.labels() age buckets."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                return ledger.aging(cursor)
+            finally:
+                conn.rollback()
+                cursor.close()
+
+    def take_due_snapshot(self):
+        """Records the month-start balances if they are due and not yet taken. Returns the rows written."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                written = ledger.take_snapshot(cursor, dialect_of(conn), ledger.due_snapshot())
+                conn.commit()
+                return written
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+
+class ChangeLogRepository(_Repository):
+    def since(self, after_seq, limit=500):
+        """Change records with seq > after_seq, oldest first: [(seq, entity, entity_id)]."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT seq, entity, entity_id FROM ChangeLog WHERE seq > %s ORDER BY seq LIMIT %s",
+                           (after_seq, limit))
+            rows = [tuple(row) for row in cursor.fetchall()]
+            cursor.close()
+        return rows
+
+    def bounds(self):
+        """(oldest seq, newest seq) still in the log; (None, None) when it is empty."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(seq), MAX(seq) FROM ChangeLog")
+            first, last = cursor.fetchone()
+            cursor.close()
+        return first, last
+
+    def prune(self, keep_days=2):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM ChangeLog WHERE changed_at < %s", (days_ago(keep_days),))
+            conn.commit()
+            deleted = cursor.rowcount
+            cursor.close()
+        return deleted
+
+
+class SaleRepository(_Repository):
+    def product_daily_sales(self, product_id, days=30):
+        """Daily units, revenue and GST for one product over the last `days` days, from the rollup."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT sale_day, units AS total_quantity, revenue AS daily_revenue, gst, sale_count
+                FROM ProductDailySales
+                WHERE product_id = %s AND sale_day >= %s
+                ORDER BY sale_day
+            """, (product_id, days_ago(days)))
+            data = cursor.fetchall()
+            cursor.close()
+        for row in data:
+            row['sale_day'] = _as_date(row['sale_day'])
+        return data
+
+    def rebuild_rollup(self, since=None):
+        """Recomputes ProductDailySales from the raw sales (from `since`, a date, or entirely)."""
+        with self._get_connection() as conn:
+            return rollup.rebuild(conn, since)
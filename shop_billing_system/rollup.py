@@ -0,0 +1,103 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# ProductDailySales holds one row per product per day: units, revenue (before GST), the GST
+# collected on those units and the number of sales they appeared in. sales.commit_sale adds to it
+# in the same transaction as the sale, so reports read a few hundred rows instead of aggregating
+# the whole SaleItems table.
+
+_UPSERT = {
+    "mysql": """
+        INSERT INTO ProductDailySales (product_id, sale_day, units, revenue, gst, sale_count)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            units = units + VALUES(units),
+            revenue = revenue + VALUES(revenue),
+            gst = gst + VALUES(gst),
+            sale_count = sale_count + VALUES(sale_count)
+    """,
+    "sqlite": """
+        INSERT INTO ProductDailySales (product_id, sale_day, units, revenue, gst, sale_count)
+        VALUES {values}
+        ON CONFLICT (product_id, sale_day) DO UPDATE SET
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue,
+            gst = gst + excluded.gst,
+            sale_count = sale_count + excluded.sale_count
+    """,
+}
+
+_CENT = Decimal('0.01')
+
+
+def sale_day_of(sale_date):
+    """The calendar day of a sale timestamp (datetime or 'YYYY-MM-DD HH:MM:SS' text)."""
+    if isinstance(sale_date, str):
+        return sale_date[:10]
+    return sale_date.strftime("%Y-%m-%d")
+
+
+def split_gst(lines, gst_amount):
+    """Shares a sale's GST between its (product_id, quantity, unit_price) lines in proportion to their value."""
+    totals = [Decimal(str(price)) * qty for _, qty, price in lines]
+    subtotal = sum(totals)
+    gst_amount = Decimal(str(gst_amount))
+    if not subtotal:
+        return [Decimal('0.00')] * len(lines)
+    shares = [(gst_amount * total / subtotal).quantize(_CENT, rounding=ROUND_HALF_UP) for total in totals]
+    shares[-1] += gst_amount - sum(shares)  # rounding remainder, so the shares add up exactly
+    return shares
+
+
+def add_sale(cursor, dialect, sale_day, lines, gst_amount):
+    """Adds one sale's lines to the rollup with a single multi-row upsert."""
+    values = ", ".join(["(%s, %s, %s, %s, %s, 1)"] * len(lines))
+    params = []
+    for (pid, qty, price), gst in zip(lines, split_gst(lines, gst_amount)):
+        params += [pid, sale_day, qty, Decimal(str(price)) * qty, gst]
+    cursor.execute(_UPSERT[dialect].format(values=values), params)
+
+
+def rebuild(conn, since=None):
+    """
+    Recomputes the rollup from Sales and SaleItems, for every day or only from `since` (a date).
+    Used to repair the rollup after manual edits to the sales tables. Returns the rows written.
+    """
+    cursor = conn.cursor()
+    try:
+        if since is None:
+            cursor.execute("DELETE FROM ProductDailySales")
+        else:
+            cursor.execute("DELETE FROM ProductDailySales WHERE sale_day >= %s", (since.isoformat(),))
+        written = fill(cursor, since)
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def fill(cursor, since=None):
+    """Inserts rollup rows aggregated from the raw sales (from `since` on); the caller commits."""
+    where, params = "", ()
+    if since is not None:
+        where, params = "WHERE s.sale_date >= %s", (since.isoformat(),)
+    # The GST of a sale is shared between its lines in proportion to their value, as in split_gst()
+    cursor.execute(f"""
+        INSERT INTO ProductDailySales (product_id, sale_day, units, revenue, gst, sale_count)
+        SELECT
+            si.product_id,
+            DATE(s.sale_date),
+            SUM(si.quantity_sold),
+            SUM(si.quantity_sold * si.price_at_sale),
+            ROUND(SUM(CASE WHEN s.total_amount - s.gst_amount > 0
+                           THEN si.quantity_sold * si.price_at_sale * s.gst_amount / (s.total_amount - s.gst_amount)
+                           ELSE 0 END), 2),
+            COUNT(DISTINCT s.sale_id)
+        FROM Sales s
+        JOIN SaleItems si ON s.sale_id = si.sale_id
+        {where}
+        GROUP BY si.product_id, DATE(s.sale_date)
+    """, params)
+    return cursor.rowcount
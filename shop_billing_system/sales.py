@@ -0,0 +1,182 @@
+import datetime
+import random
+import time
+
+import ledger
+import rollup
+from storage import dialect_of
+
+
+class InsufficientStockError(Exception):
+    """Raised when a sale would take stock below zero; nothing is written."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [(product_id, requested, available)]
+        details = ", ".join(f"product {pid}: wanted {req}, {avail} left" for pid, req, avail in shortages)
+        super().__init__(f"Not enough stock ({details})")
+
+
+class SaleResult:
+    __slots__ = ('sale_id', 'timings', 'stock')
+
+    def __init__(self, sale_id, timings, stock=None):
+        self.sale_id = sale_id
+        self.timings = timings  # phase -> seconds, in execution order
+        self.stock = stock or {}  # product_id -> stock_quantity just after the sale (empty for a replay)
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+    def describe(self):
+        phases = ", ".join(f"{name} {secs * 1000:.1f}" for name, secs in self.timings.items())
+        return f"sale {self.sale_id} committed in {self.total_time * 1000:.1f} ms ({phases})"
+
+
+def _merge_lines(lines):
+    """Collapses (product_id, quantity, unit_price) lines into one entry per product, sorted by id."""
+    merged = {}
+    for product_id, quantity, unit_price in lines:
+        if product_id in merged:
+            merged[product_id][0] += quantity
+        else:
+            merged[product_id] = [quantity, unit_price]
+    return [(pid, qty, price) for pid, (qty, price) in sorted(merged.items())]
+
+
+def commit_sale(conn, lines, total_amount, gst_amount, payment_method, flat_id=None,
+                client_ref=None, sale_date=None, enforce_stock=True):
+    """
+    Writes one sale with a fixed number of statements, whatever the basket size:
+
+      sale    INSERT the Sales row
+      stock   one UPDATE decrementing every line, guarded by `stock_quantity >= qty`, then
+              one SELECT of the stock it left (caches set it rather than subtracting again)
+      items   one multi-row INSERT into SaleItems
+      rollup  one multi-row upsert into ProductDailySales (see rollup.py)
+      credit  INSERT a charge into the flat's ledger (credit sales only, see ledger.py)
+      commit
+
+    Product rows are locked in primary-key order by a single statement, so two lanes selling the same
+    items cannot deadlock, and the locks are held for just the last few statements. If any line is
+    short the transaction is rolled back and InsufficientStockError lists every short line;
+    enforce_stock=False skips the guard (for replaying sales that already happened at the counter).
+
+    A `client_ref` makes the call idempotent: if a sale with that reference already exists its
+    sale_id is returned without writing anything. Returns a SaleResult with the sale_id and timings.
+    """
+    lines = _merge_lines(lines)
+    if not lines:
+        raise ValueError("A sale needs at least one line.")
+    # Stamped here rather than by the database so the sale and its rollup day always agree
+    sale_date = sale_date or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    timings = {}
+    mark = time.perf_counter()
+
+    def lap(phase):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[phase] = now - mark
+        mark = now
+
+    cursor = conn.cursor()
+    try:
+        if client_ref:
+            cursor.execute("SELECT sale_id FROM Sales WHERE client_ref = %s", (client_ref,))
+            existing = cursor.fetchone()
+            if existing:
+                conn.rollback()
+                lap('lookup')
+                return SaleResult(existing[0], timings)
+
+        columns = {'sale_date': sale_date, 'total_amount': total_amount, 'gst_amount': gst_amount,
+                   'payment_method': payment_method, 'flat_id': flat_id}
+        if client_ref:
+            columns['client_ref'] = client_ref
+        cursor.execute(
+            f"INSERT INTO Sales ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            tuple(columns.values())
+        )
+        sale_id = cursor.lastrowid
+        lap('sale')
+
+        sql, params = _stock_decrement(lines, enforce_stock)
+        cursor.execute(sql, params)
+        if enforce_stock and cursor.rowcount != len(lines):
+            conn.rollback()
+            raise InsufficientStockError(_find_shortages(cursor, lines))
+        stock = _stock_levels(cursor, lines)
+        lap('stock')
+
+        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(lines))
+        params = [value for pid, qty, price in lines for value in (sale_id, pid, qty, price)]
+        cursor.execute(
+            f"INSERT INTO SaleItems (sale_id, product_id, quantity_sold, price_at_sale) VALUES {placeholders}",
+            params
+        )
+        lap('items')
+
+        rollup.add_sale(cursor, dialect_of(conn), rollup.sale_day_of(sale_date), lines, gst_amount)
+        lap('rollup')
+
+        if payment_method == 'Credit' and flat_id:
+            ledger.add_entry(cursor, flat_id, ledger.CHARGE, total_amount, sale_id=sale_id)
+            lap('credit')
+
+        conn.commit()
+        lap('commit')
+        return SaleResult(sale_id, timings, stock)
+    except InsufficientStockError:
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def commit_sale_with_retry(connect, is_transient, *args, attempts=4, backoff=0.05, **kwargs):
+    """
+    commit_sale() on a fresh pooled connection, retried when `is_transient(err)` (deadlock, lock wait
+    timeout, SQLite busy). Retries back off exponentially with jitter so lanes that collided do not
+    collide again. InsufficientStockError and other errors are raised at once; since the sale's
+    client_ref makes a retry idempotent, a commit that succeeded before its connection failed is
+    not written twice.
+    """
+    for attempt in range(attempts):
+        try:
+            with connect() as conn:
+                return commit_sale(conn, *args, **kwargs)
+        except InsufficientStockError:
+            raise
+        except Exception as err:
+            if attempt + 1 >= attempts or not is_transient(err):
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def _stock_decrement(lines, guarded=True):
+    """Builds the single conditional UPDATE for all lines (CASE keeps it portable across databases)."""
+    case = " ".join(["WHEN %s THEN %s"] * len(lines))
+    ids = ", ".join(["%s"] * len(lines))
+    pairs = [value for pid, qty, _ in lines for value in (pid, qty)]
+    sql = (f"UPDATE Products SET stock_quantity = stock_quantity - (CASE product_id {case} END) "
+           f"WHERE product_id IN ({ids})")
+    params = pairs + [pid for pid, _, _ in lines]
+    if guarded:
+        sql += f" AND stock_quantity >= (CASE product_id {case} END)"
+        params += pairs
+    return sql, params
+
+
+def _stock_levels(cursor, lines):
+    ids = ", ".join(["%s"] * len(lines))
+    cursor.execute(f"SELECT product_id, stock_quantity FROM Products WHERE product_id IN ({ids})",
+                   [pid for pid, _, _ in lines])
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def _find_shortages(cursor, lines):
+    available = _stock_levels(cursor, lines)
+    return [(pid, qty, available.get(pid, 0)) for pid, qty, _ in lines if available.get(pid, 0) < qty]
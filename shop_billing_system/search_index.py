@@ -0,0 +1,128 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(words):
+    grams = set()
+    for word in words:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _prefixes(words):
+    return {word[:n] for word in words for n in (1, 2) if len(word) >= n}
+
+
+class SearchIndex:
+    """
+    Trigram index for ranked, typo-tolerant search over short texts (product names, flat numbers, ...).
+
+    Each key is indexed under the trigrams of its words, so a query only touches the postings of its
+    own trigrams instead of scanning every entry. Matches are ranked by how much of the query they
+    cover, with bonuses for prefix and substring matches and for popularity (e.g. units sold).
+    """
+
+    def __init__(self, min_score=0.4):
+        self.min_score = min_score
+        self._postings = defaultdict(set)  # trigram -> keys
+        self._prefixes = defaultdict(set)  # first one or two letters of a word -> keys
+        self._entries = {}                 # key -> (text, words, trigrams)
+        self._popularity = {}              # key -> count
+
+    def add(self, key, *fields):
+        """Indexes (or re-indexes) `key` under the given text fields."""
+        self.remove(key)
+        text = " ".join(f for f in fields if f).lower()
+        words = _words(text)
+        grams = _trigrams(words)
+        self._entries[key] = (text, words, grams)
+        for gram in grams:
+            self._postings[gram].add(key)
+        for prefix in _prefixes(words):
+            self._prefixes[prefix].add(key)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            for gram in entry[2]:
+                keys = self._postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+            for prefix in _prefixes(entry[1]):
+                keys = self._prefixes[prefix]
+                keys.discard(key)
+                if not keys:
+                    del self._prefixes[prefix]
+
+    def clear(self):
+        self._postings.clear()
+        self._prefixes.clear()
+        self._entries.clear()
+        self._popularity.clear()
+
+    def set_popularity(self, key, count):
+        self._popularity[key] = count
+
+    def bump_popularity(self, key, count=1):
+        self._popularity[key] = self._popularity.get(key, 0) + count
+
+    def popularity(self):
+        return dict(self._popularity)
+
+    def search(self, query, limit=10, accept=None):
+        """Returns up to `limit` keys best matching `query`; `accept(key)` can filter candidates."""
+        query = query.strip().lower()
+        query_words = _words(query)
+        if not query_words:
+            return []
+        if len(query) < 3:
+            return self._search_prefix(query, limit, accept)
+        query_grams = _trigrams(query_words)
+
+        hits = Counter()
+        for gram in query_grams:
+            keys = self._postings.get(gram)
+            if keys:
+                hits.update(keys)
+
+        scored = []
+        needed = len(query_grams) * self.min_score
+        for key, count in hits.items():
+            if count < needed or (accept and not accept(key)):
+                continue
+            text, words, _ = self._entries[key]
+            score = count / len(query_grams)
+            if text.startswith(query):
+                score += 1.0
+            elif query in text:
+                score += 0.6
+            if all(any(w.startswith(q) for w in words) for q in query_words):
+                score += 0.4
+            score += math.log1p(self._popularity.get(key, 0)) * 0.05
+            scored.append((-score, text, key))
+
+        return [key for _, _, key in heapq.nsmallest(limit, scored)]
+
+    def _search_prefix(self, query, limit, accept):
+        # One or two letters carry no useful trigrams; rank words starting with them by popularity
+        scored = []
+        for key in self._prefixes.get(query, ()):
+            if accept and not accept(key):
+                continue
+            text = self._entries[key][0]
+            score = (1.0 if text.startswith(query) else 0.0) + math.log1p(self._popularity.get(key, 0)) * 0.05
+            scored.append((-score, text, key))
+        return [key for _, _, key in heapq.nsmallest(limit, scored)]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,502 @@
+import argparse
+import datetime
+import hmac
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from catalog import ProductCatalog, FlatDirectory
+from changefeed import ChangeFeed, PRODUCT, FLAT
+from db_pool import ConnectionPool, PoolTimeoutError
+from repositories import ShopInfoRepository, ProductRepository, FlatRepository, SaleRepository, ChangeLogRepository
+from sales import InsufficientStockError, SaleResult, commit_sale_with_retry
+from storage import create_backend
+
+# Optional headless POS service. One process owns the connection pool, the warm product and flat
+# caches and the sale commits; every terminal (shop_billing.py with POS_SERVICE_URL set) talks to it
+# over a small JSON-over-HTTP API instead of opening its own database connections:
+#
+#   POST /rpc     {"method": "products.insert", "params": [...]} -> {"result": ...} or {"error": {...}}
+#   GET  /health  -> {"status": "ok", "pool": {...}}
+#
+# When the service is started with a token (--token or POS_SERVICE_TOKEN), every /rpc request must
+# carry it in the X-POS-Token header; set the same token in each terminal's POS_SERVICE_TOKEN.
+# Decimals and dates travel as tagged objects so prices never pass through a float.
+
+
+TOKEN_HEADER = "X-POS-Token"
+
+# Writes that would be applied twice if a request the service already received were sent again.
+# sales.commit is safe only with a client_ref, which the service uses to spot a replay.
+_NOT_RESENT = {'products.insert', 'products.upsert_many', 'flats.record_payment'}
+
+
+# --- Wire format ---
+def _encode(obj):
+    if isinstance(obj, Decimal):
+        return {'$decimal': str(obj)}
+    if isinstance(obj, datetime.datetime):
+        return {'$datetime': obj.isoformat()}
+    if isinstance(obj, datetime.date):
+        return {'$date': obj.isoformat()}
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Cannot send {type(obj).__name__} to the POS service")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if '$decimal' in obj:
+            return Decimal(obj['$decimal'])
+        if '$datetime' in obj:
+            return datetime.datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return datetime.date.fromisoformat(obj['$date'])
+    return obj
+
+
+def dumps(value):
+    return json.dumps(value, default=_encode).encode("utf-8")
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+class ServiceError(Exception):
+    """The POS service refused a request (bad arguments, a database error it could not retry, ...)."""
+
+
+class ServiceUnavailableError(ServiceError):
+    """The POS service or its database could not be reached; worth retrying later."""
+
+
+# --- Server side ---
+class PosService:
+    """
+    The shared state behind the API: repositories, caches and the guarded sale commit.
+
+    The caches are kept current by write-through from the requests themselves and by a ChangeFeed
+    for changes made elsewhere. Every product change gets a version number, so a terminal's
+    refresh only downloads the products changed since its last one.
+    """
+
+    def __init__(self, pool, is_transient, feed_interval=2.0, commit_attempts=4):
+        self.pool = pool
+        self.is_transient = is_transient
+        self.commit_attempts = commit_attempts
+
+        self.catalog = ProductCatalog(pool.acquire)
+        self.flats = FlatDirectory(pool.acquire)
+        from analytics import SalesAnalytics  # NumPy; terminals import this module for ServiceClient only
+        self.analytics = SalesAnalytics(pool.acquire)
+        self.shop_info_repo = ShopInfoRepository(pool.acquire)
+        self.product_repo = ProductRepository(pool.acquire, is_transient)
+        self.flat_repo = FlatRepository(pool.acquire)
+        self.sale_repo = SaleRepository(pool.acquire)
+        self.change_log_repo = ChangeLogRepository(pool.acquire)
+
+        self.epoch = uuid.uuid4().hex  # changes on restart, so terminals know to reload
+        self._lock = threading.Lock()
+        self._version = 0
+        self._changed_at = {}  # product_id -> version of its last change
+        self.catalog.add_listener(self._on_catalog_change)
+
+        self.feed = ChangeFeed(self.change_log_repo, interval=feed_interval,
+                               on_error=lambda err: print(f"Change feed: {err}"))
+        self.feed.subscribe(PRODUCT, self.catalog.apply_changes)
+        self.feed.subscribe(FLAT, self.flats.apply_changes)
+
+        self.methods = {
+            'shop_info.gst_rate': self.shop_info_repo.gst_rate,
+            'products.all_rows': self.product_repo.all_rows,
+            'products.page': self.product_repo.page,
+            'products.insert': self.insert_product,
+            'products.update': self.update_product,
+            'products.delete_unsold': self.delete_product,
+            'products.upsert_many': self.product_repo.upsert_many,
+            'flats.all': self.all_flats,
+            'flats.by_ids': self.flats_by_ids,
+            'flats.page': self.flat_repo.page,
+            'flats.record_payment': self.record_payment,
+            'flats.statement': self.flat_repo.statement,
+            'flats.aging': self.flat_repo.aging,
+            'flats.take_due_snapshot': self.flat_repo.take_due_snapshot,
+            'sales.product_daily_sales': self.sale_repo.product_daily_sales,
+            'sales.commit': self.commit_sale,
+            'catalog.changes': self.catalog_changes,
+            'catalog.find_by_barcode': self.catalog.find_by_barcode,
+            'changes.since': self.change_log_repo.since,
+            'changes.bounds': self.change_log_repo.bounds,
+            'analytics.report': self.analytics_report,
+            'service.stats': self.stats,
+        }
+
+    def start(self):
+        self.change_log_repo.prune()
+        self.flat_repo.take_due_snapshot()
+        self.feed.start()
+        self.catalog.load()
+        self.flats.load()
+
+    def stop(self):
+        self.feed.stop()
+
+    def _on_catalog_change(self, changed):
+        with self._lock:
+            for product_id in changed:
+                self._version += 1
+                self._changed_at[product_id] = self._version
+
+    # --- API methods ---
+    def catalog_changes(self, epoch=None, since=0):
+        """Products changed after version `since`; everything if the terminal is new or the service restarted."""
+        with self._lock:
+            version = self._version
+            full = epoch != self.epoch or since > version
+            ids = None if full else [pid for pid, at in self._changed_at.items() if at > since]
+        if full:
+            return {'epoch': self.epoch, 'version': version, 'full': True,
+                    'rows': self.catalog.all_products(), 'removed': [],
+                    'popularity': list(self.catalog.popularity().items())}
+        rows, removed = [], []
+        for product_id in ids:
+            row = self.catalog.get(product_id)
+            if row is None:
+                removed.append(product_id)
+            else:
+                rows.append(row)
+        return {'epoch': self.epoch, 'version': version, 'full': False, 'rows': rows, 'removed': removed}
+
+    def insert_product(self, res):
+        row = self.product_repo.insert(res)
+        self.catalog.upsert(row)
+        return row
+
+    def update_product(self, res):
+        row = self.product_repo.update(res)
+        self.catalog.upsert(row)
+        return row
+
+    def delete_product(self, product_id):
+        deleted = self.product_repo.delete_unsold(product_id)
+        if deleted:
+            self.catalog.remove(product_id)
+        return deleted
+
+    def all_flats(self):
+        if not self.flats.loaded:
+            self.flats.load()
+        return self.flats.all()
+
+    def flats_by_ids(self, ids):
+        # Read from the database, not self.flats: a terminal's feed can see a change before ours does
+        with self.pool.acquire() as conn:
+            return FlatDirectory._read(conn, list(ids))
+
+    def record_payment(self, flat_id, amount):
+        self.flat_repo.record_payment(flat_id, amount)
+        self.flats.adjust_balance(flat_id, -amount)
+
+    def commit_sale(self, lines, total_amount, gst_amount, payment_method, flat_id=None,
+                    client_ref=None, sale_date=None, enforce_stock=True):
+        result = commit_sale_with_retry(self.pool.acquire, self.is_transient, lines, total_amount, gst_amount,
+                                        payment_method, flat_id, client_ref=client_ref, sale_date=sale_date,
+                                        enforce_stock=enforce_stock, attempts=self.commit_attempts)
+        if 'lookup' not in result.timings:  # not a replay of a sale that was already written
+            for product_id, quantity, _ in lines:
+                self.catalog.record_sale(product_id, quantity, result.stock.get(product_id))
+            if payment_method == 'Credit' and flat_id:
+                self.flats.adjust_balance(flat_id, total_amount)
+        return {'sale_id': result.sale_id, 'timings': result.timings, 'stock': list(result.stock.items())}
+
+    def analytics_report(self, days, stock=None):
+        # Stock comes from the service's own catalog; a terminal's copy could be behind it
+        stock = {row['product_id']: row['stock_quantity'] for row in self.catalog.all_products()}
+        return self.analytics.report(days, stock)
+
+    def stats(self):
+        return {'pool': self.pool.stats(), 'products': len(self.catalog.all_products()),
+                'catalog_version': self._version}
+
+    def call(self, method, params, kwargs):
+        fn = self.methods.get(method)
+        if fn is None:
+            raise ServiceError(f"Unknown method '{method}'")
+        return fn(*params, **kwargs)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: a terminal reuses one connection per thread
+    service = None  # set by serve()
+    token = None    # shared secret every /rpc request must carry, if set
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {'error': {'type': 'NotFound', 'message': self.path}})
+        self._reply(200, {'status': 'ok', 'pool': self.service.pool.stats()})
+
+    def do_POST(self):
+        if self.path != "/rpc":
+            return self._reply(404, {'error': {'type': 'NotFound', 'message': self.path}})
+        if self.token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), self.token):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))  # keep the connection usable
+            return self._reply(401, {'error': {'type': 'Unauthorized', 'message': "Missing or wrong service token"}})
+        try:
+            request = loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = self.service.call(request['method'], request.get('params', []), request.get('kwargs', {}))
+        except InsufficientStockError as err:
+            return self._reply(409, {'error': {'type': 'InsufficientStockError', 'message': str(err),
+                                               'shortages': err.shortages}})
+        except Exception as err:
+            kind = 'Unavailable' if self.service.is_transient(err) else 'Error'
+            return self._reply(503 if kind == 'Unavailable' else 400,
+                               {'error': {'type': kind, 'message': str(err)}})
+        self._reply(200, {'result': result})
+
+    def _reply(self, status, body):
+        data = dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the console at checkout rates
+
+
+def serve(service, host="127.0.0.1", port=8765, token=None):
+    """Runs the API until interrupted. With a `token`, /rpc requests without it are refused."""
+    handler = type("Handler", (_Handler,), {'service': service, 'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"POS service listening on http://{host}:{port}")
+    if not token and host not in ("127.0.0.1", "localhost", "::1"):
+        print("Warning: no --token set; anyone on the network can call the service")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# --- Client side ---
+def _may_resend(method, kwargs):
+    """True if running `method` twice has the same effect as once (see _NOT_RESENT)."""
+    if method == 'sales.commit':
+        return bool(kwargs.get('client_ref'))
+    return method not in _NOT_RESENT
+
+
+class ServiceClient:
+    """
+    Thread-safe client for a PosService; each thread keeps its own keep-alive connection.
+    Usable as a context manager so it can stand in for a pooled connection (see JournalReplicator).
+    """
+
+    def __init__(self, url, timeout=10.0, token=None):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.url = url
+        self.timeout = timeout
+        self._headers = {"Content-Type": "application/json"}
+        if token:
+            self._headers[TOKEN_HEADER] = token
+        self._local = threading.local()
+
+    def call(self, method, *params, **kwargs):
+        body = dumps({'method': method, 'params': params, 'kwargs': kwargs})
+        for attempt in range(2):
+            conn = self._connection()
+            sent = False
+            try:
+                conn.request("POST", "/rpc", body, self._headers)
+                sent = True
+                response = conn.getresponse()
+                payload = loads(response.read())
+                break
+            except (OSError, http.client.HTTPException) as err:
+                conn.close()
+                self._local.conn = None
+                # A kept-alive connection the server has since closed fails once; retry on a fresh one,
+                # unless the request went out and the service may already have applied a write
+                if attempt or isinstance(err, TimeoutError) or (sent and not _may_resend(method, kwargs)):
+                    raise ServiceUnavailableError(f"POS service at {self.url} unreachable: {err}") from err
+
+        error = payload.get('error')
+        if error is None:
+            return payload['result']
+        if error['type'] == 'InsufficientStockError':
+            raise InsufficientStockError([tuple(shortage) for shortage in error['shortages']])
+        if error['type'] == 'Unavailable':
+            raise ServiceUnavailableError(error['message'])
+        raise ServiceError(error['message'])
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def repository(self, prefix):
+        return RemoteRepository(self, prefix)
+
+    def commit_sale(self, conn, lines, total_amount, gst_amount, payment_method, flat_id=None,
+                    client_ref=None, sale_date=None, enforce_stock=True):
+        """Same signature as sales.commit_sale (`conn` is ignored), so the journal replicator can use it."""
+        result = self.call('sales.commit', [(pid, qty, Decimal(str(price))) for pid, qty, price in lines],
+                           Decimal(str(total_amount)), Decimal(str(gst_amount)), payment_method, flat_id,
+                           client_ref=client_ref, sale_date=sale_date, enforce_stock=enforce_stock)
+        return SaleResult(result['sale_id'], result['timings'], dict(result.get('stock', ())))
+
+    def stats(self):
+        return self.call('service.stats')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class RemoteRepository:
+    """Stands in for a repository: `repo.method(*args)` becomes the service call 'prefix.method'."""
+
+    def __init__(self, client, prefix):
+        self._client = client
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        method = f"{self._prefix}.{name}"
+        return lambda *args: self._client.call(method, *args)
+
+
+class RemoteCatalog(ProductCatalog):
+    """A ProductCatalog filled from the service's cache instead of the database; lookups are unchanged."""
+
+    def __init__(self, client):
+        super().__init__(get_connection=None)
+        self._client = client
+        self._epoch = None
+        self._version = 0
+
+    def load(self):
+        self._epoch = None
+        return self.refresh()
+
+    def refresh(self):
+        changes = self._client.call('catalog.changes', self._epoch, self._version)
+        with self._lock:
+            changed = set()
+            if changes['full']:
+                changed.update(self._products)
+                self._products.clear()
+                self._by_name.clear()
+                self._by_barcode.clear()
+                self._search.clear()
+                for product_id, units in changes['popularity']:
+                    self._search.set_popularity(product_id, units)
+            for row in changes['rows']:
+                changed.add(self._put(row)['product_id'])
+            for product_id in changes['removed']:
+                row = self._products.pop(product_id, None)
+                if row:
+                    self._unindex(row)
+                    changed.add(product_id)
+            self._epoch = changes['epoch']
+            self._version = changes['version']
+            self.loaded = True
+        self._notify(changed)
+        return changed
+
+    def apply_changes(self, product_ids):
+        # The service has already applied them; pick up its versioned delta
+        return self.refresh()
+
+    def _fetch_by_barcode(self, barcode):
+        row = self._client.call('catalog.find_by_barcode', barcode)
+        if row:
+            with self._lock:
+                row = self._put(row)
+            self._notify({row['product_id']})
+        return row
+
+
+class RemoteFlatDirectory(FlatDirectory):
+    def __init__(self, client):
+        super().__init__(get_connection=None)
+        self._client = client
+
+    def load(self):
+        rows = self._client.call('flats.all')
+        with self._lock:
+            self._flats = {row['flat_id']: row for row in rows}
+            self._search.clear()
+            for row in rows:
+                self._search.add(row['flat_id'], row['flat_number'], row['resident_name'])
+            self.loaded = True
+        self._notify(None)
+        return True
+
+    def _fetch(self, ids):
+        # Only the changed flats cross the wire; apply_changes() is inherited
+        return self._client.call('flats.by_ids', ids)
+
+
+# --- Command line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python service.py",
+                                     description="Shared POS service: one pool and cache for every terminal.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="mysql")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "society_store.db"),
+                        help="SQLite file (with --backend sqlite)")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="")
+    parser.add_argument("--mysql-database", default="society_store")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--token", default=os.environ.get("POS_SERVICE_TOKEN"),
+                        help="shared secret terminals must send (default: $POS_SERVICE_TOKEN); "
+                             "set one whenever --host is reachable from other machines")
+    parser.add_argument("--feed-interval", type=float, default=2.0,
+                        help="seconds between checks for changes made outside the service")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend = create_backend(args.backend, sqlite_path=args.db, mysql_config={
+        'host': args.mysql_host, 'user': args.mysql_user,
+        'password': args.mysql_password, 'database': args.mysql_database,
+    })
+    print(f"Database: {backend.describe()}")
+    backend.setup()
+
+    pool = ConnectionPool(backend.connect, size=args.pool_size, is_alive=backend.is_alive, reset=backend.reset)
+    is_transient = lambda err: isinstance(err, PoolTimeoutError) or backend.is_transient(err)
+    service = PosService(pool, is_transient, feed_interval=args.feed_interval)
+    started = time.perf_counter()
+    service.start()
+    print(f"Caches warm in {time.perf_counter() - started:.2f} s ({len(service.catalog.all_products())} products)")
+    try:
+        serve(service, args.host, args.port, args.token)
+    finally:
+        service.stop()
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,38 @@
-import mysql.connector
+import time
+_process_started = time.perf_counter()  # before the other imports, so --profile-startup includes them
+
 import customtkinter as ctk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog, Label, PhotoImage
+import argparse
 import datetime
-
-# --- Matplotlib Imports for Graphing ---
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import os
+import re
+import threading
+from collections import deque
+
+from db_pool import ConnectionPool, PoolTimeoutError
+from catalog import ProductCatalog, FlatDirectory
+from widgets import VirtualList, TypeAheadDropdown, PagedTreeview
+from cart import Cart, to_paise, to_rupees
+from worker import DbExecutor
+from storage import create_backend
+from migrations import latest_version
+from repositories import ShopInfoRepository, ProductRepository, FlatRepository, SaleRepository, ChangeLogRepository
+from changefeed import ChangeFeed, PRODUCT, FLAT, SHOP
+import ledger
+from journal import SaleJournal, JournalReplicator
+from importer import ImportStoppedError, import_products
+import exporter
+import billing
+from sales import InsufficientStockError, commit_sale, commit_sale_with_retry
+from instrumentation import metrics, timed, instrument_connect, record_checkout, StartupProfile
+from service import ServiceClient, ServiceUnavailableError, RemoteCatalog, RemoteFlatDirectory
+
+# --- STORAGE BACKEND ---
+# 'mysql' uses the server in DB_CONFIG below; 'sqlite' keeps everything in a local file
+# (SQLITE_PATH) and needs no server, e.g. for a small kiosk or for local testing.
+DB_BACKEND = 'mysql'
+SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "society_store.db")
 
 # --- DATABASE CONFIGURATION ---
 # !!! IMPORTANT: UPDATE THESE DETAILS FOR YOUR MYSQL SERVER !!!
@@ -16,109 +43,191 @@ DB_CONFIG = {
     'database': 'society_store' # the name of the database to use
 }
 
-def get_db_connection():
-    """Establishes and returns a MySQL database connection."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as err:
-        messagebox.showerror("Database Connection Error", f"Error: {err}\nPlease check your DB_CONFIG in the code.")
-        return None
+# --- SHARED POS SERVICE (optional) ---
+# With several terminals, run `python service.py` once and set this to its address, e.g.
+# "http://127.0.0.1:8765". The terminal then opens no database connections of its own: the
+# service owns the pool, the warm product cache and the sale commits for every lane.
+POS_SERVICE_URL = None
+POS_SERVICE_TIMEOUT = 10  # seconds per request to the service
+POS_SERVICE_TOKEN = None   # the service's --token, if it was started with one
+
+# --- CONNECTION POOL SETTINGS ---
+DB_POOL_SIZE = 6          # max open connections kept by this terminal
+DB_POOL_TIMEOUT = 10      # seconds to wait for a free connection
+DB_POOL_PING_INTERVAL = 5 # idle connections older than this are pinged before reuse
+
+# --- BACKGROUND DATABASE WORK ---
+DB_WORKER_THREADS = 3     # threads running queries off the Tk event loop (keep below DB_POOL_SIZE)
+DB_BACKGROUND_THREADS = 1 # threads for imports, exports and analytics, so they never delay a checkout
+DB_TASK_TIMEOUT = 15      # seconds before a read is reported as timed out
+DB_SEARCH_TIMEOUT = 5     # lookups the cashier is waiting on (barcode fallback, searches)
+
+# --- OFFLINE SALES JOURNAL ---
+# Every sale is written to this local file first and copied to the database in the background,
+# so checkout keeps working while the database is slow or down.
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_journal.db")
+JOURNAL_BATCH_SIZE = 25       # sales sent to the database per connection checkout
+JOURNAL_SYNC_INTERVAL = 5     # seconds between sync attempts when idle
+JOURNAL_MAX_BACKOFF = 60      # longest wait between retries while the database is unreachable
+JOURNAL_KEEP_DAYS = 90        # synced entries older than this are pruned at startup
+
+# --- MULTI-LANE CHECKOUT ---
+# Each sale first reserves its stock in the database (a guarded decrement, so two counters can
+# never both sell the last unit). If the database does not answer within the timeout, the sale
+# completes from the journal as before and is synced later.
+CHECKOUT_CONFIRM_TIMEOUT = 4  # seconds the counter waits for the stock confirmation
+CHECKOUT_RETRIES = 4          # attempts after deadlocks / lock wait timeouts between lanes
+
+# --- CHANGE NOTIFICATIONS ---
+# Product, price, stock, flat balance and GST changes made on any terminal are picked up from the
+# ChangeLog table this often and patched into the open windows row by row.
+CHANGE_FEED_INTERVAL = 2      # seconds
+CHANGE_LOG_KEEP_DAYS = 2      # older change records are pruned at startup
+
+# --- INVENTORY AND FLATS TABLES ---
+TABLE_PAGE_SIZE = 200  # rows read per page; the next page loads as the table is scrolled near its end
+
+# --- REPORTS ---
+REPORT_PERIODS = (30, 90, 365)  # day ranges offered in the Sales Reports window
+REPORT_TABLE_ROWS = 500         # products listed in the ABC tab (the summary covers all of them)
+STATEMENT_MONTHS = 3            # calendar months offered in a flat's statement
+CHART_CACHE_SIZE = 64           # product charts (daily series + rendered image) kept for flipping back
+CHART_CACHE_TTL = 60            # seconds before a cached chart is read again, so new sales show up
+
+# --- BULK IMPORT ---
+IMPORT_CHUNK_SIZE = 2000  # CSV rows written per transaction
+SERVICE_IMPORT_CHUNK_SIZE = 250  # rows per request on a thin-client terminal; each must finish within POS_SERVICE_TIMEOUT
+
+# --- SALES EXPORT ---
+EXPORT_CHUNK_SIZE = 5000  # rows fetched and written at a time; memory use does not grow with the range
+EXPORT_QUARTERS = 8       # quarters offered in the GST Export window
+
+# --- MONTH-END BILLING ---
+BILLING_WORKERS = None    # processes rendering statements (None: one per CPU)
+BILLING_BATCH_SIZE = 50   # flats per statement batch handed to a process
+
+# --- DIAGNOSTICS ---
+# Every statement, connection checkout and UI handler is timed in memory (F12 shows the top offenders);
+# anything slower than these thresholds is also appended to SLOW_LOG_PATH.
+SLOW_DB_MS = 200   # statements and connection waits
+SLOW_UI_MS = 100   # UI handlers: the screen is frozen for this long
+SLOW_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow_operations.log")
+
+metrics.configure(slow_db_ms=SLOW_DB_MS, slow_ui_ms=SLOW_UI_MS, log_path=SLOW_LOG_PATH)
+startup_profile = StartupProfile(_process_started)
+
+storage_backend = create_backend(DB_BACKEND, mysql_config=DB_CONFIG, sqlite_path=SQLITE_PATH)
+_db_pool = None
+
+def get_db_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = ConnectionPool(
+            instrument_connect(storage_backend.connect),
+            size=DB_POOL_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            is_alive=storage_backend.is_alive,
+            reset=storage_backend.reset,
+            ping_interval=DB_POOL_PING_INTERVAL,
+            on_checkout=record_checkout,
+        )
+    return _db_pool
+
+def get_pool_stats():
+    """Returns the connection pool counters (wait time, in-use, created/destroyed, ...); the service's pool for a thin client."""
+    if pos_service:
+        return pos_service.stats()['pool']
+    return get_db_pool().stats()
+
+def acquire_db_connection():
+    """Borrows a pooled connection, raising on failure. Used by code running on worker threads."""
+    return get_db_pool().acquire()
+
+def _is_transient_db_error(err):
+    """True for failures worth retrying later: server unreachable, pool exhausted, lock timeouts."""
+    return (isinstance(err, (PoolTimeoutError, ServiceUnavailableError))
+            or storage_backend.is_transient(err))
+
+if POS_SERVICE_URL:
+    # Thin client: the same interfaces, answered by the shared service
+    pos_service = ServiceClient(POS_SERVICE_URL, timeout=POS_SERVICE_TIMEOUT, token=POS_SERVICE_TOKEN)
+    shop_info_repo = pos_service.repository("shop_info")
+    product_repo = pos_service.repository("products")
+    flat_repo = pos_service.repository("flats")
+    sale_repo = pos_service.repository("sales")
+    change_log_repo = pos_service.repository("changes")
+    sales_analytics = pos_service.repository("analytics")
+    product_catalog = RemoteCatalog(pos_service)
+    flat_directory = RemoteFlatDirectory(pos_service)
+    import_chunk_size = SERVICE_IMPORT_CHUNK_SIZE
+else:
+    pos_service = None
+    # Table gateways; every query the windows run goes through these
+    shop_info_repo = ShopInfoRepository(acquire_db_connection)
+    product_repo = ProductRepository(acquire_db_connection, _is_transient_db_error)
+    flat_repo = FlatRepository(acquire_db_connection)
+    sale_repo = SaleRepository(acquire_db_connection)
+    change_log_repo = ChangeLogRepository(acquire_db_connection)
+    sales_analytics = None  # created on first use, see get_sales_analytics()
+
+    # In-memory Products and Flats caches shared by every window of this process
+    product_catalog = ProductCatalog(acquire_db_connection)
+    flat_directory = FlatDirectory(acquire_db_connection)
+    import_chunk_size = IMPORT_CHUNK_SIZE
+
+def confirm_sale(*args, **kwargs):
+    """Guarded sale commit, retried on lock conflicts; through the service when one is configured."""
+    if pos_service:
+        return pos_service.commit_sale(None, *args, **kwargs)
+    return commit_sale_with_retry(acquire_db_connection, _is_transient_db_error, *args,
+                                  attempts=CHECKOUT_RETRIES, **kwargs)
+
+# NumPy and matplotlib take longer to import than everything else together and only the Reports
+# window uses them, so they are loaded the first time it asks, on a worker thread
+_lazy_lock = threading.Lock()
+_report_charts = None
+
+def get_sales_analytics():
+    """The catalog-wide sales analytics (the service's for a thin client), created on first use."""
+    global sales_analytics
+    with _lazy_lock:
+        if sales_analytics is None:
+            import analytics  # NumPy
+            sales_analytics = analytics.SalesAnalytics(acquire_db_connection)
+    return sales_analytics
+
+def get_report_charts():
+    """The chart figures and cache shared by the Reports windows, created on first use."""
+    global _report_charts
+    with _lazy_lock:
+        if _report_charts is None:
+            import charts  # matplotlib
+            _report_charts = charts.ReportCharts(sale_repo.product_daily_sales, CHART_CACHE_SIZE, CHART_CACHE_TTL)
+    return _report_charts
+
+def sales_report(days, stock):
+    return get_sales_analytics().report(days, stock)
+
+def product_chart(product_id, name, days, size):
+    """(DailySeries, image data) for one product's sales graph; runs on a worker thread."""
+    return get_report_charts().product(product_id, name, days, size)
+
+def heatmap_chart(title, counts, size):
+    return get_report_charts().heatmap.render(title, counts, size)
 
 def setup_database():
-    """Connects to MySQL and creates the database and tables if they don't exist."""
-    try:
-        # Connect without specifying a database first to create it
-        initial_conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
-        )
-        cursor = initial_conn.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
-        cursor.execute(f"USE {DB_CONFIG['database']}")
-        print(f"Database '{DB_CONFIG['database']}' is ready.")
-        initial_conn.close()
-
-        # Now connect to the specific database to create tables
-        conn = get_db_connection()
-        if not conn: return
-        
-        cursor = conn.cursor()
-
-        commands = [
-            """
-            CREATE TABLE IF NOT EXISTS ShopInfo (
-                id INT PRIMARY KEY,
-                shop_name VARCHAR(255) DEFAULT 'Your Shop Name',
-                address VARCHAR(255) DEFAULT 'Your Address',
-                phone VARCHAR(50) DEFAULT 'Your Phone Number',
-                gst_number VARCHAR(50) DEFAULT 'Your GSTIN',
-                current_gst_rate DECIMAL(5, 2) DEFAULT 18.00
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Flats (
-                flat_id INT AUTO_INCREMENT PRIMARY KEY,
-                flat_number VARCHAR(50) NOT NULL UNIQUE,
-                resident_name VARCHAR(255),
-                credit_balance DECIMAL(10, 2) NOT NULL DEFAULT 0.00
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Products (
-                product_id INT AUTO_INCREMENT PRIMARY KEY,
-                barcode VARCHAR(255) UNIQUE,
-                name VARCHAR(255) NOT NULL,
-                price DECIMAL(10, 2) NOT NULL,
-                stock_quantity INT NOT NULL DEFAULT 0
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS Sales (
-                sale_id INT AUTO_INCREMENT PRIMARY KEY,
-                sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_amount DECIMAL(10, 2) NOT NULL,
-                gst_amount DECIMAL(10, 2) NOT NULL,
-                payment_method VARCHAR(50) NOT NULL,
-                flat_id INT,
-                FOREIGN KEY (flat_id) REFERENCES Flats (flat_id)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS SaleItems (
-                sale_item_id INT AUTO_INCREMENT PRIMARY KEY,
-                sale_id INT NOT NULL,
-                product_id INT NOT NULL,
-                quantity_sold INT NOT NULL,
-                price_at_sale DECIMAL(10, 2) NOT NULL,
-                FOREIGN KEY (sale_id) REFERENCES Sales(sale_id),
-                FOREIGN KEY (product_id) REFERENCES Products(product_id)
-            );
-            """
-        ]
-
-        for command in commands:
-            cursor.execute(command)
-
-        # Add default ShopInfo if it doesn't exist
-        cursor.execute("SELECT COUNT(*) FROM ShopInfo")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("INSERT INTO ShopInfo (id) VALUES (1)")
-        
-        # Add sample flats for testing if none exist
-        cursor.execute("SELECT COUNT(*) FROM Flats")
-        if cursor.fetchone()[0] == 0:
-            sample_flats = [(f"A-{101+i}", f"Resident {i+1}") for i in range(10)]
-            cursor.executemany("INSERT INTO Flats (flat_number, resident_name) VALUES (%s, %s)", sample_flats)
+    """Creates the database and tables if they don't exist. Runs on a worker thread while the window opens."""
+    if pos_service:
+        print(f"Using the POS service at {POS_SERVICE_URL}; it manages the database schema.")
+        return
+    applied = storage_backend.setup()
+    print(f"Database setup complete (schema version {latest_version()}"
+          f"{', applied ' + ', '.join(map(str, applied)) if applied else ', up to date'}).")
 
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("Database setup complete.")
 
-    except mysql.connector.Error as err:
-        messagebox.showerror("Database Setup Error", f"Error: {err}")
+# Scanner input: an optional quantity prefix such as "3*8901234567890"
+SCAN_PATTERN = re.compile(r"^\s*(?:(\d{1,4})\s*\*\s*)?(\S+)\s*$")
 
 
 # --- DIALOG FOR ADDING/EDITING PRODUCTS ---
@@ -130,10 +239,15 @@ class ProductDialog(ctk.CTkToplevel):
         self.result = None
 
         self.title("Add New Product" if not product_info else "Edit Product")
-        self.geometry("400x300")
+        self.geometry("400x360")
         self.transient(master)
         self.grab_set()
 
+        self.barcode_label = ctk.CTkLabel(self, text="Barcode (optional):")
+        self.barcode_label.pack(pady=(10,0))
+        self.barcode_entry = ctk.CTkEntry(self, width=250)
+        self.barcode_entry.pack()
+
         self.name_label = ctk.CTkLabel(self, text="Product Name:")
         self.name_label.pack(pady=(10,0))
         self.name_entry = ctk.CTkEntry(self, width=250)
@@ -150,6 +264,7 @@ class ProductDialog(ctk.CTkToplevel):
         self.stock_entry.pack()
 
         if product_info:
+            self.barcode_entry.insert(0, product_info.get('barcode') or '')
             self.name_entry.insert(0, product_info['name'])
             self.price_entry.insert(0, str(product_info['price']))
             self.stock_entry.insert(0, str(product_info['stock_quantity']))
@@ -158,6 +273,7 @@ class ProductDialog(ctk.CTkToplevel):
         self.save_button.pack(pady=20)
 
     def save(self):
+        barcode = self.barcode_entry.get().strip()
         name = self.name_entry.get()
         price = self.price_entry.get()
         stock = self.stock_entry.get()
@@ -173,7 +289,7 @@ class ProductDialog(ctk.CTkToplevel):
             messagebox.showerror("Input Error", "Price must be a number and Stock must be an integer.", parent=self)
             return
 
-        self.result = {'name': name, 'price': price, 'stock': stock}
+        self.result = {'name': name, 'barcode': barcode or None, 'price': price, 'stock': stock}
         if self.product_info:
             self.result['id'] = self.product_info['product_id']
         
@@ -188,6 +304,7 @@ class InventoryWindow(ctk.CTkToplevel):
         self.geometry("800x600")
         self.transient(master)
         self.grab_set()
+        self.db = master.db
 
         self.search_frame = ctk.CTkFrame(self)
         self.search_frame.pack(pady=10, padx=10, fill="x")
@@ -200,16 +317,13 @@ class InventoryWindow(ctk.CTkToplevel):
         self.tree_frame = ctk.CTkFrame(self)
         self.tree_frame.pack(pady=10, padx=10, fill="both", expand=True)
 
-        columns = ("id", "name", "price", "stock")
-        self.tree = ttk.Treeview(self.tree_frame, columns=columns, show="headings")
-        self.tree.heading("id", text="ID")
-        self.tree.heading("name", text="Name")
-        self.tree.heading("price", text="Price")
-        self.tree.heading("stock", text="Stock")
+        # Pages come from the database in the order of the clicked heading, as the table is scrolled
+        self.tree = PagedTreeview(self.tree_frame, self.db,
+                                  [("product_id", "ID", 50), ("barcode", "Barcode", 150), ("name", "Name", 300),
+                                   ("price", "Price", 100), ("stock_quantity", "Stock", 100)],
+                                  fetch=product_repo.page, key="product_id", sort="name",
+                                  format_row=self._row_values, page_size=TABLE_PAGE_SIZE, on_error=self._show_error)
         self.tree.pack(fill="both", expand=True)
-        
-        self.tree.column("id", width=50)
-        self.tree.column("name", width=300)
 
         self.button_frame = ctk.CTkFrame(self)
         self.button_frame.pack(pady=10, padx=10, fill="x")
@@ -220,29 +334,42 @@ class InventoryWindow(ctk.CTkToplevel):
         self.edit_button.pack(side="left", padx=5)
         self.delete_button = ctk.CTkButton(self.button_frame, text="Delete Selected", command=self.delete_product)
         self.delete_button.pack(side="left", padx=5)
+        self.import_button = ctk.CTkButton(self.button_frame, text="Import CSV...", command=self.import_csv)
+        self.import_button.pack(side="left", padx=5)
+
+        # Changes from any terminal (via the change feed) or from this window patch single rows
+        self._search_term = None
+        self._catalog_listener = lambda changed_ids: self.db.call_in_ui(self._patch_rows, changed_ids)
+        product_catalog.add_listener(self._catalog_listener)
+        self.bind("<Destroy>", lambda event: event.widget is self and product_catalog.remove_listener(self._catalog_listener),
+                  add="+")
 
         self.load_products()
 
     def load_products(self, search_term=None):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        
-        query = "SELECT product_id, name, price, stock_quantity FROM Products"
-        params = []
+        self._search_term = search_term or None
         if search_term:
-            query += " WHERE name LIKE %s"
-            params.append(f"%{search_term}%")
-        
-        cursor.execute(query, params)
-        for row in cursor.fetchall():
-            self.tree.insert("", "end", values=(row['product_id'], row['name'], f"{row['price']:.2f}", row['stock_quantity']))
-        
-        cursor.close()
-        conn.close()
+            # Ranked matches from the catalog's search index instead of a LIKE '%term%' table scan
+            self.db.submit(product_catalog.refresh, key=("inventory", id(self)), owner=self, timeout=DB_SEARCH_TIMEOUT,
+                           on_done=lambda _: self.tree.show_rows(product_catalog.search(search_term, limit=200)),
+                           on_error=lambda err: self.tree.show_rows(product_catalog.search(search_term, limit=200)))
+        else:
+            self.db.cancel(("inventory", id(self)))
+            self.tree.reload()
+
+    def _row_values(self, row):
+        return (row['product_id'], row['barcode'] or '', row['name'], f"{row['price']:.2f}", row['stock_quantity'])
+
+    @timed()
+    def _patch_rows(self, changed_ids):
+        if not self.winfo_exists():
+            return
+        rows = [product_catalog.get(product_id) for product_id in changed_ids]
+        self.tree.update_rows([row for row in rows if row is not None])
+        self.tree.remove_keys([product_id for product_id, row in zip(changed_ids, rows) if row is None])
+
+    def _show_error(self, err, action="load products"):
+        messagebox.showerror("Database Error", f"Failed to {action}: {err}", parent=self)
 
     def search_products(self):
         self.load_products(self.search_entry.get())
@@ -252,20 +379,9 @@ class InventoryWindow(ctk.CTkToplevel):
         self.wait_window(dialog)
         
         if dialog.result:
-            res = dialog.result
-            conn = get_db_connection()
-            if not conn: return
-            cursor = conn.cursor()
-            try:
-                cursor.execute("INSERT INTO Products (name, price, stock_quantity) VALUES (%s, %s, %s)",
-                               (res['name'], res['price'], res['stock']))
-                conn.commit()
-                self.load_products()
-            except mysql.connector.Error as err:
-                messagebox.showerror("Database Error", f"Failed to add product: {err}", parent=self)
-            finally:
-                cursor.close()
-                conn.close()
+            self.db.submit(product_repo.insert, dialog.result, owner=self, timeout=0,
+                           on_done=self._on_product_saved,
+                           on_error=lambda err: self._show_error(err, "add product"))
 
     def edit_product(self):
         selected_item = self.tree.focus()
@@ -276,29 +392,22 @@ class InventoryWindow(ctk.CTkToplevel):
         item_values = self.tree.item(selected_item, 'values')
         product_info = {
             'product_id': item_values[0],
-            'name': item_values[1],
-            'price': item_values[2],
-            'stock_quantity': item_values[3]
+            'barcode': item_values[1],
+            'name': item_values[2],
+            'price': item_values[3],
+            'stock_quantity': item_values[4]
         }
         
         dialog = ProductDialog(self, product_info)
         self.wait_window(dialog)
 
         if dialog.result:
-            res = dialog.result
-            conn = get_db_connection()
-            if not conn: return
-            cursor = conn.cursor()
-            try:
-                cursor.execute("UPDATE Products SET name=%s, price=%s, stock_quantity=%s WHERE product_id=%s",
-                               (res['name'], res['price'], res['stock'], res['id']))
-                conn.commit()
-                self.load_products()
-            except mysql.connector.Error as err:
-                messagebox.showerror("Database Error", f"Failed to update product: {err}", parent=self)
-            finally:
-                cursor.close()
-                conn.close()
+            self.db.submit(product_repo.update, dialog.result, owner=self, timeout=0,
+                           on_done=self._on_product_saved,
+                           on_error=lambda err: self._show_error(err, "update product"))
+
+    def _on_product_saved(self, row):
+        product_catalog.upsert(row)  # the listener patches the row in
 
     def delete_product(self):
         selected_item = self.tree.focus()
@@ -306,26 +415,141 @@ class InventoryWindow(ctk.CTkToplevel):
             messagebox.showwarning("Selection Error", "Please select a product to delete.", parent=self)
             return
 
-        product_id = self.tree.item(selected_item, 'values')[0]
+        product_id = int(self.tree.item(selected_item, 'values')[0])
         
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this product?", parent=self):
-            conn = get_db_connection()
-            if not conn: return
-            cursor = conn.cursor()
-            try:
-                cursor.execute("SELECT COUNT(*) FROM SaleItems WHERE product_id = %s", (product_id,))
-                if cursor.fetchone()[0] > 0:
-                    messagebox.showerror("Deletion Error", "Cannot delete product as it is part of a past sale.", parent=self)
-                    return
-                
-                cursor.execute("DELETE FROM Products WHERE product_id = %s", (product_id,))
-                conn.commit()
-                self.load_products()
-            except mysql.connector.Error as err:
-                messagebox.showerror("Database Error", f"Failed to delete product: {err}", parent=self)
-            finally:
-                cursor.close()
-                conn.close()
+            self.db.submit(product_repo.delete_unsold, product_id, owner=self, timeout=0,
+                           on_done=lambda deleted: self._on_product_deleted(product_id, deleted),
+                           on_error=lambda err: self._show_error(err, "delete product"))
+
+    def _on_product_deleted(self, product_id, deleted):
+        if not deleted:
+            messagebox.showerror("Deletion Error", "Cannot delete product as it is part of a past sale.", parent=self)
+            return
+        product_catalog.remove(product_id)
+
+    def import_csv(self):
+        path = filedialog.askopenfilename(parent=self, title="Import products",
+                                          filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if path:
+            ImportWindow(self, path)
+
+
+class ImportWindow(ctk.CTkToplevel):
+    """Runs a CSV product import on a worker thread and shows its progress and rejected rows."""
+
+    def __init__(self, master, path):
+        super().__init__(master)
+        self.title(f"Import - {os.path.basename(path)}")
+        self.geometry("640x480")
+        self.transient(master)
+        self.db = master.db
+        self.path = path
+
+        self.add_stock = ctk.BooleanVar(value=False)
+        self.options_frame = ctk.CTkFrame(self)
+        self.options_frame.pack(pady=10, padx=10, fill="x")
+        ctk.CTkRadioButton(self.options_frame, text="Replace stock", variable=self.add_stock, value=False).pack(side="left", padx=5)
+        ctk.CTkRadioButton(self.options_frame, text="Add to stock", variable=self.add_stock, value=True).pack(side="left", padx=5)
+        self.start_button = ctk.CTkButton(self.options_frame, text="Start Import", command=self.start)
+        self.start_button.pack(side="right", padx=5)
+
+        self.progress = ctk.CTkProgressBar(self)
+        self.progress.set(0)
+        self.progress.pack(pady=5, padx=10, fill="x")
+        self.status_label = ctk.CTkLabel(self, text="Rows are matched to products by barcode.")
+        self.status_label.pack(pady=5)
+        self.errors_text = ctk.CTkTextbox(self, font=("Courier", 12))
+        self.errors_text.pack(pady=(0, 10), padx=10, fill="both", expand=True)
+
+    def start(self):
+        self.start_button.configure(state="disabled")
+        self.db.submit(import_products, product_repo, self.path, self.add_stock.get(), import_chunk_size,
+                       lambda report: self.db.call_in_ui(self._show_progress, report),
+                       owner=self, timeout=0, background=True, on_done=self._on_done,
+                       on_error=self._on_failed)
+
+    def _show_progress(self, report):
+        if self.winfo_exists():
+            self.progress.set(report.fraction)
+            self.status_label.configure(text=f"Importing... {report.describe()}")
+
+    def _on_done(self, report):
+        self._show_progress(report)
+        self.status_label.configure(text=f"Import finished: {report.describe()}")
+        if report.errors:
+            self.errors_text.insert("end", "\n".join(f"line {line}: {message}" for line, message in report.errors))
+            if report.error_count > len(report.errors):
+                self.errors_text.insert("end", f"\n... and {report.error_count - len(report.errors)} more")
+        # Pick up the imported rows now rather than a change-feed batch at a time
+        self.db.submit(product_catalog.refresh, timeout=0)
+
+    def _on_failed(self, err):
+        self.start_button.configure(state="normal")
+        if isinstance(err, ImportStoppedError):
+            # Show what went in before the failed chunk
+            self.status_label.configure(text=f"Import stopped at lines {err.first_line}-{err.last_line}: "
+                                             f"{err.report.inserted} added and {err.report.updated} updated before them")
+            self.db.submit(product_catalog.refresh, timeout=0)
+        else:
+            self.status_label.configure(text="Import stopped.")
+        messagebox.showerror("Import Error", f"Import {err}" if isinstance(err, ImportStoppedError)
+                             else f"Import failed: {err}", parent=self)
+
+class ExportWindow(ctk.CTkToplevel):
+    """Exports a quarter's sales, sale lines and daily GST totals to CSV or Parquet files."""
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("GST Export")
+        self.geometry("520x260")
+        self.transient(master)
+        self.db = master.db
+        self.quarters = {label: (start, end) for label, start, end in exporter.quarters(EXPORT_QUARTERS)}
+
+        self.quarter_menu = ctk.CTkOptionMenu(self, values=list(self.quarters))
+        self.quarter_menu.set(list(self.quarters)[1 if len(self.quarters) > 1 else 0])  # the last complete quarter
+        self.quarter_menu.pack(pady=(15, 5))
+        self.format_selector = ctk.CTkSegmentedButton(self, values=[fmt.upper() for fmt in exporter.FORMATS])
+        self.format_selector.set("CSV")
+        self.format_selector.pack(pady=5)
+        self.export_button = ctk.CTkButton(self, text="Choose Folder and Export", command=self.export)
+        self.export_button.pack(pady=10)
+        self.status_label = ctk.CTkLabel(self, text="", wraplength=480)
+        self.status_label.pack(pady=5)
+        if pos_service:
+            # Exports read the database directly, which a thin-client terminal never connects to
+            self.export_button.configure(state="disabled")
+            self.status_label.configure(text="This terminal uses the shared POS service and has no database "
+                                             "connection. Run the export on the database machine with:\n"
+                                             "python shop_billing.py --export-sales FOLDER")
+
+    def export(self):
+        if pos_service:
+            return
+        directory = filedialog.askdirectory(parent=self, title="Export to folder")
+        if not directory:
+            return
+        start, end = self.quarters[self.quarter_menu.get()]
+        self.export_button.configure(state="disabled")
+        self.status_label.configure(text="Exporting...")
+        self.db.submit(exporter.export_sales, acquire_db_connection, directory, start, end,
+                       self.format_selector.get().lower(), EXPORT_CHUNK_SIZE,
+                       lambda rows: self.db.call_in_ui(self._show_progress, rows),
+                       owner=self, timeout=0, background=True, on_done=self._on_done, on_error=self._on_failed)
+
+    def _show_progress(self, rows):
+        if self.winfo_exists():
+            self.status_label.configure(text=f"Exporting... {rows:,} rows written")
+
+    def _on_done(self, paths):
+        self.export_button.configure(state="normal")
+        self.status_label.configure(text="Exported:\n" + "\n".join(os.path.basename(path) for path in paths))
+
+    def _on_failed(self, err):
+        self.export_button.configure(state="normal")
+        self.status_label.configure(text="")
+        messagebox.showerror("Export Error", f"Export failed: {err}", parent=self)
 
 # --- NEW: FLATS MANAGEMENT WINDOW ---
 class FlatsWindow(ctk.CTkToplevel):
@@ -335,64 +559,83 @@ class FlatsWindow(ctk.CTkToplevel):
         self.geometry("800x600")
         self.transient(master)
         self.grab_set()
+        self.db = master.db
 
         self.search_frame = ctk.CTkFrame(self)
         self.search_frame.pack(pady=10, padx=10, fill="x")
         
         self.search_entry = ctk.CTkEntry(self.search_frame, placeholder_text="Search by flat number or resident name...")
         self.search_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        self.search_entry.bind("<KeyRelease>", lambda event: self.search_flats())
         self.search_button = ctk.CTkButton(self.search_frame, text="Search", command=self.search_flats)
         self.search_button.pack(side="left")
 
         self.tree_frame = ctk.CTkFrame(self)
         self.tree_frame.pack(pady=10, padx=10, fill="both", expand=True)
 
-        columns = ("id", "flat_number", "resident_name", "credit_balance")
-        self.tree = ttk.Treeview(self.tree_frame, columns=columns, show="headings")
-        self.tree.heading("id", text="ID")
-        self.tree.heading("flat_number", text="Flat Number")
-        self.tree.heading("resident_name", text="Resident Name")
-        self.tree.heading("credit_balance", text="Credit Balance (₹)")
+        # Largest dues first; balances are computed and sorted by the database, a page at a time
+        self.tree = PagedTreeview(self.tree_frame, self.db,
+                                  [("flat_id", "ID", 50), ("flat_number", "Flat Number", 150),
+                                   ("resident_name", "Resident Name", 250), ("credit_balance", "Credit Balance (₹)", 150)],
+                                  fetch=flat_repo.page, key="flat_id", sort="credit_balance", descending=True,
+                                  format_row=self._row_values, page_size=TABLE_PAGE_SIZE,
+                                  on_error=lambda err: messagebox.showerror("Database Error", f"Failed to load flats: {err}", parent=self))
         self.tree.pack(fill="both", expand=True)
-        
-        self.tree.column("id", width=50)
-        self.tree.column("flat_number", width=150)
-        self.tree.column("resident_name", width=250)
-        self.tree.column("credit_balance", width=150)
 
         self.button_frame = ctk.CTkFrame(self)
         self.button_frame.pack(pady=10, padx=10, fill="x")
 
         self.payment_button = ctk.CTkButton(self.button_frame, text="Record Payment", command=self.record_payment)
         self.payment_button.pack(side="left", padx=5)
+        self.statement_button = ctk.CTkButton(self.button_frame, text="Statement", command=self.show_statement)
+        self.statement_button.pack(side="left", padx=5)
+        self.aging_button = ctk.CTkButton(self.button_frame, text="Dues by Age",
+                                          command=lambda: FlatAgingWindow(self))
+        self.aging_button.pack(side="left", padx=5)
+
+        self._flats_listener = lambda changed_ids: self.db.call_in_ui(self._patch_rows, changed_ids)
+        flat_directory.add_listener(self._flats_listener)
+        self.bind("<Destroy>", lambda event: event.widget is self and flat_directory.remove_listener(self._flats_listener),
+                  add="+")
 
         self.load_flats()
 
     def load_flats(self, search_term=None):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self._search_term = search_term or ""
+        if not search_term:
+            self.db.cancel(("flats", id(self)))
+            self.tree.reload()
+        elif flat_directory.loaded:
+            self.tree.show_rows(flat_directory.search(search_term))
+        else:
+            # Searches run against the in-memory directory; load it the first time
+            self.db.submit(flat_directory.load, key=("flats", id(self)), owner=self,
+                           on_done=lambda _: self._search_term and self.load_flats(self._search_term),
+                           on_error=lambda err: messagebox.showerror("Database Error", f"Failed to load flats: {err}", parent=self))
 
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        
-        query = "SELECT flat_id, flat_number, resident_name, credit_balance FROM Flats"
-        params = []
-        if search_term:
-            query += " WHERE flat_number LIKE %s OR resident_name LIKE %s"
-            params.extend([f"%{search_term}%", f"%{search_term}%"])
-        
-        query += " ORDER BY credit_balance DESC"
-        
-        cursor.execute(query, params)
-        for row in cursor.fetchall():
-            self.tree.insert("", "end", values=(row['flat_id'], row['flat_number'], row['resident_name'], f"{row['credit_balance']:.2f}"))
-        
-        cursor.close()
-        conn.close()
+    def _row_values(self, row):
+        return (row['flat_id'], row['flat_number'], row['resident_name'], f"{row['credit_balance']:.2f}")
+
+    @timed()
+    def _patch_rows(self, changed_ids):
+        if not self.winfo_exists():
+            return
+        if changed_ids is None or not flat_directory.loaded:
+            # A full reload, or the directory has no rows to patch from
+            if self._search_term:
+                self.load_flats(self._search_term)
+            else:
+                self.tree.refresh()
+            return
+        rows = [flat_directory.get(flat_id) for flat_id in changed_ids]
+        self.tree.update_rows([row for row in rows if row is not None])
+        self.tree.remove_keys([flat_id for flat_id, row in zip(changed_ids, rows) if row is None])
 
     def search_flats(self):
-        self.load_flats(self.search_entry.get())
+        # Every key release lands here; only a changed term reloads
+        term = self.search_entry.get().strip()
+        if term != self._search_term:
+            self.load_flats(term)
 
     def record_payment(self):
         selected_item = self.tree.focus()
@@ -417,23 +660,114 @@ class FlatsWindow(ctk.CTkToplevel):
                 payment_amount = float(payment_str)
                 if payment_amount <= 0:
                     raise ValueError("Payment must be positive.")
-                if payment_amount > current_credit:
-                    messagebox.showerror("Error", "Payment cannot be more than the outstanding credit.", parent=self)
-                    return
-
-                conn = get_db_connection()
-                if not conn: return
-                cursor = conn.cursor()
-                cursor.execute("UPDATE Flats SET credit_balance = credit_balance - %s WHERE flat_id = %s", (payment_amount, flat_id))
-                conn.commit()
-                cursor.close()
-                conn.close()
-                
-                messagebox.showinfo("Success", f"Payment of ₹{payment_amount:.2f} recorded for flat {flat_number}.", parent=self)
-                self.load_flats()
-
             except (ValueError, TypeError):
                 messagebox.showerror("Invalid Input", "Please enter a valid payment amount.", parent=self)
+                return
+
+            if payment_amount > current_credit:
+                messagebox.showerror("Error", "Payment cannot be more than the outstanding credit.", parent=self)
+                return
+
+            self.db.submit(flat_repo.record_payment, flat_id, payment_amount, owner=self, timeout=0,
+                           on_done=lambda _: self._on_payment_recorded(int(flat_id), flat_number, payment_amount),
+                           on_error=lambda err: messagebox.showerror("Database Error", f"Failed to record payment: {err}", parent=self))
+
+    def _on_payment_recorded(self, flat_id, flat_number, payment_amount):
+        flat_directory.adjust_balance(flat_id, -payment_amount)
+        messagebox.showinfo("Success", f"Payment of ₹{payment_amount:.2f} recorded for flat {flat_number}.", parent=self)
+
+    def show_statement(self):
+        selected_item = self.tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Selection Error", "Please select a flat to see its statement.", parent=self)
+            return
+        item_values = self.tree.item(selected_item, 'values')
+        FlatStatementWindow(self, int(item_values[0]), item_values[1])
+
+
+class FlatStatementWindow(ctk.CTkToplevel):
+    """One flat's ledger for a calendar month: opening balance, charges and payments, closing balance."""
+
+    def __init__(self, master, flat_id, flat_number):
+        super().__init__(master)
+        self.title(f"Statement - Flat {flat_number}")
+        self.geometry("640x520")
+        self.transient(master)
+        self.db = master.db
+        self.flat_id = flat_id
+        self.flat_number = flat_number
+
+        this_month = ledger.month_start()
+        self.months = {}
+        for _ in range(STATEMENT_MONTHS):
+            self.months[this_month.strftime("%b %Y")] = this_month
+            this_month = ledger.month_start(this_month - datetime.timedelta(days=1))
+        self.month_selector = ctk.CTkSegmentedButton(self, values=list(reversed(self.months)), command=self.load)
+        self.month_selector.pack(pady=10, padx=10)
+        self.text = ctk.CTkTextbox(self, font=("Courier", 12))
+        self.text.pack(pady=(0, 10), padx=10, fill="both", expand=True)
+
+        first = next(iter(self.months))
+        self.month_selector.set(first)
+        self.load(first)
+
+    def load(self, label):
+        start = self.months[label]
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+        self.db.submit(flat_repo.statement, self.flat_id, start, end, key=("statement", id(self)), owner=self,
+                       on_done=lambda statement: self._show(label, statement),
+                       on_error=lambda err: messagebox.showerror("Database Error", f"Failed to load statement: {err}", parent=self))
+
+    def _show(self, label, statement):
+        lines = [f"Flat {self.flat_number} - {label}", "",
+                 f"{'Opening balance':<44}{statement['opening']:>12.2f}", ""]
+        for entry in statement['entries']:
+            day = str(entry['entry_date'])[:16]
+            detail = f"Sale #{entry['sale_id']}" if entry['sale_id'] else (entry['note'] or entry['kind'].title())
+            lines.append(f"{day:<18}{detail:<26}{entry['amount']:>12.2f}")
+        if not statement['entries']:
+            lines.append("No charges or payments this month.")
+        lines += ["", f"{'Closing balance':<44}{statement['closing']:>12.2f}"]
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", "\n".join(lines))
+        self.text.configure(state="disabled")
+
+
+class FlatAgingWindow(ctk.CTkToplevel):
+    """Every flat with dues, split by how long ago the unpaid charges were made."""
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("Dues by Age")
+        self.geometry("820x520")
+        self.transient(master)
+        self.db = master.db
+
+        buckets = ledger.labels()
+        columns = ("flat_number", "resident_name", "balance") + tuple(buckets)
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        self.tree.heading("flat_number", text="Flat Number")
+        self.tree.heading("resident_name", text="Resident Name")
+        self.tree.heading("balance", text="Balance (₹)")
+        self.tree.column("flat_number", width=100)
+        self.tree.column("resident_name", width=200)
+        self.tree.column("balance", width=100)
+        for label in buckets:
+            self.tree.heading(label, text=f"{label} days")
+            self.tree.column(label, width=90)
+        self.tree.pack(pady=10, padx=10, fill="both", expand=True)
+
+        self.db.submit(flat_repo.aging, owner=self, on_done=self._show,
+                       on_error=lambda err: messagebox.showerror("Database Error", f"Failed to load dues: {err}", parent=self))
+
+    @timed()
+    def _show(self, rows):
+        # Longest-overdue first
+        for row in sorted(rows, key=lambda row: list(reversed(row['buckets'])), reverse=True):
+            flat = flat_directory.get(row['flat_id']) or {'flat_number': row['flat_id'], 'resident_name': ''}
+            self.tree.insert("", "end", values=(flat['flat_number'], flat['resident_name'], f"{row['balance']:.2f}",
+                                                *(f"{amount:.2f}" for amount in row['buckets'])))
 
 # --- NEW: SALES REPORTS WINDOW ---
 class ReportsWindow(ctk.CTkToplevel):
@@ -443,6 +777,12 @@ class ReportsWindow(ctk.CTkToplevel):
         self.geometry("900x700")
         self.transient(master)
         self.grab_set()
+        self.db = master.db
+        self.products = {}
+        self.period_days = REPORT_PERIODS[0]
+        self._chart_image = None    # PhotoImages must stay referenced while shown
+        self._heatmap_image = None
+        self._resize_job = None
 
         # --- Top Frame for Controls ---
         self.controls_frame = ctk.CTkFrame(self)
@@ -455,9 +795,23 @@ class ReportsWindow(ctk.CTkToplevel):
         self.product_combo.pack(side="left", padx=5)
         self.load_products_for_combo()
 
-        # --- Main content frame ---
-        self.content_frame = ctk.CTkFrame(self)
-        self.content_frame.pack(pady=10, padx=10, fill="both", expand=True)
+        self.period_selector = ctk.CTkSegmentedButton(self.controls_frame,
+                                                      values=[f"{days} days" for days in REPORT_PERIODS],
+                                                      command=self.on_period_select)
+        self.period_selector.set(f"{self.period_days} days")
+        self.period_selector.pack(side="left", padx=(20,5))
+
+        self.export_button = ctk.CTkButton(self.controls_frame, text="GST Export...", width=110,
+                                           command=lambda: ExportWindow(self))
+        self.export_button.pack(side="right", padx=5)
+
+        # --- Report tabs: one product's daily sales, then catalog-wide analytics ---
+        self.tabs = ctk.CTkTabview(self)
+        self.tabs.pack(pady=10, padx=10, fill="both", expand=True)
+        for name in ("Product", "Top Sellers", "ABC", "Slow Movers", "Heatmap", "Compare"):
+            self.tabs.add(name)
+
+        self.content_frame = self.tabs.tab("Product")
         self.content_frame.grid_columnconfigure(0, weight=1)
         self.content_frame.grid_rowconfigure(1, weight=1)
 
@@ -465,86 +819,244 @@ class ReportsWindow(ctk.CTkToplevel):
         self.stats_frame = ctk.CTkFrame(self.content_frame)
         self.stats_frame.grid(row=0, column=0, pady=10, padx=10, sticky="ew")
         
-        self.total_sold_label = ctk.CTkLabel(self.stats_frame, text="Total Units Sold (Last 30 Days): N/A", font=("Arial", 14))
+        self.total_sold_label = ctk.CTkLabel(self.stats_frame, text=f"Total Units Sold (Last {self.period_days} Days): N/A", font=("Arial", 14))
         self.total_sold_label.pack(pady=2)
-        self.total_revenue_label = ctk.CTkLabel(self.stats_frame, text="Total Revenue (Last 30 Days): N/A", font=("Arial", 14))
+        self.total_revenue_label = ctk.CTkLabel(self.stats_frame, text=f"Total Revenue (Last {self.period_days} Days): N/A", font=("Arial", 14))
         self.total_revenue_label.pack(pady=2)
 
-        # Frame for the graph
+        # Frame for the graph: an image rendered on a worker thread (see charts.py), sized to the frame
         self.graph_frame = ctk.CTkFrame(self.content_frame, fg_color="white")
         self.graph_frame.grid(row=1, column=0, pady=10, padx=10, sticky="nsew")
+        self.graph_frame.pack_propagate(False)  # the image follows the frame's size, not the other way round
+        self.graph_label = Label(self.graph_frame, bg="white", bd=0, highlightthickness=0, font=("Arial", 12), wraplength=600)
+        self.graph_label.pack(fill="both", expand=True)
+        self.graph_frame.bind("<Configure>", self._on_graph_resize)
 
-        self.fig = Figure(figsize=(5, 4), dpi=100)
-        self.ax = self.fig.add_subplot(111)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
-        self.canvas.get_tk_widget().pack(fill="both", expand=True)
-        
         self.show_placeholder_graph()
 
+        # Up/Down step through the products; charts already seen come from the cache without a query
+        self.bind("<Up>", lambda event: self.scrub_products(-1))
+        self.bind("<Down>", lambda event: self.scrub_products(1))
+
+        self.top_summary, self.top_table = self._make_table(
+            "Top Sellers", [("name", "Product", 320), ("units", "Units", 90), ("revenue", "Revenue (₹)", 120),
+                            ("share", "Share", 80)])
+        self.abc_summary, self.abc_table = self._make_table(
+            "ABC", [("name", "Product", 320), ("class", "Class", 60), ("revenue", "Revenue (₹)", 120),
+                    ("cumulative", "Cumulative", 100)])
+        self.slow_summary, self.slow_table = self._make_table(
+            "Slow Movers", [("name", "Product", 320), ("units", "Units Sold", 100), ("stock", "In Stock", 100)])
+        self.compare_summary, self.compare_table = self._make_table(
+            "Compare", [("name", "Product", 320), ("now", "This Period (₹)", 120), ("before", "Previous (₹)", 120),
+                        ("change", "Change (₹)", 120)])
+        self.heatmap_label = Label(self.tabs.tab("Heatmap"), bg="white", bd=0, text="Loading...", font=("Arial", 12))
+        self.heatmap_label.pack(fill="both", expand=True)
+
+        self.load_analytics()
+
+    def _make_table(self, tab, columns):
+        summary = ctk.CTkLabel(self.tabs.tab(tab), text="Loading...", font=("Arial", 14))
+        summary.pack(pady=5)
+        table = ttk.Treeview(self.tabs.tab(tab), columns=[key for key, _, _ in columns], show="headings")
+        for key, title, width in columns:
+            table.heading(key, text=title)
+            table.column(key, width=width, anchor="w" if key == "name" else "e")
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+        return summary, table
+
+    def load_analytics(self):
+        # The service uses its own catalog's stock
+        stock = None if pos_service else {row['product_id']: row['stock_quantity'] for row in product_catalog.all_products()}
+        self.db.submit(sales_report, self.period_days, stock, key=("analytics", id(self)), owner=self,
+                       timeout=0, background=True, on_done=self.show_analytics,
+                       on_error=lambda err: self.top_summary.configure(text=f"Could not load analytics: {err}"))
+
+    @timed()
+    def show_analytics(self, report):
+        name = lambda product_id: (product_catalog.get(product_id) or {}).get('name', f"#{product_id}")
+        totals = report['totals']
+        period = f"Last {report['days']} days"
+
+        self._fill_table(self.top_table, [(name(pid), units, f"{revenue:,.2f}", f"{share:.1%}")
+                                          for pid, units, revenue, share in report['top']])
+        self.top_summary.configure(text=f"{period}: {totals['sales']:,} sales, {totals['units']:,} units, "
+                                        f"₹{totals['revenue']:,.2f} before GST, {totals['products_sold']:,} products sold")
+
+        abc = report['abc']
+        self._fill_table(self.abc_table, [(name(pid), label, f"{revenue:,.2f}", f"{cumulative:.1%}")
+                                          for pid, label, revenue, cumulative in abc['rows'][:REPORT_TABLE_ROWS]])
+        self.abc_summary.configure(text="   ".join(f"{label}: {count} products, {share:.0%} of revenue"
+                                                   for label, count, share in abc['summary']) or "No sales")
+
+        self._fill_table(self.slow_table, [(name(pid), units, stock) for pid, units, stock in report['slow']])
+        self.slow_summary.configure(text=f"In-stock products that sold least ({period.lower()})")
+
+        comparison = report['comparison']
+        rows = comparison['risers'] + comparison['fallers']
+        self._fill_table(self.compare_table, [(name(pid), f"{now:,.2f}", f"{before:,.2f}", f"{change:+,.2f}")
+                                              for pid, now, before, change in rows])
+        change = comparison['change_pct']
+        self.compare_summary.configure(
+            text=f"Revenue ₹{comparison['revenue']:,.2f} vs ₹{comparison['previous_revenue']:,.2f} in the "
+                 f"previous {report['days']} days" + (f" ({change:+.1f}%)" if change is not None else ""))
+
+        self.db.submit(heatmap_chart, f"Sales by weekday and hour ({period.lower()})",
+                       report['heatmap']['counts'], self._chart_size(self.heatmap_label),
+                       key=("heatmap", id(self)), owner=self, background=True, on_done=self._show_heatmap,
+                       on_error=lambda err: self.heatmap_label.configure(image="", text=f"Could not draw the heatmap: {err}"))
+
+    def _show_heatmap(self, data):
+        self._heatmap_image = PhotoImage(data=data)
+        self.heatmap_label.configure(image=self._heatmap_image, text="")
+
+    def _fill_table(self, table, rows):
+        table.delete(*table.get_children())
+        for row in rows:
+            table.insert("", "end", values=row)
+
     def load_products_for_combo(self):
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT product_id, name FROM Products ORDER BY name")
-        self.products = {row['name']: row['product_id'] for row in cursor.fetchall()}
-        self.product_combo.configure(values=list(self.products.keys()))
-        cursor.close()
-        conn.close()
+        # Show what the cache already has, then pick up changes from the database
+        self._fill_combo()
+        self.db.submit(product_catalog.refresh, owner=self, on_done=lambda _: self._fill_combo())
+
+    def _fill_combo(self):
+        self.products = {row['name']: row['product_id'] for row in product_catalog.all_products()}
+        self.product_names = list(self.products.keys())
+        self.product_combo.configure(values=self.product_names)
+
+    def on_period_select(self, value):
+        self.period_days = int(value.split()[0])
+        self.on_product_select(self.product_combo.get())
+        self.load_analytics()
 
     def on_product_select(self, selected_product_name):
         product_id = self.products.get(selected_product_name)
         if not product_id: return
 
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        
-        # Query for sales data in the last 30 days
-        query = """
-            SELECT 
-                DATE(s.sale_date) as sale_day, 
-                SUM(si.quantity_sold) as total_quantity,
-                SUM(si.quantity_sold * si.price_at_sale) as daily_revenue
-            FROM Sales s
-            JOIN SaleItems si ON s.sale_id = si.sale_id
-            WHERE si.product_id = %s AND s.sale_date >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-            GROUP BY sale_day
-            ORDER BY sale_day;
-        """
-        cursor.execute(query, (product_id,))
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        if not data:
-            self.show_placeholder_graph(f"No sales data for '{selected_product_name}' in the last 30 days.")
-            self.total_sold_label.configure(text="Total Units Sold (Last 30 Days): 0")
-            self.total_revenue_label.configure(text="Total Revenue (Last 30 Days): ₹0.00")
+        days, size = self.period_days, self._chart_size(self.graph_label)
+        cached = _report_charts and _report_charts.cached_product(product_id, days, size)
+        if cached:
+            # Seen recently at this size: no query, no rendering
+            self.db.cancel(("report", id(self)))
+            self.show_sales(selected_product_name, *cached)
             return
 
-        dates = [row['sale_day'].strftime('%b %d') for row in data]
-        quantities = [row['total_quantity'] for row in data]
-        
-        total_sold = sum(quantities)
-        total_revenue = sum(row['daily_revenue'] for row in data)
-
-        self.total_sold_label.configure(text=f"Total Units Sold (Last 30 Days): {total_sold}")
-        self.total_revenue_label.configure(text=f"Total Revenue (Last 30 Days): ₹{total_revenue:.2f}")
-        
-        self.ax.clear()
-        self.ax.bar(dates, quantities, color='#3498db')
-        self.ax.set_title(f"Daily Sales for {selected_product_name}")
-        self.ax.set_ylabel("Quantity Sold")
-        self.ax.tick_params(axis='x', rotation=45)
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self.total_sold_label.configure(text=f"Loading sales for '{selected_product_name}'...")
+        self.total_revenue_label.configure(text="")
+        # Reads the pre-aggregated daily rollup, so even a year is a few hundred rows, and draws the
+        # chart on the worker. Flipping through products quickly cancels the ones skipped over.
+        self.db.submit(product_chart, product_id, selected_product_name, days, size, key=("report", id(self)),
+                       owner=self, on_done=lambda result: self.show_sales(selected_product_name, *result),
+                       on_error=lambda err: self.show_placeholder_graph(f"Could not load sales data: {err}"))
+
+    @timed()
+    def show_sales(self, selected_product_name, series, image):
+        days = self.period_days
+        self.total_sold_label.configure(text=f"Total Units Sold (Last {days} Days): {series.total_units}")
+        self.total_revenue_label.configure(text=f"Total Revenue (Last {days} Days): ₹{series.total_revenue:.2f}")
+        if not series.total_units:
+            self.show_placeholder_graph(f"No sales data for '{selected_product_name}' in the last {days} days.")
+            return
+        self._chart_image = PhotoImage(data=image)
+        self.graph_label.configure(image=self._chart_image, text="")
 
     def show_placeholder_graph(self, text="Select a product to see its sales graph"):
-        self.ax.clear()
-        self.ax.text(0.5, 0.5, text, ha='center', va='center', fontsize=12, wrap=True)
-        self.ax.set_xticks([])
-        self.ax.set_yticks([])
-        self.canvas.draw()
+        self._chart_image = None
+        self.graph_label.configure(image="", text=text)
+
+    def scrub_products(self, step):
+        if self.tabs.get() != "Product" or not self.products:
+            return
+        current = self.product_combo.get()
+        index = self.product_names.index(current) + step if current in self.products else 0
+        name = self.product_names[max(0, min(index, len(self.product_names) - 1))]
+        if name != current:
+            self.product_combo.set(name)
+            self.on_product_select(name)
+        return "break"
+
+    def _chart_size(self, widget):
+        """Pixel size for a chart shown in `widget`; a default until the window is laid out."""
+        width, height = widget.winfo_width(), widget.winfo_height()
+        return (width, height) if width > 100 and height > 100 else (840, 480)
+
+    def _on_graph_resize(self, event):
+        # Redraw once the user stops dragging, not for every intermediate size
+        if self._resize_job:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(250, self._redraw_after_resize)
+
+    def _redraw_after_resize(self):
+        self._resize_job = None
+        if self._chart_image is not None:
+            self.on_product_select(self.product_combo.get())
+
+
+# --- DIAGNOSTICS WINDOW ---
+class DiagnosticsWindow(ctk.CTkToplevel):
+    """Top offenders from the in-memory latency histograms, plus the most recent slow operations."""
+
+    SORT_KEYS = {"Total time": 'total_ms', "p95": 'p95_ms', "Max": 'max_ms', "Count": 'count'}
+
+    def __init__(self, master=None):
+        super().__init__(master)
+        self.title("Diagnostics")
+        self.geometry("1000x650")
+        self.transient(master)
+
+        self.controls_frame = ctk.CTkFrame(self)
+        self.controls_frame.pack(pady=10, padx=10, fill="x")
+        self.sort_selector = ctk.CTkSegmentedButton(self.controls_frame, values=list(self.SORT_KEYS),
+                                                    command=lambda _: self.refresh())
+        self.sort_selector.set("Total time")
+        self.sort_selector.pack(side="left", padx=5)
+        self.refresh_button = ctk.CTkButton(self.controls_frame, text="Refresh", width=90, command=self.refresh)
+        self.refresh_button.pack(side="left", padx=5)
+        self.reset_button = ctk.CTkButton(self.controls_frame, text="Reset", width=90, command=self.reset)
+        self.reset_button.pack(side="left", padx=5)
+        self.pool_label = ctk.CTkLabel(self.controls_frame, text="", text_color="gray60")
+        self.pool_label.pack(side="right", padx=10)
+
+        columns = ("kind", "count", "p50", "p95", "max", "total", "name")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=16)
+        for column, heading, width in (("kind", "Kind", 50), ("count", "Count", 70), ("p50", "p50 ms", 80),
+                                       ("p95", "p95 ms", 80), ("max", "Max ms", 80), ("total", "Total ms", 90),
+                                       ("name", "Operation", 520)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor="w" if column == "name" else "e")
+        self.tree.pack(pady=(0, 10), padx=10, fill="both", expand=True)
+
+        self.slow_label = ctk.CTkLabel(self, text=f"Recent slow operations (logged to {os.path.basename(SLOW_LOG_PATH)})")
+        self.slow_label.pack(padx=10, anchor="w")
+        self.slow_text = ctk.CTkTextbox(self, height=160, font=("Courier", 12))
+        self.slow_text.pack(pady=(0, 10), padx=10, fill="x")
+
+        self.refresh()
+
+    def refresh(self):
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        for r in metrics.top(50, by=self.SORT_KEYS[self.sort_selector.get()]):
+            self.tree.insert("", "end", values=(r['kind'], r['count'], f"{r['p50_ms']:.1f}", f"{r['p95_ms']:.1f}",
+                                                f"{r['max_ms']:.1f}", f"{r['total_ms']:.0f}", r['name']))
+
+        self.slow_text.configure(state="normal")
+        self.slow_text.delete("1.0", "end")
+        for when, kind, name, ms, detail in reversed(metrics.slow_operations()):
+            self.slow_text.insert("end", f"{when}  {kind:<4} {ms:8.1f} ms  {name}  {detail}\n")
+        self.slow_text.configure(state="disabled")
+
+        try:
+            stats = get_pool_stats()
+        except ServiceUnavailableError:
+            self.pool_label.configure(text="Pool: POS service unreachable")
+            return
+        self.pool_label.configure(text=f"Pool: {stats['in_use']}/{stats['size']} in use, "
+                                       f"avg wait {stats['wait_time_avg'] * 1000:.1f} ms, {stats['timeouts']} timeouts")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
 
 
 # --- CHECKOUT DIALOG ---
@@ -552,9 +1064,11 @@ class CheckoutDialog(ctk.CTkToplevel):
     def __init__(self, master, total_amount):
         super().__init__(master)
         self.title("Checkout")
-        self.geometry("400x300")
+        self.geometry("400x350")
         self.transient(master)
         self.grab_set()
+        self.db = master.db
+        self.flats = {}
 
         self.total_amount = total_amount
         self.result = None
@@ -568,6 +1082,9 @@ class CheckoutDialog(ctk.CTkToplevel):
         self.credit_radio = ctk.CTkRadioButton(self, text="Add to Flat Credit", variable=self.payment_method_var, value="Credit", command=self.toggle_flat_select)
         self.credit_radio.pack(pady=5)
 
+        self.flat_search_entry = ctk.CTkEntry(self, width=250, placeholder_text="Find flat or resident...", state="disabled")
+        self.flat_search_entry.pack(pady=(10,0))
+        self.flat_search_entry.bind("<KeyRelease>", self.filter_flats)
         self.flat_combo = ctk.CTkComboBox(self, state="disabled")
         self.flat_combo.pack(pady=10)
         self.load_flats()
@@ -576,19 +1093,35 @@ class CheckoutDialog(ctk.CTkToplevel):
         self.confirm_button.pack(pady=20)
 
     def load_flats(self):
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT flat_id, flat_number, resident_name FROM Flats ORDER BY flat_number")
-        self.flats = {f"{row['flat_number']} ({row['resident_name'] or ''})": row['flat_id'] for row in cursor.fetchall()}
+        if flat_directory.loaded:
+            self._fill_flats()
+        else:
+            self.db.submit(flat_directory.load, owner=self, on_done=lambda _: self._fill_flats())
+
+    def _fill_flats(self):
+        rows = sorted(flat_directory.all(), key=lambda row: row['flat_number'])
+        self.flats = {self._flat_label(row): row['flat_id'] for row in rows}
         self.flat_combo.configure(values=list(self.flats.keys()))
-        cursor.close()
-        conn.close()
+
+    def _flat_label(self, row):
+        return f"{row['flat_number']} ({row['resident_name'] or ''})"
+
+    def filter_flats(self, event=None):
+        term = self.flat_search_entry.get()
+        if not term:
+            self.flat_combo.configure(values=list(self.flats.keys()))
+            return
+        matches = [self._flat_label(row) for row in flat_directory.search(term, limit=20)]
+        self.flat_combo.configure(values=matches)
+        if matches:
+            self.flat_combo.set(matches[0])
 
     def toggle_flat_select(self):
         if self.payment_method_var.get() == "Credit":
+            self.flat_search_entry.configure(state="normal")
             self.flat_combo.configure(state="readonly")
         else:
+            self.flat_search_entry.configure(state="disabled")
             self.flat_combo.configure(state="disabled")
 
     def confirm(self):
@@ -605,15 +1138,91 @@ class CheckoutDialog(ctk.CTkToplevel):
         self.destroy()
 
 
+# --- SHORT-OF-STOCK SALES ---
+class ShortSalesWindow(ctk.CTkToplevel):
+    """
+    Journaled sales the database refused for stock when they were synced (another lane sold the
+    last units first). Each one is either recorded anyway, taking the stock below zero so the count
+    can be corrected, or voided if the goods did not leave the shop.
+    """
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("Sales Short of Stock")
+        self.geometry("760x420")
+        self.transient(master)
+        self.journal = master.journal
+        self.replicator = master.replicator
+        self.on_change = master._on_journal_change
+
+        columns = ("created_at", "total", "payment", "shortage")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", selectmode="browse")
+        for column, title, width in (("created_at", "Taken At", 140), ("total", "Total (₹)", 90),
+                                     ("payment", "Payment", 80), ("shortage", "Shortage", 420)):
+            self.tree.heading(column, text=title)
+            self.tree.column(column, width=width)
+        self.tree.pack(pady=10, padx=10, fill="both", expand=True)
+
+        self.button_frame = ctk.CTkFrame(self)
+        self.button_frame.pack(pady=(0, 10), padx=10, fill="x")
+        ctk.CTkButton(self.button_frame, text="Record Anyway", command=self.approve).pack(side="left", padx=5)
+        ctk.CTkButton(self.button_frame, text="Void Sale", fg_color="#E74C3C", hover_color="#C0392B",
+                      command=self.void).pack(side="left", padx=5)
+        self.load()
+
+    def load(self):
+        self.tree.delete(*self.tree.get_children())
+        for entry in self.journal.shortages():
+            self.tree.insert("", "end", iid=str(entry.seq), values=(entry.created_at, f"{entry.total_amount:.2f}",
+                                                                   entry.payment_method, entry.note or ""))
+
+    def _selected(self):
+        seq = self.tree.focus()
+        if not seq:
+            messagebox.showwarning("Selection Error", "Please select a sale.", parent=self)
+        return int(seq) if seq else None
+
+    def approve(self):
+        seq = self._selected()
+        if seq is not None and messagebox.askyesno(
+                "Record Sale", "Record this sale even though the stock is not there? The products' stock "
+                               "will go below zero until it is corrected.", parent=self):
+            self.journal.approve(seq)
+            self.replicator.wake()
+            self._changed()
+
+    def void(self):
+        seq = self._selected()
+        if seq is not None and messagebox.askyesno(
+                "Void Sale", "Void this sale? It will not be recorded at all.", parent=self):
+            self.journal.void(seq, "voided after a stock shortage", status='short')
+            self._changed()
+
+    def _changed(self):
+        self.load()
+        self.on_change(self.journal.counts())
+
+
 # --- MAIN APPLICATION ---
 class App(ctk.CTk):
-    def __init__(self):
+    # Phases --profile-startup waits for before printing its report
+    STARTUP_PHASES = ("window shown", "schema checked", "GST rate loaded", "change feed started", "product list loaded")
+
+    def __init__(self, profile_startup=False):
         super().__init__()
         self.title("Society StorePro")
         self.geometry("1100x700")
 
-        self.cart = {} # {product_id: {'name': str, 'price': float, 'quantity': int}}
         self.gst_rate = 18.0 # Default, will be loaded from DB
+        self.cart = Cart(self.gst_rate)
+        self.cart.add_listener(self._on_cart_change)
+        self._cart_rows = {} # product_id -> (row frame, label)
+        self._scan_queue = deque()
+        self._scan_drain_pending = False
+
+        # All database work runs on worker threads; results come back through after() callbacks
+        self.db = DbExecutor(self, max_workers=DB_WORKER_THREADS, default_timeout=DB_TASK_TIMEOUT,
+                             on_error=self.show_db_error, background_workers=DB_BACKGROUND_THREADS)
 
         # --- Main Layout ---
         self.grid_columnconfigure(0, weight=2)
@@ -623,7 +1232,7 @@ class App(ctk.CTk):
         # Left Frame (Product Selection)
         self.left_frame = ctk.CTkFrame(self)
         self.left_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
-        self.left_frame.grid_rowconfigure(2, weight=1) # Make product list frame expand
+        self.left_frame.grid_rowconfigure(3, weight=1) # Make product list frame expand
 
         # Menu Bar
         self.menu_frame = ctk.CTkFrame(self.left_frame, height=40)
@@ -636,13 +1245,44 @@ class App(ctk.CTk):
         self.flats_button.pack(side="left", padx=5, pady=5)
         self.reports_button = ctk.CTkButton(self.menu_frame, text="Sales Reports", command=self.open_reports_window)
         self.reports_button.pack(side="left", padx=5, pady=5)
+        self.busy_label = ctk.CTkLabel(self.menu_frame, text="", text_color="gray60")
+        self.busy_label.pack(side="right", padx=10)
+        self.db.add_busy_listener(self._on_db_busy)
+        self.sync_label = ctk.CTkLabel(self.menu_frame, text="", text_color="gray60")
+        self.sync_label.pack(side="right", padx=10)
+        self.sync_label.bind("<Button-1>", lambda _: self.journal.counts()['short'] and ShortSalesWindow(self))
+        self.feed_label = ctk.CTkLabel(self.menu_frame, text="", text_color="gray60")
+        self.feed_label.pack(side="right", padx=10)
         
+        # Barcode scanner input (keyboard-wedge scanners type the code followed by Enter)
+        self.scan_frame = ctk.CTkFrame(self.left_frame, fg_color="transparent")
+        self.scan_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=(10,0))
+        self.scan_entry = ctk.CTkEntry(self.scan_frame, placeholder_text="Scan barcode (F2), e.g. 3*8901234567890 for 3 units...")
+        self.scan_entry.pack(side="left", fill="x", expand=True)
+        self.scan_entry.bind("<Return>", self.on_scan)
+        self.scan_status_label = ctk.CTkLabel(self.scan_frame, text="", width=220, anchor="e")
+        self.scan_status_label.pack(side="left", padx=(10,0))
+        self.bind("<F2>", lambda event: self.scan_entry.focus_set())
+        self.bind("<F12>", lambda event: self.open_diagnostics_window())
+
         self.product_search_entry = ctk.CTkEntry(self.left_frame, placeholder_text="Search and add product by name...")
-        self.product_search_entry.grid(row=1, column=0, sticky="ew", padx=10, pady=10)
+        self.product_search_entry.grid(row=2, column=0, sticky="ew", padx=10, pady=10)
         self.product_search_entry.bind("<Return>", self.add_product_to_cart_by_name)
+        self.product_search_dropdown = TypeAheadDropdown(
+            self.product_search_entry,
+            search=lambda text: product_catalog.search(text, limit=8, in_stock_only=True),
+            item_text=lambda p: f"{p['name']} - ₹{p['price']:.2f} (In Stock: {p['stock_quantity']})",
+            on_choose=self._choose_search_result,
+        )
 
-        self.product_list_frame = ctk.CTkScrollableFrame(self.left_frame, label_text="Available Products")
-        self.product_list_frame.grid(row=2, column=0, sticky="nsew", padx=10, pady=10)
+        # Only the visible rows exist as widgets, so this stays fast with any catalog size
+        self.product_list = VirtualList(self.left_frame, label_text="Available Products",
+                                        row_text=self._product_row_text, command=self._on_product_row_click,
+                                        empty_text="No products in stock.\n\nPlease add products using the\n'Manage Inventory' button.")
+        self.product_list.grid(row=3, column=0, sticky="nsew", padx=10, pady=10)
+        self._listed_names = {} # product_id -> name, for the products currently in the list
+        # The catalog may change on a worker thread; hop to the Tk thread before touching widgets
+        product_catalog.add_listener(lambda changed_ids: self.db.call_in_ui(self._on_catalog_change, changed_ids))
 
         # Right Frame (Cart)
         self.right_frame = ctk.CTkFrame(self, fg_color="#2B2B2B")
@@ -667,45 +1307,154 @@ class App(ctk.CTk):
         self.checkout_button = ctk.CTkButton(self.right_frame, text="Checkout", command=self.checkout)
         self.checkout_button.pack(pady=10, fill="x", padx=10)
         
-        self.load_gst_rate()
-        self.populate_product_list()
-
-    def populate_product_list(self):
-        for widget in self.product_list_frame.winfo_children():
-            widget.destroy()
+        # Sales go to the local journal first; the replicator copies them to the database
+        self.journal = SaleJournal(JOURNAL_PATH)
+        self.journal.release_held()
+        if pos_service:
+            connect, commit = (lambda: pos_service), pos_service.commit_sale
+        else:
+            connect, commit = acquire_db_connection, commit_sale
+        self.replicator = JournalReplicator(
+            self.journal, connect, _is_transient_db_error, commit=commit,
+            batch_size=JOURNAL_BATCH_SIZE, interval=JOURNAL_SYNC_INTERVAL, max_backoff=JOURNAL_MAX_BACKOFF,
+            on_change=lambda counts: self.db.call_in_ui(self._on_journal_change, counts),
+            on_rejected=lambda entry, err: self.db.call_in_ui(self._on_sale_rejected, entry, err),
+        )
+        self._on_journal_change(self.journal.counts())
+
+        # Changes from other terminals; the caches' listeners patch the visible rows
+        self.feed = ChangeFeed(change_log_repo, interval=CHANGE_FEED_INTERVAL,
+                               on_error=lambda err: self.db.call_in_ui(self._on_feed_error, err),
+                               on_recovered=lambda: self.db.call_in_ui(self._on_feed_error, None))
+        self.feed.subscribe(PRODUCT, product_catalog.apply_changes)
+        self.feed.subscribe(FLAT, flat_directory.apply_changes)
+        self.feed.subscribe(SHOP, lambda _: self.db.call_in_ui(self._apply_gst_rate, shop_info_repo.gst_rate()))
+
+        # The window is usable (scanning goes to the journal) before any data arrives: the schema check
+        # and everything after it run on the workers and fill the window in as they finish
+        self.profile_startup = profile_startup
+        self._startup_waiting = set(self.STARTUP_PHASES)
+        startup_profile.mark("window built")
+        self.after_idle(lambda: self._startup_phase("window shown"))
+        self.db.submit(setup_database, timeout=0, on_done=lambda _: self._start_loading(),
+                       on_error=self._on_setup_failed)
+        self.scan_entry.focus_set()
+
+    def _on_setup_failed(self, err):
+        messagebox.showerror("Database Setup Error", f"Error: {err}\nPlease check DB_BACKEND / DB_CONFIG in the code.")
+        self._start_loading()
+
+    def _start_loading(self):
+        self._startup_phase("schema checked")
+        self.replicator.start()
+        self.db.submit(self.journal.prune, JOURNAL_KEEP_DAYS, timeout=0, background=True)
+        if not pos_service:
+            self.db.submit(change_log_repo.prune, CHANGE_LOG_KEEP_DAYS, timeout=0, background=True)
+            self.db.submit(flat_repo.take_due_snapshot, timeout=0, background=True)
+
+        self.db.submit(shop_info_repo.gst_rate, on_done=self._after_phase("GST rate loaded", self._apply_gst_rate),
+                       on_error=self._after_phase("GST rate loaded", self.show_db_error, failed=True))
+        # The feed marks its starting point before the catalog loads, so nothing falls in between
+        self.db.submit(self.feed.start, timeout=0,
+                       on_done=self._after_phase("change feed started", lambda _: self.populate_product_list(
+                           on_done=self._after_phase("product list loaded"),
+                           on_error=self._after_phase("product list loaded", self.show_db_error, failed=True))),
+                       on_error=self._on_feed_start_failed)
+
+    def _on_feed_start_failed(self, err):
+        self.show_db_error(err)
+        self._startup_phase("change feed started", failed=True)
+        self._startup_phase("product list loaded", failed=True)
+
+    def _after_phase(self, phase, callback=None, failed=False):
+        """A task callback that runs `callback` and then records `phase` as finished."""
+        def done(value):
+            if callback:
+                callback(value)
+            self._startup_phase(phase, failed)
+        return done
+
+    def _startup_phase(self, phase, failed=False):
+        if phase not in self._startup_waiting:
+            return
+        self._startup_waiting.discard(phase)
+        startup_profile.mark(phase + (" (failed)" if failed else ""))
+        if self.profile_startup and not self._startup_waiting:
+            print("Startup profile:")
+            print(startup_profile.report())
+            self.destroy()
+
+    def show_db_error(self, err):
+        messagebox.showerror("Database Error", f"Error: {err}")
+
+    def _on_db_busy(self, pending):
+        self.busy_label.configure(text="Loading..." if pending else "")
+
+    def _on_journal_change(self, counts):
+        if counts['rejected']:
+            self.sync_label.configure(text=f"{counts['rejected']} sale(s) need attention", text_color="#E74C3C")
+        elif counts['short']:
+            self.sync_label.configure(text=f"{counts['short']} sale(s) short of stock - click to review",
+                                      text_color="#E74C3C")
+        elif counts['pending'] or counts['approved']:
+            self.sync_label.configure(text=f"Unsynced sales: {counts['pending'] + counts['approved']}",
+                                      text_color="#F39C12")
+        else:
+            self.sync_label.configure(text="", text_color="gray60")
 
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT product_id, name, price, stock_quantity FROM Products WHERE stock_quantity > 0 ORDER BY name")
-        
-        products = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        if not products:
-            info_label = ctk.CTkLabel(self.product_list_frame, 
-                                      text="No products in stock.\n\nPlease add products using the\n'Manage Inventory' button.",
-                                      font=("Arial", 14), text_color="gray50")
-            info_label.pack(pady=50, padx=10, expand=True)
+    def _on_feed_error(self, err):
+        # Like the unsynced-sales counter: shown while other terminals' changes are not arriving
+        if err is None:
+            self.feed_label.configure(text="", text_color="gray60")
         else:
-            for product in products:
-                btn_text = f"{product['name']} - ₹{product['price']:.2f} (In Stock: {product['stock_quantity']})"
-                btn = ctk.CTkButton(self.product_list_frame, text=btn_text, 
-                                    command=lambda p=product: self.add_product_to_cart(p))
-                btn.pack(pady=4, padx=5, fill="x")
+            self.feed_label.configure(text=f"Updates from other terminals paused: {str(err)[:60]}",
+                                      text_color="#F39C12")
+
+    def _on_sale_rejected(self, entry, err):
+        messagebox.showerror("Sale Not Synced",
+                             f"The sale of ₹{entry.total_amount} taken at {entry.created_at} could not be saved "
+                             f"to the database and is kept in the local journal ({entry.client_ref}).\n\nError: {err}")
+
+    @timed()
+    def populate_product_list(self, on_done=None, on_error=None):
+        # refresh() reports what changed through _on_catalog_change; the first call loads everything
+        self.db.submit(product_catalog.refresh, key="catalog-refresh", on_done=on_done, on_error=on_error)
+
+    def _rebuild_product_list(self):
+        products = product_catalog.in_stock()
+        self._listed_names = {p['product_id']: p['name'] for p in products}
+        self.product_list.set_items([p['product_id'] for p in products])
+
+    @timed()
+    def _on_catalog_change(self, changed_ids):
+        for product_id in changed_ids:
+            product = product_catalog.get(product_id)
+            listed = product_id in self._listed_names
+            in_stock = product is not None and product['stock_quantity'] > 0
+            if listed != in_stock or (listed and self._listed_names[product_id] != product['name']):
+                # Membership or ordering changed; re-sorting keys is cheap, no widgets are rebuilt
+                self._rebuild_product_list()
+                return
+        self.product_list.refresh_items(changed_ids)
+
+    def _product_row_text(self, product_id):
+        product = product_catalog.get(product_id)
+        if not product: return ""
+        return f"{product['name']} - ₹{product['price']:.2f} (In Stock: {product['stock_quantity']})"
 
+    def _on_product_row_click(self, product_id):
+        product = product_catalog.get(product_id)
+        if product:
+            self.add_product_to_cart(product)
+
+    @timed()
     def add_product_to_cart_by_name(self, event=None):
         name = self.product_search_entry.get()
         if not name: return
         
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM Products WHERE name LIKE %s AND stock_quantity > 0 LIMIT 1", (f"%{name}%",))
-        product = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        # Prefer what the dropdown shows (highlighted or top-ranked) over a blind first match
+        product = self.product_search_dropdown.selected() or product_catalog.find_by_name(name)
+        self.product_search_dropdown.hide()
 
         if product:
             self.add_product_to_cart(product)
@@ -713,75 +1462,131 @@ class App(ctk.CTk):
         else:
             messagebox.showinfo("Not Found", f"No product matching '{name}' found or it is out of stock.")
 
-    def add_product_to_cart(self, product):
-        product_id = product['product_id']
-        current_stock = product['stock_quantity']
-        
-        if product_id in self.cart:
-            if self.cart[product_id]['quantity'] < current_stock:
-                self.cart[product_id]['quantity'] += 1
+    def _choose_search_result(self, product):
+        self.add_product_to_cart(product)
+        self.product_search_entry.delete(0, 'end')
+        self.product_search_entry.focus_set()
+
+    def on_scan(self, event=None):
+        # Only queue the code here; a scanner burst keeps typing while earlier scans are resolved
+        code = self.scan_entry.get()
+        self.scan_entry.delete(0, 'end')
+        if code.strip():
+            self._scan_queue.append(code)
+            if not self._scan_drain_pending:
+                self._scan_drain_pending = True
+                self.after_idle(self._drain_scan_queue)
+        return "break"
+
+    @timed()
+    def _drain_scan_queue(self):
+        self._scan_drain_pending = False
+        while self._scan_queue:
+            scanned = self._scan_queue.popleft()
+            match = SCAN_PATTERN.match(scanned)
+            if not match:
+                self._scan_feedback(f"Unreadable scan: {scanned.strip()}", error=True)
+                continue
+            quantity = int(match.group(1) or 1)
+            barcode = match.group(2)
+            if quantity < 1:
+                self._scan_feedback("Quantity must be at least 1.", error=True)
+                continue
+
+            product = product_catalog.find_by_barcode(barcode, fallback=False)
+            if product:
+                self._add_scanned(product, barcode, quantity)
             else:
-                messagebox.showwarning("Stock Limit", f"No more '{product['name']}' in stock.")
+                # Not cached (e.g. added on another terminal): look it up without blocking the scanner
+                self.db.submit(product_catalog.find_by_barcode, barcode, timeout=DB_SEARCH_TIMEOUT,
+                               on_done=lambda product, b=barcode, q=quantity: self._add_scanned(product, b, q),
+                               on_error=lambda err, b=barcode: self._scan_feedback(f"Lookup failed for {b}", error=True))
+
+    def _add_scanned(self, product, barcode, quantity):
+        if not product:
+            self._scan_feedback(f"Unknown barcode: {barcode}", error=True)
+            return
+        error = self._add_to_cart(product, quantity)
+        if error:
+            self._scan_feedback(error, error=True)
         else:
-            self.cart[product_id] = {
-                'name': product['name'],
-                'price': float(product['price']),
-                'quantity': 1
-            }
-        self.update_cart_display()
+            self._scan_feedback(f"+{quantity} {product['name']}")
+
+    def _scan_feedback(self, text, error=False):
+        # Non-modal on purpose: a message box would steal focus and swallow the next scans
+        self.scan_status_label.configure(text=text, text_color="#E74C3C" if error else "#2ECC71")
+        if error:
+            self.bell()
+
+    @timed()
+    def add_product_to_cart(self, product, quantity=1):
+        error = self._add_to_cart(product, quantity)
+        if error:
+            messagebox.showwarning("Stock Limit", error)
+
+    def _add_to_cart(self, product, quantity):
+        """Adds units of a product to the cart. Returns an error message instead of showing a dialog."""
+        product_id = product['product_id']
+        current_stock = product['stock_quantity']
+        in_cart = self.cart.quantity(product_id)
 
-    def update_cart_display(self):
-        for widget in self.cart_display_frame.winfo_children():
-            widget.destroy()
-
-        subtotal = 0.0
-        for product_id, item in self.cart.items():
-            item_total = item['price'] * item['quantity']
-            subtotal += item_total
-            
+        if in_cart + quantity > current_stock:
+            if in_cart >= current_stock:
+                return f"No more '{product['name']}' in stock."
+            return f"Only {current_stock - in_cart} more '{product['name']}' in stock."
+
+        self.cart.add(product_id, product['name'], to_paise(product['price']), quantity)
+        return None
+
+    @timed()
+    def _on_cart_change(self, event, line):
+        # Only the affected row is touched; the rest of the cart pane stays as it is
+        if event == 'cleared':
+            for frame, _ in self._cart_rows.values():
+                frame.destroy()
+            self._cart_rows.clear()
+        elif event == 'removed':
+            frame, _ = self._cart_rows.pop(line.product_id)
+            frame.destroy()
+        elif event == 'added':
             item_frame = ctk.CTkFrame(self.cart_display_frame)
             item_frame.pack(fill="x", pady=5, padx=5)
-            
-            label_text = f"{item['name']} ({item['quantity']} x ₹{item['price']:.2f}) = ₹{item_total:.2f}"
-            ctk.CTkLabel(item_frame, text=label_text).pack(side="left", padx=5, expand=True, anchor="w")
-            
+            label = ctk.CTkLabel(item_frame, text=self._cart_line_text(line))
+            label.pack(side="left", padx=5, expand=True, anchor="w")
             remove_button = ctk.CTkButton(item_frame, text="X", width=30, fg_color="red", hover_color="#C40000",
-                                          command=lambda pid=product_id: self.remove_from_cart(pid))
+                                          command=lambda pid=line.product_id: self.remove_from_cart(pid))
             remove_button.pack(side="right", padx=5)
+            self._cart_rows[line.product_id] = (item_frame, label)
+        else:
+            self._cart_rows[line.product_id][1].configure(text=self._cart_line_text(line))
+        self.update_cart_display()
 
-        gst = subtotal * (self.gst_rate / 100.0)
-        grand_total = subtotal + gst
+    def _cart_line_text(self, line):
+        return f"{line.name} ({line.quantity} x ₹{to_rupees(line.unit_price)}) = ₹{to_rupees(line.total)}"
 
-        self.subtotal_label.configure(text=f"Subtotal: ₹{subtotal:.2f}")
-        self.gst_label.configure(text=f"GST ({self.gst_rate}%): ₹{gst:.2f}")
-        self.grand_total_label.configure(text=f"Total: ₹{grand_total:.2f}")
+    @timed()
+    def update_cart_display(self):
+        """Refreshes the totals from the cart's running subtotal."""
+        self.subtotal_label.configure(text=f"Subtotal: ₹{to_rupees(self.cart.subtotal)}")
+        self.gst_label.configure(text=f"GST ({self.gst_rate}%): ₹{to_rupees(self.cart.gst)}")
+        self.grand_total_label.configure(text=f"Total: ₹{to_rupees(self.cart.total)}")
 
     def remove_from_cart(self, product_id):
-        if product_id in self.cart:
-            self.cart[product_id]['quantity'] -= 1
-            if self.cart[product_id]['quantity'] == 0:
-                del self.cart[product_id]
-        self.update_cart_display()
+        self.cart.remove_one(product_id)
 
-    def load_gst_rate(self):
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT current_gst_rate FROM ShopInfo WHERE id = 1")
-        result = cursor.fetchone()
-        if result:
-            self.gst_rate = float(result['current_gst_rate'])
-        cursor.close()
-        conn.close()
+    def _apply_gst_rate(self, rate):
+        if rate is not None:
+            self.gst_rate = float(rate)
+            self.cart.set_gst_rate(rate)
+            self.update_cart_display()
 
     def checkout(self):
         if not self.cart:
             messagebox.showwarning("Empty Cart", "Cannot checkout with an empty cart.")
             return
 
-        subtotal = sum(item['price'] * item['quantity'] for item in self.cart.values())
-        gst = subtotal * (self.gst_rate / 100.0)
-        grand_total = subtotal + gst
+        gst = to_rupees(self.cart.gst)
+        grand_total = to_rupees(self.cart.total)
 
         dialog = CheckoutDialog(self, grand_total)
         self.wait_window(dialog)
@@ -789,49 +1594,80 @@ class App(ctk.CTk):
         if dialog.result:
             self.process_sale(grand_total, gst, dialog.result)
 
+    @timed()
     def process_sale(self, total_amount, gst_amount, result):
-        conn = get_db_connection()
-        if not conn: return
-        cursor = conn.cursor()
-        
+        lines = [(line.product_id, line.quantity, to_rupees(line.unit_price)) for line in self.cart]
         try:
-            cursor.execute(
-                "INSERT INTO Sales (total_amount, gst_amount, payment_method, flat_id) VALUES (%s, %s, %s, %s)",
-                (total_amount, gst_amount, result['payment_method'], result['flat_id'])
-            )
-            sale_id = cursor.lastrowid
-
-            sale_items_data = []
-            for product_id, item in self.cart.items():
-                sale_items_data.append((sale_id, product_id, item['quantity'], item['price']))
-                cursor.execute(
-                    "UPDATE Products SET stock_quantity = stock_quantity - %s WHERE product_id = %s",
-                    (item['quantity'], product_id)
-                )
-            
-            cursor.executemany(
-                "INSERT INTO SaleItems (sale_id, product_id, quantity_sold, price_at_sale) VALUES (%s, %s, %s, %s)",
-                sale_items_data
-            )
-
-            if result['payment_method'] == 'Credit' and result['flat_id']:
-                cursor.execute(
-                    "UPDATE Flats SET credit_balance = credit_balance + %s WHERE flat_id = %s",
-                    (total_amount, result['flat_id'])
-                )
-
-            conn.commit()
-            messagebox.showinfo("Success", "Sale recorded successfully!")
-            self.cart.clear()
-            self.update_cart_display()
-            self.populate_product_list()
+            # A local fsync'd write first, held back from the replicator while this counter confirms it
+            entry = self.journal.append(lines, total_amount, gst_amount, result['payment_method'],
+                                        result['flat_id'], held=True)
+        except Exception as err:
+            messagebox.showerror("Sale Error", f"The sale could not be recorded: {err}")
+            return
+        self.checkout_button.configure(state="disabled", text="Confirming stock...")
+        self.db.submit(self._confirm_sale, entry, timeout=CHECKOUT_CONFIRM_TIMEOUT,
+                       on_done=lambda sale: self._complete_sale(entry, sale.stock),
+                       on_error=lambda err: self._on_confirm_failed(entry, err))
 
-        except mysql.connector.Error as err:
-            conn.rollback()
-            messagebox.showerror("Sale Error", f"An error occurred: {err}")
-        finally:
-            cursor.close()
-            conn.close()
+    def _confirm_sale(self, entry):
+        """Worker thread: commits the held sale with the stock guard, retrying lock conflicts between lanes."""
+        try:
+            sale = confirm_sale(entry.lines, entry.total_amount, entry.gst_amount, entry.payment_method,
+                                entry.flat_id, client_ref=entry.client_ref, sale_date=entry.created_at)
+        except InsufficientStockError as shortage:
+            # If the counter already gave up waiting and completed the sale, the replicator holds it for review
+            self.journal.void(entry.seq, str(shortage))
+            raise
+        self.journal.mark_synced(entry.seq, sale.sale_id)
+        return sale
+
+    def _on_confirm_failed(self, entry, err):
+        if isinstance(err, InsufficientStockError):
+            self._reset_checkout_button()
+            self._show_stock_conflict(err.shortages)
+        elif self.journal.release(entry.seq, str(err)):
+            # Database slow or unreachable: finish from the journal, the replicator syncs it later
+            self._complete_sale(entry)
+        elif self.journal.status(entry.seq) == 'synced':
+            self._complete_sale(entry, {})  # landed just after the timeout; the feed re-reads its stock
+        else:
+            self._reset_checkout_button()
+            self.populate_product_list()
+            messagebox.showwarning("Not Enough Stock",
+                                   "Another counter sold the last units while this sale was being confirmed. "
+                                   "Please check the cart and check out again.")
+
+    def _show_stock_conflict(self, shortages):
+        details = []
+        for product_id, requested, available in shortages:
+            product_catalog.set_stock(product_id, available)
+            product = product_catalog.get(product_id)
+            name = product['name'] if product else f"Product {product_id}"
+            details.append(f"• {name}: {requested} in cart, only {max(available, 0)} left")
+        if messagebox.askyesno("Not Enough Stock",
+                               "Another counter has just sold some of these items:\n\n" + "\n".join(details) +
+                               "\n\nReduce the cart to the stock that is left?"):
+            for product_id, _, available in shortages:
+                self.cart.set_quantity(product_id, available)
+
+    def _complete_sale(self, entry, stock=None):
+        """`stock` is the confirmed commit's {product_id: stock left}; None while the sale is only journaled."""
+        self.replicator.wake()
+        self._on_journal_change(self.journal.counts())
+        for product_id, quantity, _ in entry.lines:
+            if stock is None:
+                product_catalog.record_sale(product_id, quantity)
+            elif product_id in stock:
+                product_catalog.record_sale(product_id, quantity, stock[product_id])
+            # Only the sold units leave the cart; anything scanned while confirming stays
+            self.cart.set_quantity(product_id, self.cart.quantity(product_id) - quantity)
+        if entry.payment_method == 'Credit' and entry.flat_id:
+            flat_directory.adjust_balance(entry.flat_id, entry.total_amount)
+        self._reset_checkout_button()
+        messagebox.showinfo("Success", "Sale recorded successfully!")
+
+    def _reset_checkout_button(self):
+        self.checkout_button.configure(state="normal", text="Checkout")
 
     def open_inventory(self):
         win = InventoryWindow(self)
@@ -844,12 +1680,93 @@ class App(ctk.CTk):
     def open_reports_window(self):
         ReportsWindow(self)
 
+    def open_diagnostics_window(self):
+        DiagnosticsWindow(self)
+
 
 if __name__ == "__main__":
-    setup_database()
-    
+    parser = argparse.ArgumentParser(description="Society shop billing system")
+    parser.add_argument("--rebuild-rollup", action="store_true",
+                        help="recompute the daily sales rollup from the raw sales, then exit")
+    parser.add_argument("--since", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="with --rebuild-rollup, only recompute days from this date on")
+    parser.add_argument("--import-products", metavar="CSV",
+                        help="add or update products from a CSV file (barcode, name, price, stock), then exit")
+    parser.add_argument("--add-stock", action="store_true",
+                        help="with --import-products, add the file's stock to the stock on hand instead of replacing it")
+    parser.add_argument("--export-sales", metavar="DIR",
+                        help="write sales, sale lines and daily GST totals to files in DIR, then exit")
+    parser.add_argument("--from", dest="export_from", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="with --export-sales, the first day (default: start of the last complete quarter)")
+    parser.add_argument("--to", dest="export_to", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="with --export-sales, the last day (default: end of that quarter)")
+    parser.add_argument("--format", choices=exporter.FORMATS, default="csv", help="with --export-sales")
+    parser.add_argument("--billing-run", metavar="DIR",
+                        help="write every flat's credit statement for a month and a billing summary to DIR, then exit")
+    parser.add_argument("--month", type=lambda text: datetime.date.fromisoformat(text + "-01"), metavar="YYYY-MM",
+                        help="with --billing-run, the month to bill (default: last month); rerun to resume")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup phase took once the product list has loaded, then exit")
+    args = parser.parse_args()
+    startup_profile.mark("imports")
+
+    if args.export_sales:
+        # Always against the database directly, like --rebuild-rollup
+        _, start, end = exporter.quarters(2)[1]
+        start = args.export_from or start
+        end = args.export_to + datetime.timedelta(days=1) if args.export_to else end
+        paths = exporter.export_sales(acquire_db_connection, args.export_sales, start, end, args.format,
+                                      EXPORT_CHUNK_SIZE, on_progress=lambda rows: print(f"  {rows:,} rows", end="\r"))
+        print("Exported " + ", ".join(paths))
+        get_db_pool().close()
+        raise SystemExit(0)
+
+    if args.billing_run:
+        # Always against the database directly, like --export-sales
+        report = billing.run(acquire_db_connection, args.billing_run, args.month or billing.previous_month()[0],
+                             BILLING_WORKERS, BILLING_BATCH_SIZE,
+                             on_progress=lambda done, total: print(f"  {done}/{total} statements", end="\r"))
+        print(f"Billing finished: {report.describe()}")
+        print(f"Statements in {report.directory}, summary in {report.summary_path}")
+        get_db_pool().close()
+        raise SystemExit(0)
+
+    if args.import_products:
+        stopped = None
+        try:
+            report = import_products(product_repo, args.import_products, args.add_stock, import_chunk_size,
+                                     on_progress=lambda report: print(f"  {report.fraction:4.0%}  {report.describe()}"))
+        except ImportStoppedError as err:
+            report, stopped = err.report, f"Import {err}"
+        for line, message in report.errors:
+            print(f"  line {line}: {message}")
+        print(stopped or f"Import finished: {report.describe()}")
+        if not pos_service:
+            get_db_pool().close()
+        raise SystemExit(1 if stopped else 0)
+
+    if args.rebuild_rollup:
+        # Always against the database directly: a rebuild can take longer than any service request
+        rows = SaleRepository(acquire_db_connection).rebuild_rollup(args.since)
+        print(f"Daily sales rollup rebuilt ({rows} product-days).")
+        get_db_pool().close()
+        raise SystemExit(0)
+
     ctk.set_appearance_mode("dark")
     ctk.set_default_color_theme("blue")
     
-    app = App()
+    app = App(profile_startup=args.profile_startup)
     app.mainloop()
+    app.feed.stop()
+    app.replicator.stop()
+    app.journal.close()
+    app.db.shutdown()
+
+    if metrics.snapshot():
+        print("Slowest operations this session:")
+        print(metrics.report(10))
+    if not pos_service:
+        stats = get_pool_stats()
+        print(f"Connection pool: {stats['created']} created, {stats['destroyed']} destroyed, "
+              f"{stats['checkouts']} checkouts, avg wait {stats['wait_time_avg'] * 1000:.1f} ms")
+        get_db_pool().close()
@@ -0,0 +1,196 @@
+import sqlite3
+from decimal import Decimal
+
+import migrations
+
+
+class StorageBackend:
+    """
+    One database engine the app can run on.
+
+    A backend opens raw connections for the ConnectionPool (connect / is_alive / reset), migrates
+    the schema (setup) and says which of its errors are worth retrying (is_transient). Connections
+    from every backend speak the subset of the mysql.connector API the app uses: `%s` parameters,
+    cursor(dictionary=True), lastrowid, rowcount, commit() and rollback().
+    """
+
+    name = None
+    Error = Exception  # base class of the engine's errors
+
+    def connect(self):
+        raise NotImplementedError
+
+    def is_alive(self, conn):
+        return True
+
+    def reset(self, conn):
+        # A pooled connection must not keep a transaction (and its snapshot) open,
+        # otherwise the next borrower would see stale data.
+        if conn.in_transaction:
+            conn.rollback()
+
+    def is_transient(self, err):
+        """True for failures worth retrying later (server unreachable, lock timeouts)."""
+        return False
+
+    def setup(self):
+        """Creates the database if needed and brings its schema up to date. Returns the migrations applied."""
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+
+def dialect_of(conn):
+    """'sqlite' or 'mysql', for the few statements (upserts) whose syntax differs between engines."""
+    return getattr(conn, 'dialect', 'mysql')
+
+
+# --- MYSQL ---
+class MySQLBackend(StorageBackend):
+    """A MySQL server reached with mysql.connector, configured by a DB_CONFIG-style dict."""
+
+    name = "mysql"
+
+    def __init__(self, config):
+        import mysql.connector  # only needed when this backend is selected
+        self._mysql = mysql.connector
+        self.config = config
+        self.Error = mysql.connector.Error
+
+    def connect(self):
+        return self._mysql.connect(**self.config)
+
+    def is_alive(self, conn):
+        return conn.is_connected()
+
+    def is_transient(self, err):
+        errors = self._mysql.errors
+        if isinstance(err, (errors.InterfaceError, errors.OperationalError)):
+            return True
+        return getattr(err, 'errno', None) in (1205, 1213)  # lock wait timeout, deadlock
+
+    def describe(self):
+        return f"mysql://{self.config['user']}@{self.config['host']}/{self.config['database']}"
+
+    def setup(self):
+        try:
+            conn = self.connect()
+        except self.Error as err:
+            if getattr(err, 'errno', None) != 1049:  # unknown database
+                raise
+            # First run: connect without specifying a database to create it
+            initial_conn = self._mysql.connect(
+                host=self.config['host'],
+                user=self.config['user'],
+                password=self.config['password']
+            )
+            cursor = initial_conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.config['database']}")
+            print(f"Database '{self.config['database']}' created.")
+            cursor.close()
+            initial_conn.close()
+            conn = self.connect()
+        try:
+            return migrations.migrate(conn, self.name)
+        finally:
+            conn.close()
+
+
+# --- SQLITE ---
+sqlite3.register_adapter(Decimal, str)  # stored with NUMERIC affinity, so it is kept as a number
+
+
+class _SQLiteCursor:
+    """sqlite3 cursor accepting `%s` parameters, optionally returning rows as dicts."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = lambda cur, row: dict(zip([d[0] for d in cur.description], row))
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(sql.replace("%s", "?"), seq_of_params)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)  # fetchone, fetchall, fetchmany, lastrowid, rowcount, close, ...
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class _SQLiteConnection:
+    """sqlite3 connection with the mysql.connector methods the app relies on."""
+
+    dialect = "sqlite"
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, dictionary=False, buffered=False):
+        # sqlite3 always steps through a result as it is fetched, so every cursor is "unbuffered"
+        return _SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def is_connected(self):
+        try:
+            self._conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)  # commit, rollback, close, in_transaction, ...
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded database in a single file: no server to install or keep running.
+
+    The file is opened in WAL mode so readers never block the writer, and each pooled
+    connection waits up to `busy_timeout` seconds for the write lock instead of failing.
+    """
+
+    name = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return _SQLiteConnection(conn)
+
+    def is_alive(self, conn):
+        return conn.is_connected()
+
+    def is_transient(self, err):
+        # "database is locked" after busy_timeout, or the file briefly unavailable
+        return isinstance(err, sqlite3.OperationalError)
+
+    def describe(self):
+        return f"sqlite:///{self.path}"
+
+    def setup(self):
+        conn = self.connect()
+        try:
+            return migrations.migrate(conn, self.name)
+        finally:
+            conn.close()
+
+
+def create_backend(kind, mysql_config=None, sqlite_path=None):
+    """Returns the backend named by `kind` ('mysql' or 'sqlite')."""
+    if kind == "mysql":
+        return MySQLBackend(mysql_config)
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown storage backend: {kind!r}")
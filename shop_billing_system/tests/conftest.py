@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# The application modules are flat files in shop_billing_system/, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from storage import SQLiteBackend  # noqa: E402
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """A migrated SQLite database in a fresh file."""
+    backend = SQLiteBackend(str(tmp_path / "store.db"))
+    backend.setup()
+    return backend
+
+
+@pytest.fixture
+def pool(backend):
+    pool = ConnectionPool(backend.connect, size=3, is_alive=backend.is_alive)
+    yield pool
+    pool.close()
+
+
+def query(pool, sql, params=()):
+    """All rows of one read, on a connection of its own."""
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        conn.rollback()
+        cursor.close()
+    return rows
+
+
+def add_products(pool, *products):
+    """Inserts (barcode, name, price, stock) rows and returns their product_ids in order."""
+    ids = []
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        for product in products:
+            cursor.execute("INSERT INTO Products (barcode, name, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                           product)
+            ids.append(cursor.lastrowid)
+        conn.commit()
+        cursor.close()
+    return ids
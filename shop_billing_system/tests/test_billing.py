@@ -0,0 +1,84 @@
+import csv
+import datetime
+import os
+from decimal import Decimal
+
+import pytest
+
+import billing
+import ledger
+
+
+@pytest.fixture
+def pool(pool):
+    # Entries are dated in early 2024, long before the snapshot the migration takes
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM FlatBalanceSnapshots")
+        cursor.executemany(
+            "INSERT INTO FlatLedger (flat_id, entry_date, kind, amount, sale_id, note) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(1, "2024-01-20 10:00:00", ledger.CHARGE, Decimal('80.00'), None, None),
+             (1, "2024-02-05 10:00:00", ledger.CHARGE, Decimal('45.50'), None, None),
+             (1, "2024-02-10 10:00:00", ledger.PAYMENT, Decimal('-80.00'), None, None),
+             (2, "2024-02-12 10:00:00", ledger.OPENING, Decimal('12.00'), None, "Balance brought forward"),
+             (3, "2024-03-02 10:00:00", ledger.CHARGE, Decimal('9.00'), None, None)])
+        cursor.execute("UPDATE ShopInfo SET shop_name = %s WHERE id = 1", ("Corner <Store>",))
+        conn.commit()
+        cursor.close()
+    return pool
+
+
+FEBRUARY = datetime.date(2024, 2, 1)
+
+
+def test_month_totals_split_charges_payments_and_adjustments(pool):
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        start, end = billing.month_bounds(FEBRUARY)
+        rows = {row['flat_id']: row for row in billing.month_totals(cursor, start, end)}
+        conn.rollback()
+        cursor.close()
+
+    assert len(rows) == 10
+    flat = rows[1]
+    assert (flat['opening'], flat['charges'], flat['payments'], flat['adjustments'], flat['closing']) == \
+        (Decimal('80.00'), Decimal('45.50'), Decimal('80.00'), Decimal('0.00'), Decimal('45.50'))
+    assert (rows[2]['adjustments'], rows[2]['closing']) == (Decimal('12.00'), Decimal('12.00'))
+    assert rows[3]['closing'] == 0  # March is not in February's bill
+
+
+def test_run_writes_statements_for_active_flats_and_a_summary(pool, tmp_path):
+    report = billing.run(pool.acquire, str(tmp_path), FEBRUARY, workers=1, today=datetime.date(2024, 3, 5))
+
+    assert (report.flats, report.billed, report.written, report.skipped) == (10, 2, 2, 0)
+    assert sorted(os.listdir(report.directory)) == ["00001_A-101.html", "00002_A-102.html"]
+    with open(os.path.join(report.directory, "00001_A-101.html"), encoding="utf-8") as file:
+        page = file.read()
+    assert "Corner &lt;Store&gt;" in page
+    assert "February 2024" in page and "45.50" in page
+
+    with open(report.summary_path, newline="", encoding="utf-8") as file:
+        summary = list(csv.DictReader(file))
+    assert len(summary) == 10
+    assert summary[0]['closing'] == "45.50"
+    assert summary[0]['statement'] == os.path.join("2024-02", "00001_A-101.html")
+    assert summary[3]['statement'] == ""
+
+
+def test_a_second_run_skips_statements_already_written(pool, tmp_path):
+    today = datetime.date(2024, 3, 5)
+    billing.run(pool.acquire, str(tmp_path), FEBRUARY, workers=1, today=today)
+    os.remove(os.path.join(str(tmp_path), "2024-02", "00002_A-102.html"))
+
+    report = billing.run(pool.acquire, str(tmp_path), FEBRUARY, workers=1, today=today)
+    assert (report.written, report.skipped) == (1, 1)
+
+
+def test_an_unfinished_month_is_refused(pool, tmp_path):
+    with pytest.raises(ValueError, match="has not ended yet"):
+        billing.run(pool.acquire, str(tmp_path), FEBRUARY, today=datetime.date(2024, 2, 20))
+
+
+def test_previous_month_is_the_last_complete_one():
+    assert billing.previous_month(datetime.date(2024, 3, 15)) == (FEBRUARY, datetime.date(2024, 3, 1))
+    assert billing.previous_month(datetime.date(2024, 1, 1)) == (datetime.date(2023, 12, 1), datetime.date(2024, 1, 1))
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from cart import Cart, to_paise, to_rupees
+
+
+def test_to_paise_rounds_half_up():
+    assert to_paise(Decimal('12.345')) == 1235
+    assert to_paise('0.005') == 1
+    assert to_paise(19.99) == 1999
+    assert to_paise(7) == 700
+
+
+def test_to_rupees_is_two_place_decimal():
+    assert to_rupees(1999) == Decimal('19.99')
+    assert str(to_rupees(700)) == '7.00'
+
+
+def test_subtotal_has_no_float_drift():
+    cart = Cart(gst_rate=0)
+    for product_id in range(10):
+        cart.add(product_id, f"item {product_id}", to_paise('0.10'))
+    assert cart.subtotal == 100
+    assert to_rupees(cart.total) == Decimal('1.00')
+
+
+def test_gst_rounds_half_up_on_paise():
+    cart = Cart(gst_rate=18)
+    cart.add(1, "soap", 250)  # 18% of 2.50 is 0.45
+    cart.add(2, "salt", 3)    # 18% of 2.53 is 0.4554
+    assert cart.gst == 46
+    assert cart.total == 253 + 46
+    cart.set_gst_rate('5')
+    assert cart.gst == 13  # 12.65 paise
+
+
+def test_adding_again_updates_the_line():
+    cart = Cart()
+    cart.add(1, "soap", 250, 2)
+    line = cart.add(1, "soap", 250)
+    assert len(cart) == 1
+    assert line.quantity == 3
+    assert cart.subtotal == 750
+
+
+def test_remove_one_drops_the_line_at_zero():
+    cart = Cart()
+    cart.add(1, "soap", 250, 2)
+    cart.remove_one(1)
+    assert cart.quantity(1) == 1
+    assert cart.subtotal == 250
+    cart.remove_one(1)
+    assert not cart
+    assert cart.subtotal == 0
+    cart.remove_one(1)  # nothing left to remove
+    assert cart.subtotal == 0
+
+
+def test_set_quantity_adjusts_subtotal_by_the_difference():
+    cart = Cart()
+    cart.add(1, "soap", 250, 5)
+    cart.add(2, "salt", 20)
+    cart.set_quantity(1, 2)
+    assert cart.subtotal == 520
+    cart.set_quantity(1, 0)
+    assert cart.quantity(1) == 0
+    assert cart.subtotal == 20
+
+
+def test_listeners_are_told_what_changed():
+    cart = Cart()
+    events = []
+    cart.add_listener(lambda event, line: events.append((event, line and line.product_id)))
+    cart.add(1, "soap", 250)
+    cart.add(1, "soap", 250)
+    cart.add(2, "salt", 20)
+    cart.remove_one(2)
+    cart.remove(1)
+    cart.add(3, "rice", 5000)
+    cart.clear()
+    assert events == [('added', 1), ('updated', 1), ('added', 2), ('removed', 2), ('removed', 1),
+                      ('added', 3), ('cleared', None)]
+    assert cart.subtotal == 0
@@ -0,0 +1,135 @@
+from changefeed import FLAT, PRODUCT, ChangeFeed
+from conftest import add_products
+from repositories import ChangeLogRepository
+
+
+class FakeLog:
+    """An in-memory ChangeLog whose records can be added out of sequence order, like late commits."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, seq, entity, entity_id):
+        self.records.append((seq, entity, entity_id))
+        self.records.sort()
+
+    def prune(self, below):
+        self.records = [record for record in self.records if record[0] >= below]
+
+    def since(self, after_seq, limit=500):
+        return [record for record in self.records if record[0] > after_seq][:limit]
+
+    def bounds(self):
+        if not self.records:
+            return None, None
+        return self.records[0][0], self.records[-1][0]
+
+
+def make_feed(log, **kwargs):
+    feed = ChangeFeed(log, **kwargs)
+    feed.last_seq = feed._floor = log.bounds()[1] or 0
+    delivered = []
+    feed.subscribe(PRODUCT, lambda ids: delivered.append((PRODUCT, ids)))
+    feed.subscribe(FLAT, lambda ids: delivered.append((FLAT, ids)))
+    return feed, delivered
+
+
+def drain(feed):
+    while feed.poll():
+        pass
+
+
+def test_changes_are_grouped_by_entity():
+    log = FakeLog()
+    feed, delivered = make_feed(log)
+    log.add(1, PRODUCT, 10)
+    log.add(2, PRODUCT, 11)
+    log.add(3, FLAT, 4)
+    log.add(4, PRODUCT, 10)
+    drain(feed)
+    assert sorted(delivered) == [(FLAT, {4}), (PRODUCT, {10, 11})]
+    assert feed.last_seq == 4
+
+
+def test_records_before_start_are_not_delivered():
+    log = FakeLog()
+    log.add(1, PRODUCT, 10)
+    feed, delivered = make_feed(log)
+    drain(feed)
+    assert delivered == []
+
+
+def test_paging_delivers_every_record_once():
+    log = FakeLog()
+    feed, delivered = make_feed(log, batch_size=3)
+    for seq in range(1, 9):
+        log.add(seq, PRODUCT, seq)
+    drain(feed)
+    ids = [entity_id for _, changed in delivered for entity_id in changed]
+    assert sorted(ids) == list(range(1, 9))
+
+
+def test_a_late_commit_fills_its_gap_without_redelivery():
+    log = FakeLog()
+    feed, delivered = make_feed(log)
+    log.add(1, PRODUCT, 1)
+    log.add(3, PRODUCT, 3)
+    drain(feed)
+    assert delivered == [(PRODUCT, {1, 3})]
+    assert set(feed._gaps) == {2}
+
+    log.add(2, PRODUCT, 2)  # committed after 3 was read
+    log.add(4, PRODUCT, 4)
+    delivered.clear()
+    drain(feed)
+    assert delivered == [(PRODUCT, {2, 4})]
+    assert feed._gaps == {}
+
+
+def test_a_gap_that_never_fills_reloads_everything():
+    log = FakeLog()
+    feed, delivered = make_feed(log, gap_timeout=60)
+    log.add(2, PRODUCT, 2)
+    drain(feed)
+    feed._gaps[1] -= 61
+    delivered.clear()
+    drain(feed)
+    assert sorted(delivered, key=str) == [(FLAT, None), (PRODUCT, None)]
+    assert feed._gaps == {}
+
+
+def test_pruned_past_position_reloads_everything():
+    log = FakeLog()
+    feed, delivered = make_feed(log)
+    log.add(1, PRODUCT, 1)
+    drain(feed)
+    for seq in range(2, 6):
+        log.add(seq, PRODUCT, seq)
+    log.prune(below=4)
+    delivered.clear()
+    drain(feed)
+    assert (PRODUCT, None) in delivered
+    assert feed.last_seq == 5
+
+
+def test_subscriber_errors_are_reported_and_others_still_run():
+    log = FakeLog()
+    errors = []
+    feed, delivered = make_feed(log, on_error=errors.append)
+
+    def broken(ids):
+        raise RuntimeError("listener bug")
+
+    feed._subscribers[PRODUCT].insert(0, broken)
+    log.add(1, PRODUCT, 1)
+    drain(feed)
+    assert [str(err) for err in errors] == ["listener bug"]
+    assert delivered == [(PRODUCT, {1})]
+
+
+def test_triggers_feed_product_changes_from_sqlite(pool):
+    changes = ChangeLogRepository(pool.acquire)
+    feed, delivered = make_feed(changes)
+    soap, salt = add_products(pool, ("S1", "Soap", 25, 10), ("S2", "Salt", 20, 4))
+    drain(feed)
+    assert delivered == [(PRODUCT, {soap, salt})]
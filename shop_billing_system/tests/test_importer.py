@@ -0,0 +1,127 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from conftest import add_products, query
+from importer import ImportStoppedError, import_products, parse_row
+from repositories import ProductRepository
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode("utf-8"))
+
+
+def test_parse_row_cleans_up_price_and_stock():
+    assert parse_row({'barcode': ' 890123 ', 'name': ' Tea ', 'price': '₹1,250.5', 'stock': '1,200'}) == \
+        ('890123', 'Tea', Decimal('1250.50'), 1200)
+    assert parse_row({'barcode': '1', 'name': 'Salt', 'price': '20'})[3] == 0
+
+
+@pytest.mark.parametrize("row, message", [
+    ({'name': 'Tea', 'price': '1'}, "missing barcode"),
+    ({'barcode': '1', 'name': '  ', 'price': '1'}, "missing name"),
+    ({'barcode': '1' * 256, 'name': 'Tea', 'price': '1'}, "longer than 255"),
+    ({'barcode': '1', 'name': 'Tea', 'price': 'abc'}, "not a number"),
+    ({'barcode': '1', 'name': 'Tea', 'price': '-1'}, "not a valid amount"),
+    ({'barcode': '1', 'name': 'Tea', 'price': '1', 'stock': '2.5'}, "not a whole number"),
+    ({'barcode': '1', 'name': 'Tea', 'price': '1', 'stock': '-3'}, "negative"),
+])
+def test_parse_row_rejects_bad_values(row, message):
+    with pytest.raises(ValueError, match=message):
+        parse_row(row)
+
+
+def test_missing_required_column_is_refused():
+    with pytest.raises(ValueError, match="no price column"):
+        import_products(None, csv_file("barcode,name\n1,Tea\n"))
+
+
+def test_import_inserts_updates_and_reports_bad_lines(pool, backend):
+    add_products(pool, ("B1", "Old name", 10, 5))
+    repo = ProductRepository(pool.acquire, backend.is_transient)
+    report = import_products(repo, csv_file(
+        "EAN,Product Name,MRP,Qty\n"
+        "B1,Tea,12.00,7\n"
+        "B2,Salt,20,3\n"
+        "\n"
+        "B3,Rice,lots,1\n"
+        "B4,Sugar,40,2\n"
+        "B2,Salt (1kg),22,9\n"
+    ), chunk_size=2)
+
+    assert (report.rows, report.inserted, report.updated) == (5, 2, 2)
+    assert report.errors == [(5, "price 'lots' is not a number")]
+    assert report.fraction == 1.0
+    assert sorted(query(pool, "SELECT barcode, name, stock_quantity FROM Products")) == \
+        [('B1', 'Tea', 7), ('B2', 'Salt (1kg)', 9), ('B4', 'Sugar', 2)]
+
+
+def test_import_can_add_to_stock(pool, backend):
+    add_products(pool, ("B1", "Tea", 10, 5))
+    repo = ProductRepository(pool.acquire, backend.is_transient)
+    import_products(repo, csv_file("barcode,name,price,stock\nB1,Tea,10,3\n"), add_stock=True)
+    assert query(pool, "SELECT stock_quantity FROM Products WHERE barcode = 'B1'") == [(8,)]
+
+
+def test_a_repeated_barcode_in_a_chunk_keeps_its_last_line():
+    class Repo:
+        def upsert_many(self, rows, add_stock):
+            self.rows = rows
+            return {'inserted': len(rows), 'updated': 0, 'errors': []}
+
+    repo = Repo()
+    report = import_products(repo, csv_file("barcode,name,price\nB1,Tea,1\nB1,Green tea,2\n"))
+    assert repo.rows == [('B1', 'Green tea', Decimal('2.00'), 0)]
+    assert report.errors == [(2, "barcode B1 appears again on line 3, which was used")]
+
+
+def test_a_failed_chunk_stops_the_import_with_its_lines():
+    class Repo:
+        calls = 0
+
+        def upsert_many(self, rows, add_stock):
+            self.calls += 1
+            if self.calls == 2:
+                raise TimeoutError("timed out")
+            return {'inserted': len(rows), 'updated': 0, 'errors': []}
+
+    text = "barcode,name,price\n" + "".join(f"B{i},Item {i},1\n" for i in range(6))
+    with pytest.raises(ImportStoppedError) as raised:
+        import_products(Repo(), csv_file(text), chunk_size=2)
+    assert (raised.value.first_line, raised.value.last_line) == (4, 5)
+    assert raised.value.report.inserted == 2
+
+
+def test_upsert_isolates_a_bad_row_and_counts_repeats(pool, backend):
+    add_products(pool, ("A", "Existing", 1, 1))
+    commits = []
+
+    class Counting:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def commit(self):
+            commits.append(1)
+            self.conn.commit()
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.conn.close()
+
+    repo = ProductRepository(lambda: Counting(pool.acquire()), backend.is_transient)
+    rows = [(f"X{i}", f"Item {i}", 1, 1) for i in range(64)]
+    rows[10] = ("BAD", None, 1, 1)
+    rows[20] = ("A", "Existing", 2, 2)
+    rows[30] = ("X0", "Item 0 again", 1, 1)
+    result = repo.upsert_many(rows, batch_size=16)
+
+    assert result['errors'] == [(10, "NOT NULL constraint failed: Products.name")]
+    assert (result['inserted'], result['updated']) == (61, 2)
+    assert len(commits) < 16  # bisected, not one transaction per row
+    assert query(pool, "SELECT name FROM Products WHERE barcode = 'X0'") == [('Item 0 again',)]
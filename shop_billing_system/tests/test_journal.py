@@ -0,0 +1,123 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import add_products, query
+from journal import JournalReplicator, SaleJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = SaleJournal(str(tmp_path / "journal.db"))
+    yield journal
+    journal.close()
+
+
+def replicator(journal, pool, backend, **kwargs):
+    return JournalReplicator(journal, pool.acquire, backend.is_transient, **kwargs)
+
+
+def append(journal, product_id, quantity, **kwargs):
+    return journal.append([(product_id, quantity, Decimal('25.00'))], Decimal('25.00') * quantity,
+                          Decimal('0.00'), 'Cash', **kwargs)
+
+
+def test_entry_round_trips_its_payload(journal):
+    entry = journal.append([(7, 2, Decimal('12.50'))], Decimal('25.00'), Decimal('4.50'), 'Credit', flat_id=3)
+    stored, = journal.pending()
+    assert (stored.seq, stored.client_ref) == (entry.seq, entry.client_ref)
+    assert stored.lines == [(7, 2, Decimal('12.50'))]
+    assert (stored.total_amount, stored.gst_amount, stored.flat_id) == (Decimal('25.00'), Decimal('4.50'), 3)
+    assert not stored.approved
+
+
+def test_held_entries_are_not_pending_until_released(journal):
+    entry = append(journal, 1, 1, held=True)
+    assert journal.pending() == []
+    assert journal.release(entry.seq)
+    assert not journal.release(entry.seq)  # already moved on
+    assert not journal.void(entry.seq)
+    assert [e.seq for e in journal.pending()] == [entry.seq]
+
+
+def test_crash_leftovers_are_released(journal):
+    append(journal, 1, 1, held=True)
+    append(journal, 1, 1, held=True)
+    assert journal.release_held() == 2
+    assert journal.backlog() == 2
+
+
+def test_replicator_syncs_pending_entries(journal, pool, backend):
+    soap, = add_products(pool, ("S1", "Soap", 25, 10))
+    entry = append(journal, soap, 2)
+
+    assert not replicator(journal, pool, backend)._sync_batch()
+    assert journal.status(entry.seq) == 'synced'
+    assert query(pool, "SELECT client_ref FROM Sales") == [(entry.client_ref,)]
+    assert query(pool, "SELECT stock_quantity FROM Products") == [(8,)]
+
+
+def test_short_entry_waits_for_review_and_is_not_forced(journal, pool, backend):
+    soap, = add_products(pool, ("S1", "Soap", 25, 1))
+    entry = append(journal, soap, 2)
+
+    replicator(journal, pool, backend)._sync_batch()
+    assert journal.status(entry.seq) == 'short'
+    assert [e.seq for e in journal.shortages()] == [entry.seq]
+    assert journal.backlog() == 0
+    assert query(pool, "SELECT COUNT(*) FROM Sales") == [(0,)]
+
+
+def test_approved_shortage_is_written_past_the_stock_check(journal, pool, backend):
+    soap, = add_products(pool, ("S1", "Soap", 25, 1))
+    entry = append(journal, soap, 2)
+    sync = replicator(journal, pool, backend)
+    sync._sync_batch()
+
+    assert journal.approve(entry.seq, "counted 2 on the shelf")
+    assert not journal.approve(entry.seq)
+    assert journal.counts()['approved'] == 1
+    sync._sync_batch()
+    assert journal.status(entry.seq) == 'synced'
+    assert query(pool, "SELECT stock_quantity FROM Products") == [(-1,)]
+
+
+def test_voided_shortage_is_dropped(journal, pool, backend):
+    soap, = add_products(pool, ("S1", "Soap", 25, 0))
+    entry = append(journal, soap, 1)
+    replicator(journal, pool, backend)._sync_batch()
+
+    assert journal.void(entry.seq, "customer left", status='short')
+    assert journal.status(entry.seq) == 'voided'
+    assert journal.shortages() == []
+
+
+def test_bad_entry_is_rejected_after_max_attempts(journal, pool, backend):
+    entry = append(journal, 1, 1)
+    rejected = []
+
+    def commit(*args, **kwargs):
+        raise ValueError("bad sale")
+
+    sync = replicator(journal, pool, backend, max_attempts=2, commit=commit,
+                      on_rejected=lambda entry, err: rejected.append(entry.seq))
+    sync._sync_batch()
+    assert journal.status(entry.seq) == 'pending'
+    sync._sync_batch()
+    assert journal.status(entry.seq) == 'rejected'
+    assert rejected == [entry.seq]
+
+
+def test_transient_error_keeps_entries_pending_and_backs_off(journal, pool, backend):
+    entry = append(journal, 1, 1)
+
+    def commit(*args, **kwargs):
+        raise backend.Error("database is locked")
+
+    sync = JournalReplicator(journal, pool.acquire, lambda err: True, commit=commit, min_backoff=1.0)
+    sync._sync_batch()
+    sync._sync_batch()
+    assert journal.status(entry.seq) == 'pending'
+    assert journal.pending()[0].attempts == 0
+    assert sync._backoff == 2.0
+    assert str(sync.last_error) == "database is locked"
@@ -0,0 +1,115 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+import ledger
+
+
+@pytest.fixture
+def pool(pool):
+    # The migration snapshots the current month; these tests post dated entries from 2024 onwards
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM FlatBalanceSnapshots")
+        conn.commit()
+        cursor.close()
+    return pool
+
+
+def post(pool, *entries):
+    """Inserts (flat_id, 'YYYY-MM-DD', kind, amount) ledger entries with the given dates."""
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO FlatLedger (flat_id, entry_date, kind, amount) VALUES (%s, %s, %s, %s)",
+                           [(flat_id, f"{day} 10:00:00", kind, Decimal(amount)) for flat_id, day, kind, amount in entries])
+        conn.commit()
+        cursor.close()
+
+
+def read(pool, fn, *args, **kwargs):
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        try:
+            return fn(cursor, *args, **kwargs)
+        finally:
+            conn.rollback()
+            cursor.close()
+
+
+def snapshot(pool, as_of):
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        written = ledger.take_snapshot(cursor, "sqlite", as_of)
+        conn.commit()
+        cursor.close()
+    return written
+
+
+ENTRIES = [
+    (1, "2024-01-05", ledger.CHARGE, "100.00"),
+    (1, "2024-01-20", ledger.PAYMENT, "-40.00"),
+    (1, "2024-02-03", ledger.CHARGE, "25.50"),
+    (2, "2024-01-10", ledger.OPENING, "300.00"),
+    (2, "2024-02-15", ledger.PAYMENT, "-300.00"),
+]
+
+
+def test_balances_sum_the_entries(pool):
+    post(pool, *ENTRIES)
+    assert read(pool, ledger.balances) == {1: Decimal('85.50'), 2: Decimal('0.00')}
+    assert read(pool, ledger.balances, [2]) == {2: Decimal('0.00')}
+    assert read(pool, ledger.balances, []) == {}
+
+
+def test_balances_as_of_leave_out_later_entries(pool):
+    post(pool, *ENTRIES)
+    assert read(pool, ledger.balances, as_of=datetime.date(2024, 2, 1)) == {1: Decimal('60.00'), 2: Decimal('300.00')}
+
+
+def test_snapshot_plus_later_entries_gives_the_same_balances(pool):
+    post(pool, *ENTRIES)
+    before = read(pool, ledger.balances)
+    assert snapshot(pool, datetime.date(2024, 2, 1)) == 10  # every flat, owing or not
+    assert snapshot(pool, datetime.date(2024, 2, 1)) == 0   # already taken
+    assert read(pool, ledger.latest_snapshot) == "2024-02-01"
+    after = read(pool, ledger.balances)
+    assert {flat_id: after[flat_id] for flat_id in before} == before
+    assert not any(balance for flat_id, balance in after.items() if flat_id not in before)  # snapshotted at zero
+    assert read(pool, ledger.balances, as_of=datetime.date(2024, 2, 10))[1] == Decimal('85.50')
+
+    sql, params = read(pool, ledger.balances_query)
+    rows = read(pool, lambda cursor: (cursor.execute(sql, params), cursor.fetchall())[1])
+    assert {flat_id: Decimal(str(balance)).quantize(Decimal('0.01')) for flat_id, balance in rows
+            if balance} == {1: Decimal('85.50')}
+
+
+def test_statement_has_opening_entries_and_closing(pool):
+    post(pool, *ENTRIES)
+    result = read(pool, ledger.statement, 1, datetime.date(2024, 1, 15), datetime.date(2024, 2, 15))
+    assert result['opening'] == Decimal('100.00')
+    assert [(entry['kind'], entry['amount']) for entry in result['entries']] == \
+        [(ledger.PAYMENT, Decimal('-40.00')), (ledger.CHARGE, Decimal('25.50'))]
+    assert result['closing'] == Decimal('85.50')
+
+
+def test_aging_puts_what_is_owed_against_the_newest_charges(pool):
+    today = datetime.date(2024, 6, 30)
+    day = lambda days_ago: (today - datetime.timedelta(days=days_ago)).isoformat()
+    post(pool,
+         (1, day(200), ledger.CHARGE, "50.00"),
+         (1, day(75), ledger.CHARGE, "30.00"),
+         (1, day(45), ledger.CHARGE, "20.00"),
+         (1, day(10), ledger.CHARGE, "10.00"),
+         (1, day(5), ledger.PAYMENT, "-70.00"),
+         (2, day(3), ledger.PAYMENT, "-5.00"))
+
+    rows = read(pool, ledger.aging, today=today)
+    assert rows == [{'flat_id': 1, 'balance': Decimal('40.00'),
+                     'buckets': [Decimal('10.00'), Decimal('20.00'), Decimal('10.00'), Decimal('0.00')]}]
+    assert ledger.labels() == ['0-30', '31-60', '61-90', '90+']
+
+
+def test_due_snapshot_waits_a_day_into_the_month():
+    assert ledger.due_snapshot(datetime.date(2024, 3, 1)) == datetime.date(2024, 2, 1)
+    assert ledger.due_snapshot(datetime.date(2024, 3, 2)) == datetime.date(2024, 3, 1)
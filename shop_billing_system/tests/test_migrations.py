@@ -0,0 +1,55 @@
+import migrations
+from conftest import add_products, query
+from storage import SQLiteBackend
+
+
+def migrate(backend, log=None):
+    conn = backend.connect()
+    try:
+        return migrations.migrate(conn, backend.name, log=log or (lambda message: None))
+    finally:
+        conn.close()
+
+
+def test_versions_are_numbered_in_order():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert migrations.latest_version() == versions[-1]
+
+
+def test_fresh_database_runs_every_migration_once(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "store.db"))
+    messages = []
+    assert migrate(backend, messages.append) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert len(messages) == len(migrations.MIGRATIONS)
+
+    messages.clear()
+    assert migrate(backend, messages.append) == []
+    assert messages == []
+
+
+def test_migrations_are_safe_to_rerun_on_a_database_without_version_records(backend, pool):
+    # A database from before SchemaVersion existed starts at version 0 and runs them all again
+    add_products(pool, ("S1", "Soap", 25, 10))
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE SchemaVersion")
+        conn.commit()
+        cursor.close()
+
+    assert migrate(backend) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert query(pool, "SELECT barcode, stock_quantity FROM Products") == [("S1", 10)]
+    assert query(pool, "SELECT COUNT(*) FROM Flats") == [(10,)]  # sample flats are not added twice
+
+
+def test_add_column_and_index_skip_what_exists(backend, pool):
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        for _ in range(2):
+            migrations.add_column(cursor, "sqlite", "Products", "supplier", "TEXT NULL")
+            migrations.add_index(cursor, "sqlite", "Products", "idx_products_supplier", "supplier")
+        assert migrations.column_exists(cursor, "sqlite", "Products", "supplier")
+        assert migrations.index_exists(cursor, "sqlite", "Products", "idx_products_supplier")
+        assert not migrations.column_exists(cursor, "sqlite", "Products", "colour")
+        conn.commit()
+        cursor.close()
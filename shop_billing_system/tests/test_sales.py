@@ -0,0 +1,87 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import add_products, query
+from sales import InsufficientStockError, _merge_lines, commit_sale, commit_sale_with_retry
+
+
+def sell(pool, lines, **kwargs):
+    total = sum(Decimal(str(price)) * qty for _, qty, price in lines)
+    with pool.acquire() as conn:
+        return commit_sale(conn, lines, total, Decimal('0.00'), kwargs.pop('payment_method', 'Cash'), **kwargs)
+
+
+def stock_of(pool, *ids):
+    marks = ", ".join(["%s"] * len(ids))
+    return dict(query(pool, f"SELECT product_id, stock_quantity FROM Products WHERE product_id IN ({marks})", ids))
+
+
+def test_merge_lines_sums_repeated_products_in_id_order():
+    assert _merge_lines([(3, 1, 5), (1, 2, 10), (3, 2, 5)]) == [(1, 2, 10), (3, 3, 5)]
+
+
+def test_commit_decrements_stock_and_writes_items_and_rollup(pool):
+    soap, salt = add_products(pool, ("S1", "Soap", 25, 10), ("S2", "Salt", 20, 4))
+    result = sell(pool, [(soap, 2, 25), (salt, 1, 20), (soap, 1, 25)])
+
+    assert result.stock == {soap: 7, salt: 3}
+    assert stock_of(pool, soap, salt) == {soap: 7, salt: 3}
+    assert sorted(query(pool, "SELECT product_id, quantity_sold FROM SaleItems WHERE sale_id = %s",
+                        (result.sale_id,))) == [(soap, 3), (salt, 1)]
+    assert dict(query(pool, "SELECT product_id, units FROM ProductDailySales")) == {soap: 3, salt: 1}
+    assert list(result.timings)[:2] == ['sale', 'stock']
+
+
+def test_short_line_rolls_back_the_whole_sale(pool):
+    soap, salt = add_products(pool, ("S1", "Soap", 25, 10), ("S2", "Salt", 20, 1))
+    with pytest.raises(InsufficientStockError) as raised:
+        sell(pool, [(soap, 2, 25), (salt, 3, 20)])
+
+    assert raised.value.shortages == [(salt, 3, 1)]
+    assert stock_of(pool, soap, salt) == {soap: 10, salt: 1}
+    assert query(pool, "SELECT COUNT(*) FROM Sales") == [(0,)]
+    assert query(pool, "SELECT COUNT(*) FROM ProductDailySales") == [(0,)]
+
+
+def test_selling_the_last_unit_is_allowed(pool):
+    soap, = add_products(pool, ("S1", "Soap", 25, 2))
+    assert sell(pool, [(soap, 2, 25)]).stock == {soap: 0}
+    with pytest.raises(InsufficientStockError):
+        sell(pool, [(soap, 1, 25)])
+
+
+def test_unguarded_commit_may_take_stock_negative(pool):
+    soap, = add_products(pool, ("S1", "Soap", 25, 1))
+    result = sell(pool, [(soap, 3, 25)], enforce_stock=False)
+    assert result.stock == {soap: -2}
+
+
+def test_client_ref_makes_the_commit_idempotent(pool):
+    soap, = add_products(pool, ("S1", "Soap", 25, 10))
+    first = sell(pool, [(soap, 1, 25)], client_ref="lane1-0001")
+    again = sell(pool, [(soap, 1, 25)], client_ref="lane1-0001")
+
+    assert again.sale_id == first.sale_id
+    assert again.stock == {}
+    assert 'lookup' in again.timings
+    assert stock_of(pool, soap) == {soap: 9}
+
+
+def test_credit_sale_charges_the_flat_ledger(pool):
+    soap, = add_products(pool, ("S1", "Soap", 25, 10))
+    result = sell(pool, [(soap, 2, 25)], payment_method='Credit', flat_id=1)
+    assert query(pool, "SELECT flat_id, kind, sale_id FROM FlatLedger") == [(1, 'charge', result.sale_id)]
+
+
+def test_retry_gives_up_on_stock_errors_at_once(pool):
+    soap, = add_products(pool, ("S1", "Soap", 25, 0))
+    checked = []
+
+    def is_transient(err):
+        checked.append(err)
+        return True
+
+    with pytest.raises(InsufficientStockError):
+        commit_sale_with_retry(pool.acquire, is_transient, [(soap, 1, 25)], Decimal('25'), Decimal('0'), 'Cash')
+    assert checked == []
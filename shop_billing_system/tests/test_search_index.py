@@ -0,0 +1,57 @@
+from search_index import SearchIndex
+
+
+def make_index():
+    index = SearchIndex()
+    for key, name in enumerate(["Basmati Rice 5kg", "Brown Rice 1kg", "Rice Bran Oil", "Tata Salt",
+                                "Green Tea", "Ginger Garlic Paste"], start=1):
+        index.add(key, name)
+    return index
+
+
+def test_prefix_match_ranks_first():
+    assert make_index().search("rice")[0] == 3  # "Rice Bran Oil" starts with the query
+
+
+def test_tolerates_a_typo():
+    assert make_index().search("basmti")[:1] == [1]
+
+
+def test_unrelated_text_is_not_matched():
+    assert make_index().search("detergent") == []
+
+
+def test_popularity_breaks_ties():
+    index = make_index()
+    assert index.search("rice kg")[:2] == [1, 2]
+    index.bump_popularity(2, 500)
+    assert index.search("rice kg")[:2] == [2, 1]
+
+
+def test_short_queries_match_word_prefixes_by_popularity():
+    index = make_index()
+    index.set_popularity(6, 10)
+    assert index.search("g") == [6, 5]
+    assert index.search("gr") == [5]
+
+
+def test_accept_filters_candidates_and_limit_caps_results():
+    index = make_index()
+    assert 3 not in index.search("rice", accept=lambda key: key != 3)
+    assert len(index.search("rice", limit=2)) == 2
+
+
+def test_readding_a_key_replaces_its_text():
+    index = make_index()
+    index.add(4, "Rock Salt")
+    assert index.search("tata") == []
+    assert index.search("rock") == [4]
+    assert len(index) == 6
+
+
+def test_remove_drops_the_key_from_every_posting():
+    index = make_index()
+    index.remove(5)
+    assert index.search("green tea") == []
+    assert index.search("gr") == []
+    assert 5 not in index.search("g")
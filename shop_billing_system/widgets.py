@@ -0,0 +1,462 @@
+import sys
+import tkinter as tk
+from tkinter import ttk
+
+import customtkinter as ctk
+
+
+# --- VIRTUALIZED LIST ---
+class VirtualList(ctk.CTkFrame):
+    """
+    Scrollable list of buttons that only creates widgets for the rows currently visible.
+
+    The list holds plain keys; `row_text(key)` supplies each row's label and `command(key)` is
+    called when a row is clicked. A handful of buttons is recycled while scrolling, so the cost of
+    showing or updating the list does not grow with the number of items.
+    """
+
+    def __init__(self, master, row_text, command, label_text=None, empty_text="", row_height=40, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_text = row_text
+        self.command = command
+        self.row_height = row_height
+
+        self._keys = []
+        self._positions = {}  # key -> index in self._keys
+        self._offset = 0      # pixels scrolled from the top
+        self._rows = []       # recycled buttons
+        self._row_keys = []   # key currently shown by each recycled button
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        if label_text:
+            self.label = ctk.CTkLabel(self, text=label_text)
+            self.label.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(5,0))
+
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent")
+        self.viewport.grid(row=1, column=0, sticky="nsew", padx=(5,0), pady=5)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.yview)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", pady=5)
+
+        self.empty_label = ctk.CTkLabel(self.viewport, text=empty_text, font=("Arial", 14), text_color="gray50")
+
+        self.viewport.bind("<Configure>", lambda event: self._render())
+        self._bind_wheel(self.viewport)
+
+    # --- Public API ---
+    def set_items(self, keys):
+        """Replaces the list contents, keeping the row at the top of the view in place when possible."""
+        anchor = self._top_key()
+        shift = self._offset % self.row_height
+
+        self._keys = list(keys)
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+        if anchor in self._positions:
+            self._offset = self._positions[anchor] * self.row_height + shift
+        self._row_keys = [None] * len(self._rows)  # force every visible row to redraw
+        self._render()
+
+    def refresh_items(self, keys):
+        """Redraws the given keys if they are currently visible; off-screen rows cost nothing."""
+        for i, key in enumerate(self._row_keys):
+            if key is not None and key in keys:
+                self._rows[i].configure(text=self.row_text(key))
+
+    def __len__(self):
+        return len(self._keys)
+
+    # --- Scrolling ---
+    def yview(self, *args):
+        """Scrollbar protocol: ('moveto', fraction) or ('scroll', n, 'units'|'pages')."""
+        view_height = max(self.viewport.winfo_height(), 1)
+        if args[0] == "moveto":
+            self._offset = int(float(args[1]) * self._content_height())
+        elif args[0] == "scroll":
+            step = self.row_height if args[2] == "units" else view_height
+            self._offset += int(args[1]) * step
+        self._render()
+
+    def _on_mousewheel(self, event):
+        if sys.platform.startswith("win"):
+            delta = -int(event.delta / 120) * 3
+        elif sys.platform == "darwin":
+            delta = -event.delta
+        else:
+            delta = -3 if event.num == 4 else 3
+        self.yview("scroll", delta, "units")
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel, add="+")
+        widget.bind("<Button-4>", self._on_mousewheel, add="+")
+        widget.bind("<Button-5>", self._on_mousewheel, add="+")
+
+    # --- Rendering ---
+    def _content_height(self):
+        return len(self._keys) * self.row_height
+
+    def _top_key(self):
+        index = self._offset // self.row_height
+        return self._keys[index] if 0 <= index < len(self._keys) else None
+
+    def _render(self):
+        view_height = self.viewport.winfo_height()
+        if view_height <= 1:
+            return  # not mapped yet; <Configure> will render
+
+        max_offset = max(self._content_height() - view_height, 0)
+        self._offset = min(max(self._offset, 0), max_offset)
+
+        visible = view_height // self.row_height + 2
+        while len(self._rows) < visible:
+            self._add_row()
+
+        first = self._offset // self.row_height
+        shift = self._offset % self.row_height
+        for i, button in enumerate(self._rows):
+            index = first + i
+            if i < visible and index < len(self._keys):
+                key = self._keys[index]
+                if self._row_keys[i] != key:
+                    button.configure(text=self.row_text(key))
+                    self._row_keys[i] = key
+                button.place(x=0, y=i * self.row_height - shift, relwidth=1)
+            elif self._row_keys[i] is not None:
+                button.place_forget()
+                self._row_keys[i] = None
+
+        if self._keys:
+            self.empty_label.place_forget()
+            total = self._content_height()
+            self.scrollbar.set(self._offset / total, min((self._offset + view_height) / total, 1.0))
+        else:
+            self.empty_label.place(relx=0.5, rely=0.3, anchor="center")
+            self.scrollbar.set(0.0, 1.0)
+
+    def _add_row(self):
+        i = len(self._rows)
+        button = ctk.CTkButton(self.viewport, text="", height=self.row_height - 8,
+                               command=lambda i=i: self._on_row_click(i))
+        self._bind_wheel(button)
+        self._rows.append(button)
+        self._row_keys.append(None)
+
+    def _on_row_click(self, i):
+        key = self._row_keys[i]
+        if key is not None:
+            self.command(key)
+
+
+# --- PAGED TABLE ---
+class PagedTreeview(ttk.Treeview):
+    """
+    Treeview over a table too large to load at once, sorted by the database.
+
+    `fetch(sort, descending, after, limit)` runs on a worker thread (through `db`) and returns up to
+    `limit` row dicts in (sort column, key) order following `after`, the (sort value, key) of the last
+    row shown, or from the top when it is None. The first page loads on reload() and the next one
+    whenever the view is scrolled near the end; clicking a heading sorts by that column. Items are
+    keyed by str(row[key]), so selection and focus survive refreshes.
+
+    update_rows() and remove_keys() patch single rows after an edit. A row whose sort value is
+    unchanged is rewritten in place; otherwise refresh() re-reads the rows loaded so far in one query
+    and applies only the differences (changed values, inserts, deletes, moves). show_rows() displays
+    a fixed list instead, such as search results, sorted locally.
+    """
+
+    def __init__(self, master, db, columns, fetch, key, sort, descending=False, format_row=None,
+                 page_size=200, on_error=None, **kwargs):
+        super().__init__(master, columns=[name for name, _, _ in columns], show="headings", **kwargs)
+        self.db = db
+        self.fetch = fetch
+        self.key = key
+        self.sort = sort
+        self.descending = descending
+        self.format_row = format_row or (lambda row: tuple(row[name] for name, _, _ in columns))
+        self.page_size = page_size
+        self.on_error = on_error
+
+        self._titles = {}
+        for name, title, width in columns:
+            self._titles[name] = title
+            self.heading(name, command=lambda name=name: self.sort_by(name))
+            self.column(name, width=width)
+        self._update_headings()
+
+        self._rows = {}          # iid -> row shown
+        self._values = {}        # iid -> values shown
+        self._paged = True       # False while show_rows() content is displayed
+        self._exhausted = False  # the last page has been loaded
+        self._loading = False
+        self._refresh_job = None
+        self._task_key = ("paged-tree", id(self))
+        self.configure(yscrollcommand=self._on_view_change)
+
+    # --- Public API ---
+    def reload(self):
+        """Drops the rows shown and loads the first page in the current order."""
+        self._clear()
+        self._paged = True
+        self._load_page()
+
+    def show_rows(self, rows):
+        """Shows exactly `rows`, with no paging, sorted locally by the current column."""
+        self._clear()
+        self._paged = False
+        for row in sorted(rows, key=self._sort_key, reverse=self.descending):
+            self._insert(row, "end")
+
+    def update_rows(self, rows):
+        """Patches changed rows in, re-reading the loaded range only if their order may have changed."""
+        boundary = self._boundary()
+        refresh = False
+        for row in rows:
+            iid = str(row[self.key])
+            shown = self._rows.get(iid)
+            if shown is not None and (not self._paged or shown[self.sort] == row[self.sort]):
+                self._set_values(iid, row)
+            elif self._paged and not refresh and (shown is not None or self._before(row, boundary)):
+                refresh = True
+            # Otherwise it sorts after the rows loaded so far and arrives with a later page
+        if refresh:
+            self._schedule_refresh()
+
+    def remove_keys(self, keys):
+        for key in keys:
+            iid = str(key)
+            if iid in self._rows:
+                self.delete(iid)
+                del self._rows[iid]
+                del self._values[iid]
+
+    def refresh(self):
+        """Re-reads the rows loaded so far in one query and applies only what changed."""
+        if not self._paged:
+            return
+        limit = max(self.page_size, len(self._rows))
+        self._loading = True
+        self.db.submit(self.fetch, self.sort, self.descending, None, limit, key=self._task_key, owner=self,
+                       on_done=lambda rows: self._apply_refresh(rows, limit), on_error=self._on_fetch_error)
+
+    def sort_by(self, column):
+        """Heading click: sorts by `column`, or flips the direction if it is already the sort column."""
+        if column == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = column, False
+        self._update_headings()
+        if self._paged:
+            self.reload()
+        else:
+            self.show_rows(list(self._rows.values()))
+
+    # --- Loading ---
+    def _load_page(self):
+        if self._loading or self._exhausted:
+            return
+        after = None
+        children = self.get_children()
+        if children:
+            last = self._rows[children[-1]]
+            after = (last[self.sort], last[self.key])
+        self._loading = True
+        self.db.submit(self.fetch, self.sort, self.descending, after, self.page_size, key=self._task_key,
+                       owner=self, on_done=self._append_page, on_error=self._on_fetch_error)
+
+    def _append_page(self, rows):
+        self._loading = False
+        for row in rows:
+            if str(row[self.key]) not in self._rows:  # may have moved down since an earlier page
+                self._insert(row, "end")
+        self._exhausted = len(rows) < self.page_size
+
+    def _apply_refresh(self, rows, limit):
+        self._loading = False
+        wanted = [str(row[self.key]) for row in rows]
+        self.remove_keys(set(self._rows) - set(wanted))
+        current = list(self.get_children())  # now a subset of `wanted`
+        for index, (iid, row) in enumerate(zip(wanted, rows)):
+            if iid not in self._rows:
+                self._insert(row, index)
+                current.insert(index, iid)
+                continue
+            self._set_values(iid, row)
+            if current[index] != iid:
+                self.move(iid, "", index)
+                current.remove(iid)
+                current.insert(index, iid)
+        self._exhausted = len(rows) < limit
+
+    def _on_view_change(self, first, last):
+        if self._paged and float(last) >= 0.9:
+            self._load_page()
+
+    def _on_fetch_error(self, err):
+        self._loading = False
+        if self.on_error:
+            self.on_error(err)
+
+    # --- Rows ---
+    def _insert(self, row, index):
+        iid = str(row[self.key])
+        values = self.format_row(row)
+        self.insert("", index, iid=iid, values=values)
+        self._rows[iid] = dict(row)  # a copy: cache rows change in place, and the old sort value is needed
+        self._values[iid] = values
+
+    def _set_values(self, iid, row):
+        self._rows[iid] = dict(row)
+        values = self.format_row(row)
+        if values != self._values[iid]:
+            self.item(iid, values=values)
+            self._values[iid] = values
+
+    def _sort_key(self, row):
+        # Close to the database's order: NULL text sorts as '' and case is ignored
+        value = row[self.sort]
+        if value is None:
+            value = ""
+        elif isinstance(value, str):
+            value = value.casefold()
+        return value, row[self.key]
+
+    def _boundary(self):
+        """Sort key of the last row loaded; None when every row is loaded (or none yet)."""
+        children = self.get_children()
+        if self._exhausted or not children:
+            return None
+        return self._sort_key(self._rows[children[-1]])
+
+    def _before(self, row, boundary):
+        """Whether `row` sorts before `boundary`, i.e. belongs among the rows loaded so far."""
+        if boundary is None:
+            return True
+        return self._sort_key(row) >= boundary if self.descending else self._sort_key(row) <= boundary
+
+    def _schedule_refresh(self):
+        # Several patches in a row (a sale touching many products) become one query
+        if self._refresh_job is None:
+            self._refresh_job = self.after(200, self._run_refresh)
+
+    def _run_refresh(self):
+        self._refresh_job = None
+        self.refresh()
+
+    def _clear(self):
+        self.db.cancel(self._task_key)
+        if self._refresh_job:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._loading = False
+        self._exhausted = False
+        self.delete(*self.get_children())
+        self._rows.clear()
+        self._values.clear()
+
+    def _update_headings(self):
+        for name, title in self._titles.items():
+            arrow = (" ▼" if self.descending else " ▲") if name == self.sort else ""
+            self.heading(name, text=title + arrow)
+
+
+# --- TYPE-AHEAD DROPDOWN ---
+class TypeAheadDropdown:
+    """
+    Live suggestion list shown under an entry while the user types.
+
+    `search(text)` returns the items to suggest and `item_text(item)` their labels; `on_choose(item)`
+    runs when a suggestion is clicked or picked with Up/Down + Enter (see selected()). Searches are
+    debounced so a fast typist triggers one lookup per pause rather than one per key.
+    """
+
+    def __init__(self, entry, search, item_text, on_choose, max_items=8, delay_ms=60):
+        self.entry = entry
+        self.search = search
+        self.item_text = item_text
+        self.on_choose = on_choose
+        self.max_items = max_items
+        self.delay_ms = delay_ms
+
+        self._items = []
+        self._query = None  # the text self._items were computed for
+        self._pending = None
+        self._popup = None
+        self._listbox = None
+
+        entry.bind("<KeyRelease>", self._on_key_release, add="+")
+        entry.bind("<Down>", lambda event: self._move(1), add="+")
+        entry.bind("<Up>", lambda event: self._move(-1), add="+")
+        entry.bind("<Escape>", lambda event: self.hide(), add="+")
+        entry.bind("<FocusOut>", lambda event: entry.after(150, self.hide), add="+")
+
+    def selected(self):
+        """The highlighted suggestion, or the top one if none is highlighted; None when hidden."""
+        if not self._items or not self._listbox or self.entry.get().strip() != self._query:
+            return None
+        selection = self._listbox.curselection()
+        return self._items[selection[0] if selection else 0]
+
+    def hide(self):
+        if self._pending:
+            self.entry.after_cancel(self._pending)
+            self._pending = None
+        if self._popup:
+            self._popup.withdraw()
+        self._items = []
+
+    def _on_key_release(self, event):
+        if event.keysym in ("Up", "Down", "Escape", "Return", "KP_Enter"):
+            return
+        if self._pending:
+            self.entry.after_cancel(self._pending)
+        self._pending = self.entry.after(self.delay_ms, self._update)
+
+    def _update(self):
+        self._pending = None
+        text = self.entry.get().strip()
+        self._query = text
+        self._items = self.search(text)[:self.max_items] if text else []
+        if not self._items:
+            self.hide()
+            return
+
+        self._ensure_popup()
+        self._listbox.delete(0, "end")
+        for item in self._items:
+            self._listbox.insert("end", self.item_text(item))
+        self._listbox.configure(height=len(self._items))
+
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self._popup.geometry(f"{self.entry.winfo_width()}x{self._listbox.winfo_reqheight()}+{x}+{y}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def _ensure_popup(self):
+        if self._popup:
+            return
+        self._popup = tk.Toplevel(self.entry)
+        self._popup.overrideredirect(True)
+        self._popup.withdraw()
+        self._listbox = tk.Listbox(self._popup, activestyle="none", exportselection=False,
+                                   bg="#2B2B2B", fg="#DCE4EE", selectbackground="#1F6AA5",
+                                   highlightthickness=0, borderwidth=1, font=("Arial", 12))
+        self._listbox.pack(fill="both", expand=True)
+        self._listbox.bind("<ButtonRelease-1>", self._on_click)
+
+    def _move(self, step):
+        if not self._items:
+            return
+        selection = self._listbox.curselection()
+        index = (selection[0] + step) if selection else (0 if step > 0 else len(self._items) - 1)
+        index = max(0, min(index, len(self._items) - 1))
+        self._listbox.selection_clear(0, "end")
+        self._listbox.selection_set(index)
+        self._listbox.see(index)
+
+    def _on_click(self, event):
+        index = self._listbox.nearest(event.y)
+        if 0 <= index < len(self._items):
+            item = self._items[index]
+            self.hide()
+            self.on_choose(item)
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskTimeoutError(Exception):
+    """Reported to a task's error callback when it did not finish within its timeout."""
+
+
+class Task:
+    """Handle for submitted work; cancel() drops it if it has not started and discards its result otherwise."""
+
+    __slots__ = ('key', 'on_done', 'on_error', 'owner', 'timeout', 'deadline', 'future', 'state')
+
+    def __init__(self, key, on_done, on_error, owner, timeout):
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.owner = owner
+        self.timeout = timeout
+        self.deadline = None  # set when a worker starts it; time spent queued does not count
+        self.future = None
+        self.state = 'pending'  # pending -> done | failed | cancelled | timed_out
+
+    def cancel(self):
+        if self.state == 'pending':
+            self.state = 'cancelled'
+            if self.future:
+                self.future.cancel()
+
+    @property
+    def pending(self):
+        return self.state == 'pending'
+
+
+class DbExecutor:
+    """
+    Runs blocking database work on a small thread pool so the Tk event loop never waits on MySQL.
+
+    Results come back through a queue that the Tk thread drains every few milliseconds with after(),
+    so on_done/on_error callbacks always run on the UI thread. Submitting with a `key` supersedes the
+    previous task with the same key (e.g. an older search), tasks that overrun their timeout are
+    reported as TaskTimeoutError, and callbacks are skipped when their `owner` window has closed.
+
+    Long jobs (imports, exports, analytics) are submitted with background=True and run on their own
+    threads, so however many are running they never hold up checkout confirmations or lookups.
+    """
+
+    def __init__(self, root, max_workers=3, default_timeout=15.0, poll_ms=15, on_error=None, background_workers=1):
+        self.root = root
+        self.default_timeout = default_timeout
+        self.poll_ms = poll_ms
+        self.default_error_handler = on_error
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self._background = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix="db-background")
+        self._results = queue.SimpleQueue()
+        self._pending = set()
+        self._latest = {}  # key -> Task
+        self._busy_listeners = []
+        self._busy = 0
+        self._closed = False
+        self._ui_thread = threading.current_thread()
+
+        self.root.after(self.poll_ms, self._poll)
+
+    # --- Submitting work ---
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, timeout=None, owner=None, background=False):
+        """
+        Runs fn(*args) on a worker thread; on_done(result) / on_error(exc) run on the Tk thread.
+        timeout=None uses the default; timeout=0 waits indefinitely, which writes should use so the
+        UI never reports a failure for work that may still commit. The timeout counts from when the
+        task starts. background=True queues it behind other long jobs instead of interactive work.
+        """
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous:
+                previous.cancel()
+                self._pending.discard(previous)
+
+        timeout = self.default_timeout if timeout is None else timeout
+        task = Task(key, on_done, on_error, owner, timeout)
+        if key is not None:
+            self._latest[key] = task
+        self._pending.add(task)
+        task.future = (self._background if background else self._pool).submit(self._run, task, fn, args)
+        self._update_busy()
+        return task
+
+    def cancel(self, key):
+        """Drops the latest task submitted with `key`, e.g. when its result is no longer wanted."""
+        previous = self._latest.pop(key, None)
+        if previous:
+            previous.cancel()
+            self._pending.discard(previous)
+            self._update_busy()
+
+    def call_in_ui(self, fn, *args):
+        """Schedules fn(*args) on the Tk thread. Safe to call from any thread."""
+        if threading.current_thread() is self._ui_thread:
+            fn(*args)
+        else:
+            self._results.put((None, (fn, args), None))
+
+    def add_busy_listener(self, callback):
+        """callback(pending_count) is called on the Tk thread whenever the number of running tasks changes."""
+        self._busy_listeners.append(callback)
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._background.shutdown(wait=False, cancel_futures=True)
+
+    # --- Worker side ---
+    def _run(self, task, fn, args):
+        if not task.pending:
+            return
+        if task.timeout:
+            task.deadline = time.monotonic() + task.timeout
+        try:
+            result = fn(*args)
+        except Exception as err:
+            self._results.put((task, None, err))
+        else:
+            self._results.put((task, result, None))
+
+    # --- Tk side ---
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            self._drain()
+        finally:
+            # Keep polling even if a callback raised (Tk reports the exception itself)
+            self.root.after(self.poll_ms, self._poll)
+
+    def _drain(self):
+        try:
+            while True:
+                task, result, error = self._results.get_nowait()
+                if task is None:
+                    fn, args = result
+                    fn(*args)
+                else:
+                    self._finish(task, result, error)
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        for task in [t for t in self._pending if t.deadline is not None and now > t.deadline]:
+            task.state = 'timed_out'
+            self._pending.discard(task)
+            if self._latest.get(task.key) is task:
+                del self._latest[task.key]
+            self._deliver(task, task.on_error or self.default_error_handler,
+                          TaskTimeoutError("The database did not respond in time. Please try again."))
+
+        self._update_busy()
+
+    def _finish(self, task, result, error):
+        if not task.pending:
+            return  # cancelled, superseded or already timed out
+        self._pending.discard(task)
+        if self._latest.get(task.key) is task:
+            del self._latest[task.key]
+        if error is None:
+            task.state = 'done'
+            self._deliver(task, task.on_done, result)
+        else:
+            task.state = 'failed'
+            self._deliver(task, task.on_error or self.default_error_handler, error)
+
+    def _deliver(self, task, callback, value):
+        if callback is None:
+            return
+        if task.owner is not None:
+            try:
+                if not task.owner.winfo_exists():
+                    return
+            except Exception:
+                return  # window already destroyed
+        callback(value)
+
+    def _update_busy(self):
+        busy = len(self._pending)
+        if busy != self._busy:
+            self._busy = busy
+            for callback in self._busy_listeners:
+                callback(busy)